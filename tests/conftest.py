@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+
+# The helpers import each other as top level modules, like the scripts run them
+PLUGIN_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                          "usr", "lib", "enigma2", "python", "Plugins", "Extensions", "BackupSuite")
+sys.path.insert(0, PLUGIN_DIR)
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+
+import re
+
+import boxprofile
+
+
+def test_lookuptable_box_lists_zip_backups():
+    profile = boxprofile.BoxProfile("hd51")
+    assert profile.receiver is not None
+    assert profile.extensions == ("zip", "bin", "bz2")
+    assert re.search(profile.file_pattern, "backup_hd51.zip")
+
+
+def test_kernel_location():
+    assert boxprofile.kernel_location("hd51") == ("partition", "/dev/mmcblk0p2")
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+import bz2
+import io
+import random
+
+import pytest
+
+import compressor
+
+LEVEL = 1
+CHUNK = compressor.CHUNK_BLOCKS * LEVEL * 100000
+SIZE = 3 * CHUNK + 12345
+
+
+@pytest.fixture(scope="module")
+def data():
+    # Random and compressible bytes mixed, a bit over three chunks
+    rand = random.Random(1)
+    noise = bytes(bytearray(rand.getrandbits(8) for _ in range(4096)))
+    parts = [noise[i % 64 * 64:] + b"usr/lib/enigma2/%d\n" % i for i in range(SIZE // 1000)]
+    return b"".join(parts)[:SIZE]
+
+
+def reference(data):
+    return b"".join(compressor.compressed_blocks(io.BytesIO(data), 1, LEVEL))
+
+
+class Killed(Exception):
+    pass
+
+
+class DyingInput(object):
+    """Input that stops the run after limit bytes, like a power cut."""
+
+    def __init__(self, data, limit):
+        self.infile = io.BytesIO(data)
+        self.left = limit
+
+    def read(self, size):
+        if self.left <= 0:
+            raise Killed()
+        chunk = self.infile.read(min(size, self.left))
+        self.left -= len(chunk)
+        return chunk
+
+
+def run(tmp_path, infile, jobs=1):
+    output = str(tmp_path / "rootfs.tar.bz2")
+    journal = str(tmp_path / "rootfs.journal")
+    tee = io.BytesIO()
+    reused = compressor.compress_checkpointed(infile, output, journal, tee, jobs, LEVEL)
+    with open(output, "rb") as f:
+        return reused, f.read(), tee.getvalue()
+
+
+def test_multi_stream_unpacks_to_input(data):
+    out = io.BytesIO()
+    compressor.compress_parallel(io.BytesIO(data), out, 2, LEVEL)
+    assert out.getvalue().count(b"BZh1") > 1
+    assert bz2.decompress(out.getvalue()) == data
+
+
+def test_same_archive_for_any_jobs(data):
+    assert b"".join(compressor.compressed_blocks(io.BytesIO(data), 3, LEVEL)) == reference(data)
+
+
+def test_checkpointed_run_matches_plain_run(tmp_path, data):
+    reused, archive, tee = run(tmp_path, io.BytesIO(data))
+    assert reused == 0
+    assert archive == tee == reference(data)
+    with open(str(tmp_path / "rootfs.journal")) as f:
+        lines = f.read().splitlines()
+    assert lines[0] == compressor.JOURNAL_HEADER.format(LEVEL, compressor.CHUNK_BLOCKS)
+    assert lines[-1] == "end {0}".format(len(archive))
+    assert len(lines) == 2 + 4
+
+
+def test_resume_after_killed_run(tmp_path, data):
+    with pytest.raises(Killed):
+        run(tmp_path, DyingInput(data, 2 * CHUNK + CHUNK // 2), jobs=2)
+    reused, archive, tee = run(tmp_path, io.BytesIO(data))
+    assert reused == 2
+    assert archive == tee == reference(data)
+
+
+def test_resume_after_truncated_journal(tmp_path, data):
+    run(tmp_path, io.BytesIO(data))
+    journal = tmp_path / "rootfs.journal"
+    lines = journal.read_text().splitlines(True)
+    # Stopped while the line of the last chunk was written, before the end marker
+    journal.write_text(u"".join(lines[:-2]) + lines[-2][:5])
+    reused, archive, tee = run(tmp_path, io.BytesIO(data))
+    assert reused == 3
+    assert archive == tee == reference(data)
+
+
+def test_resume_after_truncated_archive(tmp_path, data):
+    run(tmp_path, io.BytesIO(data))
+    output = tmp_path / "rootfs.tar.bz2"
+    archive = output.read_bytes()
+    output.write_bytes(archive[:len(archive) // 2])
+    reused, archive, tee = run(tmp_path, io.BytesIO(data))
+    assert 0 < reused < 4
+    assert archive == tee == reference(data)
+
+
+def test_changed_input_is_compressed_again(tmp_path, data):
+    run(tmp_path, io.BytesIO(data))
+    changed = bytearray(data)
+    changed[CHUNK + 10] ^= 0xff
+    changed = bytes(changed)
+    reused, archive, tee = run(tmp_path, io.BytesIO(changed))
+    assert reused == 1
+    assert archive == tee == reference(changed)
+    assert bz2.decompress(archive) == changed
+
+
+def test_read_journal_ignores_other_level(tmp_path):
+    journal = tmp_path / "rootfs.journal"
+    journal.write_text(u"{0}\n100 abc 50\n".format(compressor.JOURNAL_HEADER.format(9, compressor.CHUNK_BLOCKS)))
+    header = compressor.JOURNAL_HEADER.format(LEVEL, compressor.CHUNK_BLOCKS)
+    assert compressor.read_journal(str(journal), header, 1000) == []
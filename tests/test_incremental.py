@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import tarfile
+
+import incremental
+
+
+def make_root(tmp_path):
+    root = tmp_path / "root"
+    (root / "etc" / "enigma2").mkdir(parents=True)
+    (root / "etc" / "enigma2" / "settings").write_text(u"config.osd.language=de_DE\n")
+    (root / "etc" / "hostname").write_text(u"hd51\n")
+    (root / "usr").mkdir()
+    (root / "usr" / "lib.so").write_bytes(b"\x7fELF" + b"x" * 5000)
+    return root
+
+
+def diff_members(root, base):
+    current = incremental.build_manifest(str(root), reuse=base)
+    out = io.BytesIO()
+    with tarfile.open(fileobj=out, mode="w", format=tarfile.GNU_FORMAT) as tar:
+        changed, deleted = incremental.write_diff(str(root), base, current, tar)
+    out.seek(0)
+    with tarfile.open(fileobj=out) as tar:
+        names = [m.name for m in tar.getmembers() if m.name != "./" + incremental.DELETED]
+    return current, changed, deleted, names
+
+
+def test_manifest_round_trip(tmp_path):
+    root = make_root(tmp_path)
+    manifest = incremental.build_manifest(str(root))
+    manifest.base = "/media/hdd/fullbackup_hd51/20260101_1200"
+    manifest.write(str(tmp_path / incremental.MANIFEST))
+    read = incremental.Manifest.read(str(tmp_path / incremental.MANIFEST))
+    assert read.entries == manifest.entries
+    assert read.base == manifest.base
+
+
+def test_diff_leaves_out_files_rewritten_unchanged(tmp_path):
+    root = make_root(tmp_path)
+    base = incremental.build_manifest(str(root))
+    settings = str(root / "etc" / "enigma2" / "settings")
+    os.utime(settings, (2000000000, 2000000000))
+    (root / "etc" / "hostname").write_text(u"hd60\n")
+    (root / "usr" / "lib.so").unlink()
+    (root / "usr" / "new").write_text(u"new\n")
+
+    current, changed, deleted, names = diff_members(root, base)
+    assert current.same("etc/enigma2/settings", base)
+    # The removed file changed the mtime of usr
+    assert sorted(names) == ["./etc/hostname", "./usr", "./usr/new"]
+    assert (changed, deleted) == (3, 1)
+
+
+def test_same_size_new_content_is_changed(tmp_path):
+    root = make_root(tmp_path)
+    base = incremental.build_manifest(str(root))
+    hostname = str(root / "etc" / "hostname")
+    (root / "etc" / "hostname").write_text(u"hd52\n")
+    os.utime(hostname, (2000000000, 2000000000))
+    current, changed, deleted, names = diff_members(root, base)
+    assert names == ["./etc/hostname"]
+
+
+def test_restore_takes_mtime_from_the_manifest(tmp_path):
+    root = make_root(tmp_path)
+    full, diff = tmp_path / "20260101_1200", tmp_path / "20260102_1200"
+    full.mkdir()
+    diff.mkdir()
+    base = incremental.build_manifest(str(root))
+    base.write(str(full / incremental.MANIFEST))
+    with tarfile.open(str(full / incremental.FULL_ARCHIVE), "w:bz2") as tar:
+        tar.add(str(root), arcname=".")
+
+    os.utime(str(root / "etc" / "enigma2" / "settings"), (2000000000, 2000000000))
+    current = incremental.build_manifest(str(root), reuse=base)
+    current.archive, current.base = incremental.DIFF_ARCHIVE, str(full)
+    current.write(str(diff / incremental.MANIFEST))
+    with tarfile.open(str(diff / incremental.DIFF_ARCHIVE), "w:bz2", format=tarfile.GNU_FORMAT) as tar:
+        incremental.write_diff(str(root), base, current, tar)
+
+    out = io.BytesIO()
+    with tarfile.open(fileobj=out, mode="w", format=tarfile.GNU_FORMAT) as tar:
+        assert incremental.restore(str(diff), tar) == len(current.order)
+    out.seek(0)
+    with tarfile.open(fileobj=out) as tar:
+        member = tar.getmember("./etc/enigma2/settings")
+        assert member.mtime == 2000000000
+        assert tar.extractfile(member).read() == b"config.osd.language=de_DE\n"
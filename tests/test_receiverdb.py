@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import pytest
+
+import receiverdb
+
+TABLE = os.path.join(receiverdb.PLUGIN_DIR, "lookuptable.txt")
+
+
+def test_tab_separated_row():
+    line = ("Amiko Viper Combo\tvipercombo\tAmiko Viper Combo\t/vipercombo /fullbackup_vipercombo\t\t"
+            "-m 2048 -e 126976 -c 4096\t-m 2048 -p 128KiB\trootfs.bin\tkernel.bin\tnoforce")
+    assert receiverdb.parse_line(line) == receiverdb.Receiver(
+        "vipercombo", "Amiko Viper Combo", "Amiko Viper Combo", "/vipercombo", "/fullbackup_vipercombo", "",
+        "-m 2048 -e 126976 -c 4096", "-m 2048 -p 128KiB", "rootfs.bin", "kernel.bin", "noforce")
+
+
+def test_spaces_for_tabs():
+    # Model, showname and folder run together, the options start in the extr2 column
+    line = ("Vivant Dinobot H265 u41 Vivant Dinobot H265 /dinobot/u41\t/fullbackup_u41 /dinobot\t"
+            "-m 2048 -e 126976 -c 8192\t-m 2048 -p 128KiB\trootfs.ubi\tuImage\tnone")
+    receiver = receiverdb.parse_line(line)
+    assert (receiver.model, receiver.brand, receiver.showname) == ("u41", "Vivant Dinobot H265", "Vivant Dinobot H265")
+    assert (receiver.folder, receiver.extr1, receiver.extr2) == ("/dinobot/u41", "/fullbackup_u41", "/dinobot")
+    assert (receiver.mkubifs_args, receiver.ubinize_args) == ("-m 2048 -e 126976 -c 8192", "-m 2048 -p 128KiB")
+
+
+def test_showname_glued_to_folder():
+    line = "HD 51\thd51\tMutant HD51 /hd51\t/fullbackup_hd51\t\t\t\trootfs.tar.bz2\tkernel.bin\tnone"
+    receiver = receiverdb.parse_line(line)
+    assert (receiver.model, receiver.showname, receiver.folder, receiver.extr1) == (
+        "hd51", "Mutant HD51", "/hd51", "/fullbackup_hd51")
+    assert (receiver.mkubifs_args, receiver.ubinize_args) == ("", "")
+
+
+@pytest.mark.parametrize("line, problem", [
+    ("Box\tbox\tBox\t/box\t/fullbackup_box\t\t\trootfs.tar.bz2\tkernel.bin\tflash", "unknown action"),
+    ("Box\tbox\tBox\t/box\t/fullbackup_box\t\t\trootfs.img\tkernel.bin\tnone", "unknown root name"),
+    ("Box\tbox\tBox\t/box\t/fullbackup_box\t\t\trootfs.bin\tkernel.bin\tnone", "without mkfs.ubifs options"),
+    ("Box\tbox\tBox\t/box\t/box2\t\t\trootfs.tar.bz2\tkernel.bin\tnone", "unexpected folders"),
+])
+def test_bad_rows(line, problem):
+    with pytest.raises(receiverdb.ReceiverError) as error:
+        receiverdb.parse_line(line)
+    assert problem in str(error.value)
+
+
+def test_shipped_table_compiles(tmp_path):
+    database, problems = receiverdb.build([TABLE])
+    assert problems == []
+    assert database["hd51"].rootname == "rootfs.tar.bz2"
+    output = str(tmp_path / "receivers.db")
+    receiverdb.write_database(database, output)
+    assert receiverdb.read_database(output) == database
+
+
+def test_first_table_wins(tmp_path):
+    user = tmp_path / "lookuptable.txt"
+    user.write_text(u"HD 51\thd51\tMy HD51\t/hd51\t/fullbackup_hd51\t\t\trootfs.tar.bz2\tkernel.bin\tforce\n")
+    receiver = receiverdb.get_receiver("hd51", [str(user), TABLE])
+    assert (receiver.showname, receiver.action) == ("My HD51", "force")
+    assert receiverdb.get_receiver("nosuchbox", [str(user), TABLE]) is None
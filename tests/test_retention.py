@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+import retention
+
+RULES = {"keep": 0, "daily": 0, "weekly": 0, "max_bytes": 0, "make_room": False}
+MB = 1024 * 1024
+
+
+def generation(date, complete=True, size=100 * MB, base=None, series="fullbackup_hd51"):
+    g = retention.Generation(series, date)
+    g.complete = complete
+    g.bytes = size
+    g.base = (series, base) if base else None
+    return g
+
+
+def rules(**values):
+    result = dict(RULES)
+    result.update(values)
+    return result
+
+
+def removed(generations, *args, **kwargs):
+    return [(g.date, g.reason) for g in retention.plan(generations, *args, **kwargs)]
+
+
+def test_nothing_removed_by_default():
+    generations = [generation("20260101_1200"), generation("20260102_1200")]
+    assert removed(generations, RULES) == []
+
+
+def test_keep_newest():
+    generations = [generation(d) for d in ("20260101_1200", "20260102_1200", "20260103_1200")]
+    assert removed(generations, rules(keep=2)) == [("20260101_1200", "policy")]
+
+
+def test_keep_counts_per_model():
+    generations = [generation("20260101_1200", series="fullbackup_hd51"),
+                   generation("20260102_1200", series="fullbackup_vuduo4k"),
+                   generation("20260103_1200", series="fullbackup_hd51")]
+    assert removed(generations, rules(keep=1)) == [("20260101_1200", "policy")]
+
+
+def test_daily_keeps_newest_of_a_day():
+    generations = [generation(d) for d in ("20260101_0800", "20260101_2000", "20260102_0800")]
+    assert removed(generations, rules(daily=2)) == [("20260101_0800", "policy")]
+
+
+def test_incomplete_removed_once_a_newer_is_complete():
+    generations = [generation("20260101_1200", complete=False),
+                   generation("20260102_1200"),
+                   generation("20260103_1200", complete=False)]
+    # The newest one may be a backup that still runs
+    assert removed(generations, RULES) == [("20260101_1200", "incomplete")]
+
+
+def test_base_of_a_kept_diff_stays():
+    generations = [generation("20260101_1200"),
+                   generation("20260102_1200"),
+                   generation("20260103_1200", base="20260101_1200")]
+    assert removed(generations, rules(keep=1)) == [("20260102_1200", "policy")]
+
+
+def test_max_bytes_takes_oldest_and_keeps_newest_complete():
+    generations = [generation(d) for d in ("20260101_1200", "20260102_1200", "20260103_1200")]
+    assert removed(generations, rules(max_bytes=150 * MB)) == [
+        ("20260101_1200", "max_mb"), ("20260102_1200", "max_mb")]
+    generations = [generation("20260101_1200", size=500 * MB)]
+    assert removed(generations, rules(max_bytes=150 * MB)) == []
+
+
+def test_make_room_for_next_backup():
+    generations = [generation(d) for d in ("20260101_1200", "20260102_1200", "20260103_1200")]
+    assert removed(generations, RULES, free_bytes=50 * MB, needed_bytes=120 * MB) == [
+        ("20260101_1200", "make_room")]
+    assert removed(generations, RULES, free_bytes=200 * MB, needed_bytes=120 * MB) == []
+
+
+def test_scan_pairs_folder_and_zip(tmp_path):
+    folder = tmp_path / "fullbackup_hd51" / "20260101_1200"
+    (folder / "hd51").mkdir(parents=True)
+    (folder / "hd51" / "rootfs.tar.bz2").write_bytes(b"x" * 1000)
+    (folder / retention.DONE_MARKER).write_text(u"done\n")
+    (tmp_path / "fullbackup_hd51" / "20260102_1200").mkdir()
+    (tmp_path / "imagebackups").mkdir()
+    (tmp_path / "imagebackups" / "backup-OpenATV_7.4-hd51-20260101_1200.zip").write_bytes(b"z" * 500)
+
+    generations = retention.scan(str(tmp_path))
+    assert [(g.date, g.complete, g.bytes, len(g.paths)) for g in generations] == [
+        ("20260101_1200", True, 1505, 2), ("20260102_1200", False, 0, 1)]
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+import bz2
+import hashlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tarfile
+import zipfile
+
+import pytest
+
+from conftest import PLUGIN_DIR
+
+MODEL = "hd51"
+NAMES = ["hd51/kernel.bin", "hd51/rootfs.tar.bz2", "hd51/manifest.json"]
+
+
+@pytest.fixture
+def image(tmp_path):
+    root = tmp_path / "root"
+    (root / "etc").mkdir(parents=True)
+    (root / "etc" / "hostname").write_text(u"hd51\n")
+    (root / "usr").mkdir()
+    (root / "usr" / "data.bin").write_bytes(os.urandom(300000))
+    os.symlink("hostname", str(root / "etc" / "link"))
+    kernel = tmp_path / "kernel.bin"
+    kernel.write_bytes(os.urandom(70000))
+    return str(root), str(kernel)
+
+
+def export(image, command, *args):
+    root, kernel = image
+    cmd = [sys.executable, os.path.join(PLUGIN_DIR, "streamexport.py"), command,
+           "--model", MODEL, "--root", root, "--kernel", kernel] + list(args)
+    return subprocess.check_output(cmd)
+
+
+def check_members(image, members):
+    root, kernel = image
+    assert [name for name, data in members] == NAMES
+    files = dict(members)
+    with open(kernel, "rb") as f:
+        assert files[NAMES[0]] == f.read()
+    rootfs = tarfile.open(fileobj=io.BytesIO(bz2.decompress(files[NAMES[1]])))
+    assert sorted(rootfs.getnames()) == [".", "./etc", "./etc/hostname", "./etc/link", "./usr", "./usr/data.bin"]
+    manifest = json.loads(files[NAMES[2]].decode("utf-8"))
+    for name in NAMES[:2]:
+        entry = manifest["files"][name.split("/")[1]]
+        assert entry["size"] == len(files[name])
+        assert entry["sha256"] == hashlib.sha256(files[name]).hexdigest()
+
+
+def test_zip_round_trip(image):
+    archive = zipfile.ZipFile(io.BytesIO(export(image, "write")))
+    assert archive.testzip() is None
+    check_members(image, [(name, archive.read(name)) for name in archive.namelist()])
+
+
+def test_tar_round_trip(image):
+    archive = tarfile.open(fileobj=io.BytesIO(export(image, "write", "--format", "tar")))
+    check_members(image, [(m.name, archive.extractfile(m).read()) for m in archive.getmembers()])
+
+
+def test_same_archive_every_time(image):
+    assert export(image, "write") == export(image, "write")
+
+
+def test_offset(image):
+    full = export(image, "write")
+    assert export(image, "write", "--offset", "1000") == full[1000:]
+
+
+@pytest.mark.parametrize("fmt", ["zip", "tar"])
+def test_range(image, fmt):
+    full = export(image, "write", "--format", fmt)
+    size = json.loads(export(image, "size", "--format", fmt).decode("utf-8"))
+    assert size["length"] == len(full)
+
+    head, data = export(image, "http", "--format", fmt, "--range", "bytes=100-70199",
+                        "--if-range", size["etag"]).split(b"\n", 1)
+    head = json.loads(head.decode("utf-8"))
+    assert (head["status"], head["start"], head["end"], head["length"]) == (206, 100, 70199, len(full))
+    assert data == full[100:70200]
+
+    # Another image: the whole archive again
+    head, data = export(image, "http", "--format", fmt, "--range", "bytes=100-",
+                        "--if-range", '"other-zip"').split(b"\n", 1)
+    assert json.loads(head.decode("utf-8"))["status"] == 200
+    assert data == full
+
+    head, data = export(image, "http", "--format", fmt, "--range",
+                        "bytes={0}-".format(len(full))).split(b"\n", 1)
+    assert json.loads(head.decode("utf-8"))["status"] == 416
+    assert data == b""
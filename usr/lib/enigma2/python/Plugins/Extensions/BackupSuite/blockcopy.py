@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+"""
+Block copy engine for the kernel and boot partition dumps.
+
+Reads the partition in large blocks (1MB instead of the 512 bytes of a bare
+dd), optionally with O_DIRECT so the dump does not push the rest of the box
+out of the page cache, and computes the sha256 of the data on the way.
+
+Usage: blockcopy.py SRC DST [-b BLOCKSIZE] [--direct] [--digests FILE]
+With --digests a "sha256  name" line is appended to FILE (sha256sum format).
+"""
+
+from __future__ import print_function
+import argparse
+import errno
+import hashlib
+import os
+import sys
+
+try:
+    import mmap
+except ImportError:
+    mmap = None
+
+BLOCKSIZE = 1024 * 1024
+ALGORITHM = "sha256"
+
+
+def _direct_possible():
+    return hasattr(os, "O_DIRECT") and hasattr(os, "readv") and mmap is not None
+
+
+def _write_all(fd, data):
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+
+def _copy_buffered(infd, outfd, blocksize, digest):
+    size = 0
+    while True:
+        data = os.read(infd, blocksize)
+        if not data:
+            return size
+        digest.update(data)
+        _write_all(outfd, data)
+        size += len(data)
+
+
+def _copy_direct(infd, outfd, blocksize, digest):
+    """Returns None when the device refuses O_DIRECT reads."""
+    # O_DIRECT wants a page aligned buffer, an anonymous mmap is one
+    buf = mmap.mmap(-1, blocksize)
+    view = memoryview(buf)
+    size = 0
+    try:
+        while True:
+            try:
+                count = os.readv(infd, [buf])
+            except OSError as e:
+                # mtd and some filesystems refuse it on the first read
+                if e.errno == errno.EINVAL and size == 0:
+                    return None
+                raise
+            if not count:
+                return size
+            digest.update(view[:count])
+            _write_all(outfd, view[:count])
+            size += count
+    finally:
+        view.release()
+        buf.close()
+
+
+def copy_device(src, dst, blocksize=BLOCKSIZE, direct=False, algorithm=ALGORITHM):
+    """Copy src to dst, returns (bytes copied, hex digest)."""
+    digest = hashlib.new(algorithm)
+    outfd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        if direct and _direct_possible():
+            try:
+                infd = os.open(src, os.O_RDONLY | os.O_DIRECT)
+            except OSError:
+                infd = None
+            if infd is not None:
+                try:
+                    size = _copy_direct(infd, outfd, blocksize, digest)
+                finally:
+                    os.close(infd)
+                if size is not None:
+                    return size, digest.hexdigest()
+        infd = os.open(src, os.O_RDONLY)
+        try:
+            return _copy_buffered(infd, outfd, blocksize, digest), digest.hexdigest()
+        finally:
+            os.close(infd)
+    finally:
+        os.close(outfd)
+
+
+def append_digest(filename, name, hexdigest):
+    with open(filename, "a") as f:
+        f.write("{0}  {1}\n".format(hexdigest, name))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Large block partition copy with checksum")
+    parser.add_argument("source")
+    parser.add_argument("destination")
+    parser.add_argument("-b", "--blocksize", type=int, default=BLOCKSIZE)
+    parser.add_argument("--direct", action="store_true", help="bypass the page cache")
+    parser.add_argument("--digests", help="append the sha256 to this file")
+    args = parser.parse_args(argv)
+    try:
+        size, hexdigest = copy_device(args.source, args.destination, args.blocksize, args.direct)
+        if args.digests:
+            append_digest(args.digests, os.path.basename(args.destination), hexdigest)
+    except (IOError, OSError) as e:
+        print("[BackupSuite] blockcopy: {0}".format(str(e)), file=sys.stderr)
+        return 1
+    print("{0} -> {1}: {2} bytes, {3} {4}".format(args.source, args.destination, size, ALGORITHM, hexdigest))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+
+"""
+Everything the plugin needs to know about the receiver, worked out once.
+
+The box type, the files of an image of it (and the ones that don't belong
+to it), the ofgwrite force mode, the dual boot layout and the device the
+root filesystem is on. get_profile() computes them on the first call of the
+session, the screens read the result instead of asking enigma for the box
+type and scanning the model name again every time.
+
+The model rules are the tables below, the first rule matching the box type
+wins. A rule matches when every key it has matches:
+
+    "models"    the box type is one of these
+    "prefixes"  the box type starts with one of these
+    "contains"  the box type contains one of these
+
+Boxes in the lookuptable have their image file names there (see
+receiverdb.py), the rules are for the others.
+
+    boxprofile.py [BOXTYPE]
+        Print the profile of this receiver, or of BOXTYPE.
+
+    boxprofile.py --kernel BOXTYPE
+        Print "KIND DEVICE", where the kernel of BOXTYPE is (kernel_location).
+"""
+
+from __future__ import print_function
+import os
+import sys
+
+try:
+    from .receiverdb import get_receiver
+except (ImportError, ValueError, SystemError):
+    from receiverdb import get_receiver
+
+# Every file name an image folder for ofgwrite can have
+FLASH_FILES = (
+    "kernel_cfe_auto.bin", "rootfs.bin", "root_cfe_auto.jffs2", "root_cfe_auto.bin",
+    "oe_kernel.bin", "oe_rootfs.bin", "kernel_auto.bin", "kernel.bin",
+    "rootfs.tar.bz2", "uImage", "rootfs.ubi",
+)
+
+# Dreamboxes (dpkg based images), their images are made by backupdmm.sh
+DREAMBOX_FLASH_RULES = (
+    ({"contains": ("dm9",)}, ("kernel.bin", "rootfs.tar.bz2")),
+    ({"models": ("dm520", "dm7080", "dm820")}, ("*.xz",)),
+    ({}, ("*.nfi",)),
+)
+
+FLASH_RULES = (
+    ({"prefixes": ("gb",), "contains": ("4k",)}, ("kernel.bin", "rootfs.tar.bz2")),
+    ({"prefixes": ("gb",)}, ("kernel.bin", "rootfs.bin")),
+    ({"prefixes": ("vu",), "contains": ("4k",)}, ("kernel_auto.bin", "rootfs.tar.bz2")),
+    ({"models": ("vuduo2", "vusolose", "vusolo2", "vuzero")}, ("kernel_cfe_auto.bin", "root_cfe_auto.bin")),
+    ({"prefixes": ("vu",)}, ("kernel_cfe_auto.bin", "root_cfe_auto.jffs2")),
+    ({"models": ("hd51", "h7", "sf4008", "sf5008", "sf8008", "sf8008m", "vs1500", "et11000", "et13000",
+                 "bre2ze4k", "spycat4k", "spycat4kmini", "protek4k", "e4hdultra", "arivacombo",
+                 "arivatwin", "dual")}, ("kernel.bin", "rootfs.tar.bz2")),
+    ({"prefixes": ("anadol", "axashis4", "dinobot4", "ferguson4", "mediabox4", "axashisc4")},
+     ("kernel.bin", "rootfs.tar.bz2")),
+    ({"models": ("h9", "h9se", "h9combo", "h9combose", "i55plus", "i55se", "h10", "hzero", "h8",
+                 "dinobotu55", "iziboxx3", "dinoboth265", "axashistwin", "protek4kx1")}, ("uImage", "rootfs.ubi")),
+    ({"models": ("hd60", "hd61", "multibox", "multiboxse", "multiboxplus", "pulse4k", "pulse4kmini")},
+     ("uImage", "rootfs.tar.bz2")),
+    ({"prefixes": ("et4", "et5", "et6", "et7", "et8", "et9", "et10")}, ("kernel.bin", "rootfs.bin")),
+    ({"prefixes": ("ebox",)}, ("kernel_cfe_auto.bin", "root_cfe_auto.jffs2")),
+    ({"prefixes": ("fusion", "pure", "optimus", "force", "iqon", "ios", "tm2", "tmn", "tmt", "tms",
+                   "lunix", "mediabox", "vala")}, ("oe_kernel.bin", "oe_rootfs.bin")),
+    ({"contains": ("4k", "uhd")}, ("oe_kernel.bin", "rootfs.tar.bz2")),
+    ({}, ("kernel.bin", "rootfs.bin")),
+)
+
+# Extensions of the image files the restore browser shows
+PATTERN_RULES = (
+    ({"contains": ("dm9", "dm520", "dm7080", "dm820")}, ("xz",)),
+    ({"contains": ("dm",)}, ("nfi",)),
+    ({"prefixes": ("vu",), "contains": ("4k",)}, ("bin", "bz2")),
+    ({"contains": ("vu",)}, ("bin", "jffs2")),
+    ({"contains": ("hd51", "h7", "sf4008", "sf5008", "sf8008", "vs1500", "et11000", "et13000")},
+     ("bin", "bz2")),
+    ({"contains": ("h9", "i55plus", "i55se", "h10", "hzero", "h8")}, ("ubi",)),
+    ({"contains": ("hd60", "hd61", "multibox")}, ("bz2",)),
+    ({"prefixes": ("et4", "et5", "et6", "et7", "et8", "et9", "et10")}, ("bin",)),
+    ({"contains": ("ebox",)}, ("jffs2",)),
+    ({"contains": ("4k", "uhd")}, ("bz2",)),
+    ({}, ("zip", "bin", "bz2")),
+)
+
+# ofgwrite needs -f on these to write the running root
+FORCE_MODE = {"contains": ("h9", "h9se", "h9combo", "h9combose", "i55plus", "i55se", "h10", "hzero", "h8")}
+
+# Only this one has a second kernel and root partition in /proc/mtd
+DUAL_BOOT_MODELS = ("et8500",)
+
+DREAMBOX_MARKER = "/var/lib/dpkg/info"
+
+# Where the kernel of a box with a rootfs.tar.bz2 is, for backupsuite.sh and
+# streamexport.py: on one of these partitions, ...
+KERNEL_PARTITIONS = (
+    (("solo4k", "vusolo4k", "ultimo4k", "vuultimo4k", "uno4k", "vuuno4k", "uno4kse", "vuuno4kse",
+      "lunix3-4k", "lunix4k", "galaxy4k"), "/dev/mmcblk0p1"),
+    (("h7", "h17", "hd51", "vs1500", "e4hd"), "/dev/mmcblk0p2"),
+    (("osmini4k", "osmio4k", "osmio4kplus"), "/dev/mmcblk1p2"),
+    (("sf4008", "et11000"), "/dev/mmcblk0p3"),
+    (("zero4k", "vuzero4k", "gbquad4k", "gbue4k", "gbx34k"), "/dev/mmcblk0p4"),
+    (("duo4k", "vuduo4k", "duo4kse", "vuduo4kse"), "/dev/mmcblk0p6"),
+    (("sf8008", "sf8008m", "ustym4kpro", "ustym4ks2ottx", "gbtrio4k", "gbip4k", "viper4k",
+      "beyonwizv2"), "/dev/mmcblk0p12"),
+)
+# ... at /dev/kernel, linked by findkerneldevice.sh ...
+KERNEL_SCRIPT_MODELS = ("hd60", "hd61", "hd66se", "h9se", "h9combo", "h9twin", "h9combose", "h9twinse", "h10",
+                        "h11", "pulse4k", "pulse4kmini", "multibox", "multiboxse", "dual", "sx88v2")
+# ... in flash, dumped with nanddump. The others name it in the devicetree,
+# findkerneldevice.py links /dev/kernel.
+MTD_KERNEL_MODELS = ("h9", "i55plus", "i55se", "hzero", "h8", "h8.2h", "h9.s", "h9.t", "h9.2h", "h9.2s")
+
+
+def matches(rule, box_type):
+    if "models" in rule and box_type not in rule["models"]:
+        return False
+    if "prefixes" in rule and not box_type.startswith(tuple(rule["prefixes"])):
+        return False
+    if "contains" in rule and not any(part in box_type for part in rule["contains"]):
+        return False
+    return True
+
+
+def first_match(rules, box_type):
+    for rule, result in rules:
+        if matches(rule, box_type):
+            return result
+    return None
+
+
+def kernel_location(box_type):
+    """(kind, device) of the kernel of box_type, kind is mtd, partition, script or devicetree."""
+    if box_type in MTD_KERNEL_MODELS:
+        return "mtd", None
+    for models, device in KERNEL_PARTITIONS:
+        if box_type in models:
+            return "partition", device
+    if box_type in KERNEL_SCRIPT_MODELS:
+        return "script", "/dev/kernel"
+    return "devicetree", "/dev/kernel"
+
+
+def detect_box_type():
+    try:
+        from enigma import getBoxType
+        return getBoxType().lower()
+    except ImportError:
+        try:
+            from boxbranding import getBoxType
+            return getBoxType().lower()
+        except ImportError:
+            return "unknown"
+
+
+def root_device_type(cmdline):
+    """Kind of device the root filesystem is on, from the kernel command line."""
+    # Special cases before the generic ones
+    if "root=/dev/mmcblk0p1" in cmdline:
+        return "MMC_SWITCH_ERROR"
+    elif "root=/dev/mmc" in cmdline:
+        return "MMC"
+    elif "root=/dev/nand" in cmdline or "root=/dev/mtd" in cmdline:
+        return "FLASH"
+    elif "root=/dev/sd" in cmdline:
+        return "USB"
+    elif "root=/dev/hd" in cmdline:
+        return "HDD"
+    return "USB"  # Safer default
+
+
+def _read(path):
+    try:
+        with open(path, "r") as f:
+            return f.read()
+    except (IOError, OSError):
+        return ""
+
+
+class BoxProfile(object):
+    def __init__(self, box_type, dreambox=False, cmdline="", mtd=""):
+        self.box_type = box_type
+        self.dreambox = dreambox
+        self.receiver = None if "dm" in box_type else get_receiver(box_type)
+
+        if dreambox:
+            self.required_files = first_match(DREAMBOX_FLASH_RULES, box_type)
+        elif self.receiver is not None:
+            # The names backupsuite.sh gave the files
+            self.required_files = (self.receiver.kernelname, self.receiver.rootname)
+        else:
+            self.required_files = first_match(FLASH_RULES, box_type)
+        self.forbidden_files = tuple(name for name in FLASH_FILES if name not in self.required_files)
+
+        if self.receiver is not None:
+            names = (self.receiver.rootname, self.receiver.kernelname)
+            # Backups are also copied out as a zip, the restore browser must list those too
+            extensions = ["zip"] + sorted(set(name.rsplit(".", 1)[1] for name in names if "." in name) - set(["zip"]))
+        else:
+            extensions = first_match(PATTERN_RULES, box_type)
+        self.extensions = tuple(extensions)
+        self.file_pattern = r"\.({0})$".format("|".join(self.extensions))
+
+        self.force_mode = matches(FORCE_MODE, box_type)
+        self.dual_boot = box_type in DUAL_BOOT_MODELS and "rootfs2" in mtd and "kernel2" in mtd
+        self.root_device = root_device_type(cmdline)
+
+    def __repr__(self):
+        return "BoxProfile({0})".format(", ".join(
+            "{0}={1!r}".format(name, getattr(self, name)) for name in (
+                "box_type", "dreambox", "required_files", "forbidden_files", "file_pattern",
+                "force_mode", "dual_boot", "root_device")))
+
+
+_profile = None
+
+
+def get_profile():
+    """The BoxProfile of this receiver, computed on the first call."""
+    global _profile
+    if _profile is None:
+        box_type = detect_box_type()
+        _profile = BoxProfile(
+            box_type,
+            dreambox=os.path.exists(DREAMBOX_MARKER),
+            cmdline=_read("/proc/cmdline"),
+            mtd=_read("/proc/mtd") if box_type in DUAL_BOOT_MODELS else "")
+    return _profile
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) == 2 and argv[0] == "--kernel":
+        kind, device = kernel_location(argv[1].lower())
+        print(kind, device or "-")
+        return 0
+    if len(argv) > 1:
+        print("Usage: boxprofile.py [BOXTYPE] | --kernel BOXTYPE", file=sys.stderr)
+        return 2
+    if argv:
+        profile = BoxProfile(argv[0].lower(), os.path.exists(DREAMBOX_MARKER), _read("/proc/cmdline"),
+                             _read("/proc/mtd"))
+    else:
+        profile = get_profile()
+    print(repr(profile))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
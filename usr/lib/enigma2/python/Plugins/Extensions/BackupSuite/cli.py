@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+
+"""
+Backups from the command line, without enigma2.
+
+The screens are the only way to start a backup, which doesn't help with a
+cron job, an SSH session or an opkg hook. This runs the same backup scripts
+without enigma2: nothing of Components or enigma is imported, so it starts
+at once, also while enigma2 is stopped. It is run as a file, not imported
+as a part of the plugin package (whose __init__ needs enigma2):
+
+    python3 /usr/lib/enigma2/python/Plugins/Extensions/BackupSuite/cli.py targets
+
+The targets are found like the screens find them (see devices.py). The
+output on stdout is JSON, one object per line for backup and verify; the
+output of the scripts goes to stderr.
+
+    cli.py targets
+        The backup targets, {"targets": [...]}.
+
+    cli.py backup PATH [--lang LANG]
+        Back up to the target mounted at PATH. Prints {"event": "start"},
+        then {"event": "progress"} with the phase, the percent done, the
+        speed and the seconds left when the progress changes, and last
+        {"event": "result"} with the code of result.py, the image folder
+        and the metrics of the backup (see metrics.py). SIGTERM cancels the
+        backup with its cleanup.
+
+    cli.py verify FOLDER [-j JOBS]
+        Check a backup folder (see imageverify.py). Prints progress, an
+        {"event": "error"} per problem and the result.
+
+The exit status is 0 when the backup or the check succeeded.
+"""
+
+from __future__ import print_function
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+try:
+    from . import devices
+    from .metrics import descendants, read_metrics
+    from .progress import percent, read_status
+    from .result import job_result
+except (ImportError, ValueError, SystemError):
+    import devices
+    from metrics import descendants, read_metrics
+    from progress import percent, read_status
+    from result import job_result
+
+PLUGIN_DIR = os.path.dirname(os.path.abspath(__file__))
+# Mounted by a running backup, see jobmanager.py
+BIND_MOUNT = "/tmp/bi/root"
+INTERVAL = 1.0
+
+
+def emit(event, **fields):
+    fields["event"] = event
+    print(json.dumps(fields, sort_keys=True))
+    sys.stdout.flush()
+
+
+def _terminate(proc):
+    # The whole tree, the shells first so their trap runs (like jobmanager.py)
+    for pid in [proc.pid] + descendants(proc.pid):
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except OSError:
+            pass
+
+
+def run_backup(target, lang="en"):
+    """Run the backup script of target, returns the exit status."""
+    if os.path.ismount(BIND_MOUNT):
+        emit("result", code="BUSY", message="another backup is running")
+        return 1
+    if not target["script"]:
+        emit("result", code="NOT_FOUND", command=devices.SCRIPTS.get(target["type"], ""))
+        return 1
+    if not os.path.isdir(target["media"]):
+        os.makedirs(target["media"])
+    start = time.time()
+    emit("start", type=target["type"], path=target["path"], media=target["media"], time=int(start))
+    proc = subprocess.Popen(devices.backup_command(target, lang), shell=True,
+                            stdout=sys.stderr, stderr=sys.stderr)
+
+    def cancel(signum, frame):
+        _terminate(proc)
+    signal.signal(signal.SIGTERM, cancel)
+    signal.signal(signal.SIGINT, cancel)
+
+    last = None
+    while proc.poll() is None:
+        status = read_status()
+        if status and status != last:
+            last = status
+            emit("progress", phase=status.get("phase"), percent=percent(status),
+                 done=status.get("done"), expected=status.get("expected"),
+                 speed=status.get("speed"), eta=status.get("eta"))
+        time.sleep(INTERVAL)
+
+    record = job_result(proc.returncode, start)
+    metrics = read_metrics(record["folder"]) if record["folder"] else {}
+    emit("result", code=record["code"], phase=record["phase"], command=record["command"],
+         folder=record["folder"], returncode=proc.returncode,
+         seconds=int(time.time() - start), metrics=metrics)
+    return 0 if proc.returncode == 0 and record["code"] == "OK" else 1
+
+
+def run_verify(folder, jobs=0):
+    """Run imageverify.py on folder, returns its exit status."""
+    args = [sys.executable, os.path.join(PLUGIN_DIR, "imageverify.py"), folder]
+    if jobs:
+        args += ["-j", str(jobs)]
+    proc = subprocess.Popen(args, stdout=subprocess.PIPE, universal_newlines=True)
+    summary = ""
+    for line in iter(proc.stdout.readline, ""):
+        word, _, rest = line.strip().partition(" ")
+        if word == "PROGRESS":
+            emit("progress", phase="verify", percent=int(rest or 0))
+        elif word == "ERROR":
+            name, _, problem = rest.partition(": ")
+            emit("error", file=name, problem=problem)
+        elif word in ("OK", "FAIL"):
+            summary = rest
+    proc.wait()
+    emit("result", code="OK" if proc.returncode == 0 else "FAILED", folder=folder,
+         message=summary, returncode=proc.returncode)
+    return 0 if proc.returncode == 0 else 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="BackupSuite without enigma2")
+    sub = parser.add_subparsers(dest="command")
+    sub.add_parser("targets")
+    p = sub.add_parser("backup")
+    p.add_argument("path")
+    p.add_argument("--lang", default="en")
+    p = sub.add_parser("verify")
+    p.add_argument("folder")
+    p.add_argument("-j", "--jobs", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "targets":
+            print(json.dumps({"targets": devices.targets()}, sort_keys=True))
+        elif args.command == "backup":
+            target = devices.find_target(args.path)
+            if target is None:
+                emit("result", code="NO_TARGET", path=args.path)
+                return 1
+            return run_backup(target, args.lang)
+        elif args.command == "verify":
+            return run_verify(args.folder, args.jobs)
+        else:
+            parser.print_usage(sys.stderr)
+            return 2
+    except (IOError, OSError) as e:
+        print("[BackupSuite] cli: {0}".format(str(e)), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
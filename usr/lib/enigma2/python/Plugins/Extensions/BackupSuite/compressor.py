@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+
+"""
+Parallel bzip2 compressor for the rootfs archive.
+
+The input (normally the tar stream of the root filesystem) is cut in blocks
+of LEVEL * 100k bytes. Every block is compressed on its own as a complete
+bzip2 stream on a process pool, the streams are written back in order.
+The result is a standard multi-stream .bz2 file which bzip2, tar -xjf and
+ofgwrite unpack unchanged.
+
+Usage: compressor.py [-j JOBS] [-l LEVEL] [-o OUTPUT] [-c JOURNAL] [INPUT]
+Without INPUT the data is read from stdin, without OUTPUT written to stdout.
+
+With a JOURNAL the archive can be continued when a backup stopped halfway,
+the network share went away or the power failed. The input is taken in
+chunks of CHUNK_BLOCKS blocks, after every chunk the archive is synced and
+the length and sha1 of the input chunk and the end of its output in the
+archive are added to the journal:
+
+    # BackupSuite checkpoint 1 level=9 chunk=8
+    7200000 <sha1> 2345678
+    ...
+    end 123456789
+
+The next run with the same JOURNAL and OUTPUT reads the input again, the
+chunks which are the same as in the journal are not compressed a second
+time, their output is already in the archive. From the first chunk that
+differs on, the archive is cut off and written anew. As every block is a
+bzip2 stream of its own the archive is the same as that of a run that never
+stopped. The whole archive, reused or not, is copied to stdout as well, for
+imagemanifest.py and zipstore.py tee. "end" marks a finished archive.
+
+Resuming saves compression, not reading: the checkpoints are on the bytes
+of the tar stream, not on the files, so the next run tars the whole rootfs
+again. A file written in between (a log, the settings, the EPG) changes its
+chunk and shifts every chunk after it, from there on all is compressed
+again. Only the chunks in front of the first change are reused, none when
+the first chunk changed already. The archive is correct either way.
+"""
+
+from __future__ import print_function
+import argparse
+import bz2
+import hashlib
+import os
+import sys
+from collections import deque
+
+try:
+    from .governor import throttled
+except (ImportError, ValueError, SystemError):
+    from governor import throttled
+
+try:
+    from multiprocessing import Pool, cpu_count
+except ImportError:  # stripped python without multiprocessing
+    Pool = None
+
+    def cpu_count():
+        return 1
+
+
+DEFAULT_LEVEL = 9
+# bzip2 blocks per checkpoint, 7.2 MB of input at level 9
+CHUNK_BLOCKS = 8
+JOURNAL_HEADER = "# BackupSuite checkpoint 1 level={0} chunk={1}"
+
+
+def _compress_block(args):
+    data, level = args
+    return bz2.compress(data, level)
+
+
+def read_blocks(infile, blocksize):
+    """Yield blocks of exactly blocksize bytes (the last one may be shorter)."""
+    while True:
+        data = infile.read(blocksize)
+        if not data:
+            return
+        while len(data) < blocksize:
+            more = infile.read(blocksize - len(data))
+            if not more:
+                break
+            data += more
+        yield data
+
+
+def detect_jobs():
+    try:
+        return max(1, cpu_count())
+    except NotImplementedError:
+        return 1
+
+
+def compress_serial(infile, outfile, level=DEFAULT_LEVEL):
+    """Single core fallback: one plain bzip2 stream."""
+    compressor = bz2.BZ2Compressor(level)
+    for block in read_blocks(infile, level * 100000):
+        data = compressor.compress(block)
+        if data:
+            outfile.write(data)
+    outfile.write(compressor.flush())
+
+
+def compressed_blocks(infile, jobs, level=DEFAULT_LEVEL):
+    """Yield the blocks of infile compressed in order, the same bytes for any jobs."""
+    if jobs <= 1 or Pool is None:
+        for block in read_blocks(infile, level * 100000):
+            yield _compress_block((block, level))
+        return
+    pool = Pool(jobs)
+    # Keep only a couple of blocks per worker in flight, the box has no RAM
+    # to buffer the whole rootfs.
+    pending = deque()
+    try:
+        for block in read_blocks(infile, level * 100000):
+            pending.append(pool.apply_async(_compress_block, ((block, level),)))
+            if len(pending) >= jobs * 2:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+def compress_parallel(infile, outfile, jobs, level=DEFAULT_LEVEL):
+    """Compress independent blocks on a pool of jobs processes."""
+    for data in compressed_blocks(infile, jobs, level):
+        outfile.write(data)
+
+
+class _ChunkReader(object):
+    """infile for compressed_blocks, the (length, sha1) of every chunk read in digests."""
+
+    def __init__(self, infile, chunksize, head=b""):
+        self.infile = infile
+        self.chunksize = chunksize
+        self.head = head  # the first chunk, read already
+        self.digests = deque()
+        self._sha1 = hashlib.sha1()
+        self._length = 0
+
+    def read(self, size):
+        size = min(size, self.chunksize - self._length)
+        if self.head:
+            data, self.head = self.head[:size], self.head[size:]
+        else:
+            data = self.infile.read(size)
+        if data:
+            self._sha1.update(data)
+            self._length += len(data)
+            if self._length == self.chunksize:
+                self._chunk_done()
+        elif self._length:
+            self._chunk_done()
+        return data
+
+    def _chunk_done(self):
+        self.digests.append((self._length, self._sha1.hexdigest()))
+        self._sha1 = hashlib.sha1()
+        self._length = 0
+
+
+def read_journal(journal, header, size):
+    """[(length, sha1, end)] of the chunks in journal, those of an output of size bytes."""
+    chunks = []
+    try:
+        with open(journal, "r") as f:
+            if f.readline().rstrip("\n") != header:
+                return chunks
+            for line in f:
+                fields = line.split()
+                if len(fields) != 3:
+                    break
+                length, sha1, end = int(fields[0]), fields[1], int(fields[2])
+                if end > size or (chunks and end < chunks[-1][2]):
+                    break
+                chunks.append((length, sha1, end))
+    except (IOError, OSError, ValueError):
+        pass
+    return chunks
+
+
+def _sync(fileobj):
+    fileobj.flush()
+    os.fsync(fileobj.fileno())
+
+
+def _copy_range(infile, outfile, start, end):
+    infile.seek(start)
+    while start < end:
+        data = infile.read(min(1024 * 1024, end - start))
+        if not data:
+            raise IOError("archive shorter than its journal")
+        outfile.write(data)
+        start += len(data)
+
+
+def compress_checkpointed(infile, output, journal, tee, jobs=1, level=DEFAULT_LEVEL):
+    """Compress infile to the file output, continuing the archive of journal.
+
+    Returns the number of chunks reused from the last run.
+    """
+    chunksize = CHUNK_BLOCKS * level * 100000
+    header = JOURNAL_HEADER.format(level, CHUNK_BLOCKS)
+    size = os.path.getsize(output) if os.path.exists(output) else 0
+    committed = read_journal(journal, header, size)
+    kept = []
+    head = b""
+    with open(output, "r+b" if size else "wb") as out:
+        for length, sha1, end in committed:
+            data = next(read_blocks(infile, chunksize), b"")
+            if (len(data), hashlib.sha1(data).hexdigest()) != (length, sha1):
+                head = data
+                break
+            _copy_range(out, tee, kept[-1][2] if kept else 0, end)
+            kept.append((length, sha1, end))
+        offset = kept[-1][2] if kept else 0
+        out.seek(offset)
+        out.truncate()
+        _sync(out)
+        tmp = "{0}.{1}.tmp".format(journal, os.getpid())
+        with open(tmp, "w") as f:
+            f.write(header + "\n")
+            f.writelines("{0} {1} {2}\n".format(*chunk) for chunk in kept)
+        os.rename(tmp, journal)
+
+        reader = _ChunkReader(infile, chunksize, head)
+        writer = throttled(out)
+        with open(journal, "a") as log:
+            def commit():
+                _sync(out)
+                length, sha1 = reader.digests.popleft()
+                log.write("{0} {1} {2}\n".format(length, sha1, offset))
+                _sync(log)
+
+            blocks = 0
+            for data in compressed_blocks(reader, jobs, level):
+                writer.write(data)
+                tee.write(data)
+                offset += len(data)
+                blocks += 1
+                if blocks == CHUNK_BLOCKS:
+                    commit()
+                    blocks = 0
+            if blocks:
+                commit()
+            log.write("end {0}\n".format(offset))
+            _sync(log)
+    return len(kept)
+
+
+def compress(infile, outfile, jobs=None, level=DEFAULT_LEVEL):
+    if jobs is None:
+        jobs = detect_jobs()
+    if jobs <= 1 or Pool is None:
+        compress_serial(infile, outfile, level)
+    else:
+        compress_parallel(infile, outfile, jobs, level)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parallel bzip2 compressor")
+    parser.add_argument("-j", "--jobs", type=int, default=0,
+                        help="worker processes (default: number of cores)")
+    parser.add_argument("-l", "--level", type=int, default=DEFAULT_LEVEL,
+                        choices=range(1, 10), help="bzip2 block size 1-9")
+    parser.add_argument("-o", "--output", help="output file (default: stdout)")
+    parser.add_argument("-c", "--checkpoint", metavar="JOURNAL",
+                        help="continue OUTPUT by this journal, copies it to stdout")
+    parser.add_argument("input", nargs="?", help="input file (default: stdin)")
+    args = parser.parse_args(argv)
+    if args.checkpoint and not args.output:
+        parser.error("--checkpoint needs --output")
+
+    stdin = getattr(sys.stdin, "buffer", sys.stdin)
+    stdout = getattr(sys.stdout, "buffer", sys.stdout)
+    infile = open(args.input, "rb") if args.input else stdin
+    if args.checkpoint:
+        try:
+            reused = compress_checkpointed(infile, args.output, args.checkpoint, stdout,
+                                           args.jobs or detect_jobs(), args.level)
+            stdout.flush()
+        except Exception as e:
+            print("[BackupSuite] compressor: {0}".format(str(e)), file=sys.stderr)
+            return 1
+        finally:
+            if args.input:
+                infile.close()
+        if reused:
+            print("[BackupSuite] compressor: {0} chunks of the last run reused".format(reused), file=sys.stderr)
+        return 0
+    outfile = open(args.output, "wb") if args.output else stdout
+    try:
+        compress(infile, throttled(outfile), args.jobs or None, args.level)
+        outfile.flush()
+    except Exception as e:
+        print("[BackupSuite] compressor: {0}".format(str(e)), file=sys.stderr)
+        return 1
+    finally:
+        if args.input:
+            infile.close()
+        if args.output:
+            outfile.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
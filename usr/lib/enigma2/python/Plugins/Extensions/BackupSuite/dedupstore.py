@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+
+"""
+Content addressed backup store, shared by all receivers backing up to one NAS.
+
+A store is a folder on the backup media:
+
+    chunks/ab/abcdef...     zlib compressed chunk, named by the sha256 of its data
+    index                   one chunk id per line, loaded in a set for O(1) lookups
+    snapshots/BOX/DATE.json one snapshot: the rootfs tree and the image files,
+                            DATE with seconds, -1, -2 ... added when taken
+
+Files are cut in chunks of CHUNKSIZE bytes, a chunk that is already in the
+store is never written (or sent over the network) again, whichever box or
+generation it came from. The flashable image folder is rebuilt on demand,
+the FILEs are all files of the folder besides the rootfs (kernel, update
+markers, extra partitions).
+
+    dedupstore.py backup STORE BOX ROOT [FILE ...] [--folder F] [--rootname N] [--exclude P]
+    dedupstore.py list STORE [BOX]
+    dedupstore.py restore STORE SNAPSHOT DEST [--jobs N]
+"""
+
+from __future__ import print_function
+import argparse
+import fnmatch
+import hashlib
+import json
+import os
+import stat
+import sys
+import tarfile
+import time
+import zlib
+
+try:
+    from .compressor import compress
+except (ImportError, ValueError, SystemError):
+    from compressor import compress
+
+CHUNKSIZE = 1024 * 1024
+INDEX = "index"
+SNAPSHOTS = "snapshots"
+
+
+class StoreError(Exception):
+    pass
+
+
+class ChunkStore(object):
+    def __init__(self, path):
+        self.path = path
+        self.known = set()
+        self.written = 0
+        self.reused = 0
+        index = os.path.join(path, INDEX)
+        if os.path.isfile(index):
+            with open(index, "r") as f:
+                self.known.update(line.strip() for line in f if line.strip())
+
+    def chunk_path(self, chunk_id):
+        return os.path.join(self.path, "chunks", chunk_id[:2], chunk_id)
+
+    def put(self, data):
+        chunk_id = hashlib.sha256(data).hexdigest()
+        if chunk_id in self.known:
+            self.reused += 1
+            return chunk_id
+        path = self.chunk_path(chunk_id)
+        if not os.path.exists(path):
+            folder = os.path.dirname(path)
+            if not os.path.isdir(folder):
+                try:
+                    os.makedirs(folder)
+                except OSError:
+                    if not os.path.isdir(folder):  # made by another box meanwhile
+                        raise
+            tmp = "{0}.{1}.tmp".format(path, os.getpid())
+            with open(tmp, "wb") as f:
+                f.write(zlib.compress(data, 6))
+            os.rename(tmp, path)
+            self.written += 1
+        else:
+            self.reused += 1
+        # Single short lines in append mode, safe with several boxes at once
+        with open(os.path.join(self.path, INDEX), "a") as f:
+            f.write(chunk_id + "\n")
+        self.known.add(chunk_id)
+        return chunk_id
+
+    def get(self, chunk_id):
+        try:
+            with open(self.chunk_path(chunk_id), "rb") as f:
+                data = zlib.decompress(f.read())
+        except (IOError, OSError, zlib.error) as e:
+            raise StoreError("chunk {0}: {1}".format(chunk_id, str(e)))
+        if hashlib.sha256(data).hexdigest() != chunk_id:
+            raise StoreError("chunk {0} is damaged".format(chunk_id))
+        return data
+
+    def put_file(self, path):
+        """Store a file, return its chunk ids and the number of bytes read."""
+        chunks, size = [], 0
+        with open(path, "rb") as f:
+            while True:
+                data = f.read(CHUNKSIZE)
+                if not data:
+                    break
+                chunks.append(self.put(data))
+                size += len(data)
+        return chunks, size
+
+
+def _excluded(path, patterns):
+    return any(fnmatch.fnmatch("/" + path, pattern) for pattern in patterns)
+
+
+def snapshot_tree(store, root, patterns=()):
+    """Store every file below root, return the tree entries in walk order."""
+    tree = []
+    for dirpath, dirs, files in os.walk(root):
+        rel = os.path.relpath(dirpath, root)
+        rel = "" if rel == "." else rel + "/"
+        dirs[:] = sorted(d for d in dirs if not _excluded(rel + d, patterns))
+        for name in dirs + sorted(files):
+            path = rel + name
+            if _excluded(path, patterns):
+                continue
+            full = os.path.join(root, path)
+            st = os.lstat(full)
+            if stat.S_ISSOCK(st.st_mode):
+                continue
+            entry = {"path": path, "mode": st.st_mode, "uid": st.st_uid, "gid": st.st_gid,
+                     "mtime": int(st.st_mtime)}
+            if stat.S_ISREG(st.st_mode):
+                # The size actually read, the file may change while it's stored
+                entry["chunks"], entry["size"] = store.put_file(full)
+            elif stat.S_ISLNK(st.st_mode):
+                entry["link"] = os.readlink(full)
+            elif stat.S_ISCHR(st.st_mode) or stat.S_ISBLK(st.st_mode):
+                entry["rdev"] = [os.major(st.st_rdev), os.minor(st.st_rdev)]
+            tree.append(entry)
+    return tree
+
+
+def backup(storepath, box, root, files=(), folder="", rootname="rootfs.tar.bz2", patterns=()):
+    store = ChunkStore(storepath)
+    snapshot = {
+        "box": box,
+        "created": time.strftime("%Y%m%d_%H%M%S"),
+        "folder": folder,
+        "rootname": rootname,
+        "files": [],
+        "tree": snapshot_tree(store, root, patterns),
+    }
+    for path in files:
+        snapshot["files"].append({"name": os.path.basename(path), "mode": os.stat(path).st_mode & 0o7777,
+                                  "chunks": store.put_file(path)[0]})
+    folder = os.path.join(storepath, SNAPSHOTS, box)
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    target = os.path.join(folder, snapshot["created"] + ".json")
+    count = 0
+    while os.path.exists(target):  # two backups within a second
+        count += 1
+        target = os.path.join(folder, "{0}-{1}.json".format(snapshot["created"], count))
+    tmp = target + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(snapshot, f, separators=(",", ":"))
+    os.rename(tmp, target)
+    return target, store
+
+
+def list_snapshots(storepath, box=None):
+    base = os.path.join(storepath, SNAPSHOTS)
+    boxes = [box] if box else sorted(os.listdir(base)) if os.path.isdir(base) else []
+    result = []
+    for name in boxes:
+        folder = os.path.join(base, name)
+        if os.path.isdir(folder):
+            names = sorted((f[:-5] for f in os.listdir(folder) if f.endswith(".json")))
+            result.extend(os.path.join(folder, f + ".json") for f in names)
+    return result
+
+
+class _ChunkReader(object):
+    """File object over the chunks of one file, for tarfile.addfile()."""
+
+    def __init__(self, store, chunks):
+        self.store = store
+        self.chunks = list(chunks)
+        self.buf = b""
+
+    def read(self, size=-1):
+        while (size < 0 or len(self.buf) < size) and self.chunks:
+            self.buf += self.store.get(self.chunks.pop(0))
+        if size < 0:
+            size = len(self.buf)
+        data, self.buf = self.buf[:size], self.buf[size:]
+        return data
+
+
+def write_tar(store, tree, fileobj):
+    out = tarfile.open(fileobj=fileobj, mode="w|", format=tarfile.GNU_FORMAT)
+    root = tarfile.TarInfo(".")
+    root.type = tarfile.DIRTYPE
+    root.mode = 0o755
+    out.addfile(root)
+    for entry in tree:
+        info = tarfile.TarInfo("./" + entry["path"])
+        mode = entry["mode"]
+        info.mode = stat.S_IMODE(mode)
+        info.uid, info.gid, info.mtime = entry["uid"], entry["gid"], entry["mtime"]
+        data = None
+        if stat.S_ISREG(mode):
+            info.size = entry["size"]
+            data = _ChunkReader(store, entry["chunks"])
+        elif stat.S_ISDIR(mode):
+            info.type = tarfile.DIRTYPE
+        elif stat.S_ISLNK(mode):
+            info.type = tarfile.SYMTYPE
+            info.linkname = entry["link"]
+        elif stat.S_ISCHR(mode) or stat.S_ISBLK(mode):
+            info.type = tarfile.CHRTYPE if stat.S_ISCHR(mode) else tarfile.BLKTYPE
+            info.devmajor, info.devminor = entry["rdev"]
+        elif stat.S_ISFIFO(mode):
+            info.type = tarfile.FIFOTYPE
+        out.addfile(info, data)
+    out.close()
+
+
+def restore(storepath, snapshotpath, dest, jobs=None):
+    """Rebuild the flashable image folder of a snapshot below dest."""
+    store = ChunkStore(storepath)
+    with open(snapshotpath, "r") as f:
+        snapshot = json.load(f)
+    target = os.path.join(dest, snapshot.get("folder", "").strip("/"))
+    if not os.path.isdir(target):
+        os.makedirs(target)
+    for item in snapshot["files"]:
+        path = os.path.join(target, item["name"])
+        with open(path, "wb") as f:
+            for chunk_id in item["chunks"]:
+                f.write(store.get(chunk_id))
+        os.chmod(path, item["mode"])
+    # The tar is produced in a child and compressed on all cores as it comes.
+    # The pipe is closed for writing here before the compressor forks its
+    # workers, else they would keep it open and it would never end.
+    readfd, writefd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(readfd)
+        code = 0
+        try:
+            with os.fdopen(writefd, "wb") as pipe:
+                write_tar(store, snapshot["tree"], pipe)
+        except Exception as e:
+            print("[BackupSuite] dedupstore: {0}".format(str(e)), file=sys.stderr)
+            code = 1
+        os._exit(code)
+    os.close(writefd)
+    with os.fdopen(readfd, "rb") as pipe:
+        with open(os.path.join(target, snapshot["rootname"]), "wb") as out:
+            compress(pipe, out, jobs)
+    if os.waitpid(pid, 0)[1] != 0:
+        raise StoreError("rebuilding {0} failed".format(snapshot["rootname"]))
+    return target
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="BackupSuite deduplicating backup store")
+    sub = parser.add_subparsers(dest="command")
+    p = sub.add_parser("backup")
+    p.add_argument("store")
+    p.add_argument("box")
+    p.add_argument("root")
+    p.add_argument("files", nargs="*")
+    p.add_argument("--folder", default="")
+    p.add_argument("--rootname", default="rootfs.tar.bz2")
+    p.add_argument("--exclude", action="append", default=[])
+    p = sub.add_parser("list")
+    p.add_argument("store")
+    p.add_argument("box", nargs="?")
+    p = sub.add_parser("restore")
+    p.add_argument("store")
+    p.add_argument("snapshot")
+    p.add_argument("dest")
+    p.add_argument("-j", "--jobs", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "backup":
+            target, store = backup(args.store, args.box, args.root, args.files,
+                                   args.folder, args.rootname, args.exclude)
+            print("Snapshot {0}: {1} new chunks, {2} already stored".format(target, store.written, store.reused))
+        elif args.command == "list":
+            for path in list_snapshots(args.store, args.box):
+                print(path)
+        elif args.command == "restore":
+            target = restore(args.store, args.snapshot, args.dest, args.jobs or None)
+            print("Image rebuilt in {0}".format(target))
+        else:
+            parser.print_usage(sys.stderr)
+            return 2
+    except (StoreError, IOError, OSError, ValueError, KeyError) as e:
+        print("[BackupSuite] dedupstore: {0}".format(str(e)), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
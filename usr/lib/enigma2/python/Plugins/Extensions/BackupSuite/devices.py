@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+
+"""
+The backup targets of the box, without enigma2.
+
+The screens list the partitions of the Harddisk manager of enigma2 and the
+network shares of /proc/mounts. The command line (cli.py) and the web API
+(webapi.py) run without enigma2, so the same detection is done here from
+/proc/mounts and sysfs
+only: the mounted block devices below /media and /mnt, their type from the
+model and the sysfs path of the disk, and the CIFS and NFS shares.
+
+A target is a dict:
+
+    type        USB, HDD, MMC or NET, the backup script goes with it
+    path        the mount point
+    media       where the backup goes, "backup" below the share for NET
+    script      the backup script, "" when it isn't installed
+    device      the block device, the server for a share
+    fstype      the file system
+    free        bytes free, None when unknown
+    total       bytes in all, None when unknown
+
+    devices.py list
+        Print the targets, one per line.
+"""
+
+from __future__ import print_function
+import argparse
+import os
+import re
+import sys
+from os.path import exists, join, realpath
+
+PLUGIN_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS_DIR = join(PLUGIN_DIR, "scripts")
+
+MOUNTS = "/proc/mounts"
+NETWORK_FS = ("cifs", "nfs", "nfs4", "smbfs")
+# Where the removable media and the internal disks are mounted
+MEDIA_DIRS = ("/media/", "/mnt/", "/autofs/")
+
+SCRIPTS = {
+    "USB": "backupusb.sh",
+    "MMC": "backupmmc.sh",
+    "HDD": "backuphdd.sh",
+    "NET": "backupnet.sh",
+    "BA": "backupba.sh",
+}
+
+
+def script_path(device_type):
+    return join(SCRIPTS_DIR, SCRIPTS.get(device_type, SCRIPTS["USB"]))
+
+
+def read_mounts(path=MOUNTS):
+    """[(device, mount point, file system)] of path."""
+    mounts = []
+    try:
+        with open(path, "r") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) < 3:
+                    continue
+                # Blanks in the mount point are octal escapes
+                mountpoint = re.sub(r"\\([0-7]{3})", lambda m: chr(int(m.group(1), 8)), parts[1])
+                mounts.append((parts[0], mountpoint, parts[2].lower()))
+    except (IOError, OSError) as e:
+        print("[BackupSuite] Error reading {0}: {1}".format(path, str(e)), file=sys.stderr)
+    return mounts
+
+
+def space(path):
+    """(bytes free, bytes in all) of the file system at path, (None, None) when unknown."""
+    try:
+        st = os.statvfs(path)
+    except OSError:
+        return None, None
+    return st.f_bavail * st.f_frsize, st.f_blocks * st.f_frsize
+
+
+def network_shares(mounts=None):
+    """The mounted network shares, one per server."""
+    shares = []
+    processed = set()
+    for device, mountpoint, fstype in mounts or read_mounts():
+        if fstype not in NETWORK_FS:
+            continue
+        server_name = device.split("/")[-1].split(":")[0]
+        if not server_name:
+            server_name = mountpoint.split("/")[-1]
+        if server_name in processed:
+            continue
+        processed.add(server_name)
+        free, total = space(mountpoint)
+        shares.append({
+            "server": server_name,
+            "mountpoint": mountpoint,
+            "fstype": fstype,
+            "free": free,
+            "total": total,
+        })
+    return shares
+
+
+def get_device_type_from_sysfs(device_base):
+    """Determine the device type by analyzing sysfs block information."""
+    try:
+        sysfs_path = "/sys/block/{0}".format(device_base)
+        if not exists(sysfs_path):
+            return "USB"  # Assume USB if the path doesn't exist
+
+        if device_base.startswith("mmcblk"):
+            return "MMC"
+
+        if device_base.startswith("nvme"):
+            return "HDD"
+
+        device_path = realpath(join(sysfs_path, "device"))
+
+        if "ata" in device_path or "sata" in device_path:
+            return "HDD"
+
+        if "usb" in device_path.lower():
+            return "USB"
+
+        uevent_path = join(sysfs_path, "device/uevent")
+        if exists(uevent_path):
+            with open(uevent_path, "r") as f:
+                content = f.read()
+                if "DRIVER=mmc" in content:
+                    return "MMC"
+                if "DRIVER=sd" in content and "ata" in content:
+                    return "HDD"
+
+        rotational_path = join(sysfs_path, "queue/rotational")
+        if exists(rotational_path):
+            with open(rotational_path, "r") as f:
+                if f.read().strip() == "1":
+                    return "HDD"
+
+    except Exception as e:
+        print("[BackupSuite] Error checking sysfs: {0}".format(str(e)))
+
+    return "USB"  # Fallback default
+
+
+def get_device_type(device_name, description, model, mountpoint):
+    """Determine device type by combining multiple information sources."""
+    # Normalize texts for case-insensitive matching
+    desc = (description + " " + model + " " + mountpoint).lower()
+
+    # Search for specific keywords
+    if "mmc" in desc or "sd" in desc or "card" in desc or "emmc" in desc:
+        return "MMC"
+    elif "sata" in desc or "ata" in desc or "hdd" in desc or "hard disk" in desc:
+        return "HDD"
+    elif "nvme" in desc or "ssd" in desc:
+        return "HDD"
+    elif "usb" in desc or "flash" in desc or "pen" in desc:
+        return "USB"
+
+    # Analyze device name prefix
+    if device_name.startswith("mmcblk"):
+        return "MMC"
+    elif device_name.startswith("nvme"):
+        return "HDD"
+    elif device_name.startswith("sd"):
+        return "USB"
+
+    return "USB"  # Default fallback
+
+
+def disk_of(device_name):
+    """sda for sda1, mmcblk0 for mmcblk0p1."""
+    match = re.match(r"((?:mmcblk|nvme\d+n)\d+)p\d+$", device_name)
+    if match:
+        return match.group(1)
+    return device_name.rstrip("0123456789") or device_name
+
+
+def _sysfs_text(disk, name):
+    try:
+        with open("/sys/block/{0}/device/{1}".format(disk, name), "r") as f:
+            return f.read().strip()
+    except (IOError, OSError):
+        return ""
+
+
+def local_devices(mounts=None):
+    """The mounted block devices a backup can go to, the root file system excluded."""
+    devices = []
+    seen = set()
+    for device, mountpoint, fstype in mounts or read_mounts():
+        if not device.startswith("/dev/") or fstype in NETWORK_FS:
+            continue
+        if mountpoint in seen or not mountpoint.startswith(MEDIA_DIRS):
+            continue
+        seen.add(mountpoint)
+        device_name = os.path.basename(device)
+        disk = disk_of(device_name)
+        device_type = get_device_type(
+            device_name, _sysfs_text(disk, "vendor"), _sysfs_text(disk, "model"), mountpoint)
+        script = script_path(device_type)
+        free, total = space(mountpoint)
+        devices.append({
+            "type": device_type,
+            "path": mountpoint,
+            "media": mountpoint,
+            "script": script if exists(script) else "",
+            "device": device,
+            "fstype": fstype,
+            "free": free,
+            "total": total,
+        })
+    return devices
+
+
+def targets(mounts=None):
+    """The local devices and the network shares."""
+    mounts = mounts or read_mounts()
+    found = local_devices(mounts)
+    script = script_path("NET")
+    for share in network_shares(mounts):
+        found.append({
+            "type": "NET",
+            "path": share["mountpoint"],
+            "media": join(share["mountpoint"], "backup"),
+            "script": script if exists(script) else "",
+            "device": share["server"],
+            "fstype": share["fstype"],
+            "free": share["free"],
+            "total": share["total"],
+        })
+    return found
+
+
+def find_target(path, mounts=None):
+    """The target mounted at path, None when it isn't there."""
+    path = path.rstrip("/") or "/"
+    for target in targets(mounts):
+        if target["path"] == path:
+            return target
+    return None
+
+
+def backup_command(target, lang="en"):
+    """Shell command running the backup script of target."""
+    return "/bin/sh '{0}' '{1}' '{2}' '{3}'".format(target["script"], lang, target["type"], target["media"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="BackupSuite backup targets")
+    sub = parser.add_subparsers(dest="command")
+    sub.add_parser("list")
+    args = parser.parse_args(argv)
+
+    if args.command != "list":
+        parser.print_usage(sys.stderr)
+        return 2
+    for target in targets():
+        free = "?" if target["free"] is None else "{0} MB free".format(target["free"] // (1024 * 1024))
+        print("{type:4} {path} ({device}, {fstype}, {0}){1}".format(
+            free, "" if target["script"] else " no script", **target))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
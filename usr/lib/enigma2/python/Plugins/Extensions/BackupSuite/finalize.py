@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+"""
+Finalization helpers for a finished backup.
+
+The image is written once in its final folder, the other views of it (the
+EXTRA copy, the fullbackup_* date folder, the copy on the backup stick) are
+made here as cheap as the filesystem allows:
+
+    hardlink  ->  reflink (btrfs/xfs)  ->  real copy
+
+vfat and friends know neither links nor reflinks, there the files are
+copied straight away without trying.
+
+Usage: finalize.py link SRC DST
+"""
+
+from __future__ import print_function
+import errno
+import os
+import shutil
+import sys
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    from .governor import throttled
+except (ImportError, ValueError, SystemError):
+    from governor import throttled
+
+# ioctl(dest_fd, FICLONE, src_fd) shares the extents of src with dest
+FICLONE = 0x40049409
+COPY_BUFSIZE = 1024 * 1024
+# Filesystems that can neither hardlink nor reflink
+NOLINK_FILESYSTEMS = ("vfat", "msdos", "fat", "exfat", "fuseblk", "ntfs")
+
+
+def mount_fstype(path):
+    """Return the filesystem type of the mount holding path."""
+    path = os.path.realpath(path)
+    best, fstype = "", ""
+    try:
+        with open("/proc/mounts", "r") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) < 3:
+                    continue
+                mountpoint = parts[1].replace("\\040", " ")
+                if path == mountpoint or path.startswith(mountpoint.rstrip("/") + "/"):
+                    if len(mountpoint) >= len(best):
+                        best, fstype = mountpoint, parts[2]
+    except (IOError, OSError):
+        pass
+    return fstype.lower()
+
+
+def can_link(path):
+    return mount_fstype(path) not in NOLINK_FILESYSTEMS
+
+
+def reflink(src, dst):
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, "reflink not supported")
+    with open(src, "rb") as fsrc:
+        with open(dst, "wb") as fdst:
+            try:
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            except IOError as e:
+                raise OSError(e.errno, e.strerror)
+    shutil.copystat(src, dst)
+
+
+def copy_file(src, dst):
+    with open(src, "rb") as fsrc:
+        with open(dst, "wb") as fdst:
+            shutil.copyfileobj(fsrc, throttled(fdst), COPY_BUFSIZE)
+    shutil.copystat(src, dst)
+
+
+def place_file(src, dst, linkable=True):
+    """Make dst a view of src, return "link", "reflink" or "copy"."""
+    if os.path.lexists(dst):
+        os.remove(dst)
+    if linkable:
+        try:
+            os.link(src, dst)
+            return "link"
+        except OSError:
+            pass
+        try:
+            reflink(src, dst)
+            return "reflink"
+        except (OSError, IOError):
+            if os.path.lexists(dst):
+                os.remove(dst)
+    copy_file(src, dst)
+    return "copy"
+
+
+def link_tree(src, dst):
+    """Mirror the folder src into dst, returns a dict with the counts per method."""
+    counts = {"link": 0, "reflink": 0, "copy": 0}
+    linkable = can_link(src) and can_link(os.path.dirname(dst.rstrip("/")) or "/")
+    for root, dirs, files in os.walk(src):
+        target = os.path.join(dst, os.path.relpath(root, src))
+        if not os.path.isdir(target):
+            os.makedirs(target)
+        for name in files:
+            srcfile = os.path.join(root, name)
+            if os.path.islink(srcfile):
+                dstfile = os.path.join(target, name)
+                if os.path.lexists(dstfile):
+                    os.remove(dstfile)
+                os.symlink(os.readlink(srcfile), dstfile)
+                continue
+            method = place_file(srcfile, os.path.join(target, name), linkable)
+            counts[method] += 1
+    return counts
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 3 or argv[0] != "link":
+        print("Usage: finalize.py link SRC DST", file=sys.stderr)
+        return 2
+    src, dst = argv[1], argv[2]
+    try:
+        counts = link_tree(src, dst)
+    except (OSError, IOError) as e:
+        print("[BackupSuite] finalize: {0}".format(str(e)), file=sys.stderr)
+        return 1
+    print("{0} -> {1}: {2} linked, {3} reflinked, {4} copied".format(
+        src, dst, counts["link"], counts["reflink"], counts["copy"]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
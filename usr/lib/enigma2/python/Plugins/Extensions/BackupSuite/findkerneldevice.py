@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 
+from __future__ import print_function
 import os
+import sys
 import collections
 import struct
 import uuid
@@ -125,3 +127,16 @@ try:
                 os.symlink(kerneldevice, "/dev/kernel")
 except Exception:
     pass
+
+
+if __name__ == "__main__" and len(sys.argv) > 1:
+    # findkerneldevice.py OUTPUT [DIGESTS]: also dump the kernel partition
+    from blockcopy import append_digest, copy_device
+    try:
+        size, digest = copy_device("/dev/kernel", sys.argv[1], direct=True)
+        if len(sys.argv) > 2:
+            append_digest(sys.argv[2], os.path.basename(sys.argv[1]), digest)
+        print("/dev/kernel -> {0}: {1} bytes, sha256 {2}".format(sys.argv[1], size, digest))
+    except (IOError, OSError) as e:
+        print("[BackupSuite] findkerneldevice: {0}".format(str(e)), file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+
+"""
+How hard a backup may push the box while it is used.
+
+A backup ran at the priority of enigma2 itself, the compressor took the CPU
+from the decoder and tar and the copies took the disk from the recordings.
+The "sync" at the end then flushed every dirty page of the box, the ones of
+a running recording included. The settings (see settings.py) choose a
+preset, each value of it can be overridden:
+
+    governor            fast, normal or background
+    governor_nice       CPU nice level 0-19 of the backup
+    governor_ioclass    I/O class: 0 unchanged, 2 best effort, 3 idle
+    governor_bwlimit    KB per second the compressor and the copies may
+                        write, 0 is no limit
+
+The scripts apply the CPU and I/O priority to themselves at their start,
+everything they start inherits it. The compressor and the copies of
+finalize.py limit their writes with throttled(). Instead of a sync the
+scripts fsync the files of the backup only.
+
+    governor.py apply PID
+        Give process PID the priorities of the settings.
+
+    governor.py fsync PATH...
+        Write the files to the disk, a folder with everything in it.
+
+    governor.py show
+        Print the values in use.
+"""
+
+from __future__ import print_function
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+try:
+    from . import settings
+except (ImportError, ValueError, SystemError):
+    import settings
+
+PRESETS = {
+    "fast": {"nice": 0, "ioclass": 0, "bwlimit": 0},
+    "normal": {"nice": 10, "ioclass": 2, "bwlimit": 0},
+    "background": {"nice": 19, "ioclass": 3, "bwlimit": 4096},
+}
+DEFAULT_PRESET = "normal"
+
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_SHIFT = 13
+# Lowest priority in the best effort class
+IOPRIO_BE_LEVEL = 7
+
+# ioprio_set has no wrapper in libc, the syscall numbers of the receivers
+IOPRIO_SET = {
+    "arm": 314,
+    "aarch64": 30,
+    "mips": 4314,  # o32, 4315 is ioprio_get
+    "sh4": 288,
+    "x86_64": 251,
+    "i686": 289,
+}
+
+
+def limits(values=None):
+    """{"nice", "ioclass", "bwlimit"} of the settings."""
+    values = values or settings.load()
+    result = dict(PRESETS.get(values.get("governor"), PRESETS[DEFAULT_PRESET]))
+    for key in result:
+        try:
+            result[key] = int(values["governor_" + key])
+        except (KeyError, ValueError):
+            pass
+    return result
+
+
+def _ioprio_syscall():
+    machine = os.uname()[4]
+    for prefix, number in IOPRIO_SET.items():
+        if machine.startswith(prefix):
+            return number
+    return None
+
+
+def set_nice(pid, nice):
+    if hasattr(os, "setpriority"):
+        os.setpriority(os.PRIO_PROCESS, pid, nice)
+    else:
+        _command(["renice", "-n", str(nice), "-p", str(pid)])
+
+
+def set_ioclass(pid, ioclass):
+    level = IOPRIO_BE_LEVEL if ioclass == 2 else 0
+    number = _ioprio_syscall()
+    if number is not None:
+        try:
+            import ctypes
+            libc = ctypes.CDLL(None, use_errno=True)
+            value = (ioclass << IOPRIO_CLASS_SHIFT) | level
+            if libc.syscall(number, IOPRIO_WHO_PROCESS, pid, value) == 0:
+                return
+        except (ImportError, OSError, AttributeError):
+            pass
+    # Python without ctypes, or an architecture not in the table
+    _command(["ionice", "-c", str(ioclass), "-n", str(level), "-p", str(pid)])
+
+
+def _command(args):
+    with open(os.devnull, "w") as null:
+        if subprocess.call(args, stdout=null, stderr=null) != 0:
+            raise OSError("{0} failed".format(args[0]))
+
+
+def apply(pid, values=None):
+    """Set the CPU and I/O priority of pid, returns the limits used."""
+    used = limits(values)
+    if used["nice"]:
+        set_nice(pid, used["nice"])
+    if used["ioclass"]:
+        set_ioclass(pid, used["ioclass"])
+    return used
+
+
+class Throttle(object):
+    """Sleeps just enough to keep the bytes passed to consumed() at kbps."""
+
+    def __init__(self, kbps):
+        self.rate = kbps * 1024.0
+        self.start = time.time()
+        self.done = 0
+
+    def consumed(self, count):
+        self.done += count
+        ahead = self.done / self.rate - (time.time() - self.start)
+        if ahead > 0:
+            time.sleep(ahead)
+
+
+class ThrottledWriter(object):
+    def __init__(self, fileobj, throttle):
+        self.fileobj = fileobj
+        self.throttle = throttle
+
+    def write(self, data):
+        self.fileobj.write(data)
+        self.throttle.consumed(len(data))
+
+    def __getattr__(self, name):
+        return getattr(self.fileobj, name)
+
+
+def throttled(fileobj, values=None):
+    """fileobj, its writes limited to the bandwidth of the settings."""
+    bwlimit = limits(values)["bwlimit"]
+    if bwlimit <= 0:
+        return fileobj
+    return ThrottledWriter(fileobj, Throttle(bwlimit))
+
+
+def _fsync(path, flags=os.O_RDONLY):
+    fd = os.open(path, flags)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def fsync_paths(paths):
+    """fsync the files and folders of paths, returns the number done."""
+    count = 0
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path, topdown=False):
+                for name in filenames:
+                    full = os.path.join(dirpath, name)
+                    if not os.path.islink(full):
+                        _fsync(full)
+                        count += 1
+                # The names in the folder, not only the data
+                _fsync(dirpath)
+        elif os.path.isfile(path):
+            _fsync(path)
+            _fsync(os.path.dirname(os.path.abspath(path)))
+            count += 1
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="BackupSuite CPU and I/O limits")
+    sub = parser.add_subparsers(dest="command")
+    p = sub.add_parser("apply")
+    p.add_argument("pid", type=int)
+    p = sub.add_parser("fsync")
+    p.add_argument("paths", nargs="+")
+    sub.add_parser("show")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "apply":
+            used = apply(args.pid)
+            print("nice {nice}, I/O class {ioclass}, write limit {bwlimit} KB/s".format(**used))
+        elif args.command == "fsync":
+            print("{0} files written to disk".format(fsync_paths(args.paths)))
+        elif args.command == "show":
+            print("nice {nice}, I/O class {ioclass}, write limit {bwlimit} KB/s".format(**limits()))
+        else:
+            parser.print_usage(sys.stderr)
+            return 2
+    except (IOError, OSError) as e:
+        print("[BackupSuite] governor: {0}".format(str(e)), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
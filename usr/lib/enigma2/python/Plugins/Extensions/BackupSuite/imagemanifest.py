@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+"""
+manifest.json of a finished backup: size and sha256 of every image file.
+
+The digests are computed by the stages producing the files (blockcopy for
+the partition dumps, the tee below for the streams) and collected in a
+sha256sum style file in the work folder, the manifest is written from it
+without reading the image again. Only files nobody took a digest of are
+hashed when the manifest is written.
+
+Only the files that are flashed are listed. imageversion, the log and the
+marker files of the update action (noforce, reboot.update ...) are moved,
+renamed or removed after the backup, by the script or by the user, the
+manifest of the image stays valid.
+
+    imagemanifest.py tee DIGESTS NAME
+        Copy stdin to stdout, append the sha256 of the data as NAME.
+
+    imagemanifest.py write DIGESTS FOLDER [--model MODEL]
+        Write FOLDER/manifest.json.
+"""
+
+from __future__ import print_function
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+MANIFEST = "manifest.json"
+ALGORITHM = "sha256"
+BUFSIZE = 1024 * 1024
+# Files in the image folder that are not flashed
+NOT_IMAGE = frozenset((
+    "imageversion", "BackupSuite.log", "rootfs.manifest",
+    "noforce", "force", "reboot.update", "noforce.update", "force.update",
+    "nomkpart.update", "mkpart.update",
+))
+
+
+class ManifestError(Exception):
+    pass
+
+
+def read_digests(filename):
+    """Return {name: hexdigest} from a sha256sum style file, the last line for a name wins."""
+    digests = {}
+    if filename and os.path.isfile(filename):
+        with open(filename, "r") as f:
+            for line in f:
+                parts = line.rstrip("\n").split("  ", 1)
+                if len(parts) == 2:
+                    digests[parts[1].lstrip("*")] = parts[0]
+    return digests
+
+
+def file_digest(path):
+    digest = hashlib.new(ALGORITHM)
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(BUFSIZE)
+            if not data:
+                break
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def tee(infile, outfile, bufsize=BUFSIZE):
+    digest = hashlib.new(ALGORITHM)
+    size = 0
+    while True:
+        data = infile.read(bufsize)
+        if not data:
+            break
+        digest.update(data)
+        outfile.write(data)
+        size += len(data)
+    outfile.flush()
+    return size, digest.hexdigest()
+
+
+def append_digest(filename, name, hexdigest):
+    with open(filename, "a") as f:
+        f.write("{0}  {1}\n".format(hexdigest, name))
+
+
+def write_manifest(folder, digests, model=""):
+    """Write folder/manifest.json, returns the names that had to be hashed here."""
+    files = {}
+    hashed = []
+    for name in sorted(os.listdir(folder)):
+        path = os.path.join(folder, name)
+        if name == MANIFEST or name in NOT_IMAGE or not os.path.isfile(path):
+            continue
+        hexdigest = digests.get(name)
+        if hexdigest is None:
+            hexdigest = file_digest(path)
+            hashed.append(name)
+        files[name] = {"size": os.path.getsize(path), ALGORITHM: hexdigest}
+    manifest = {
+        "version": 1,
+        "model": model,
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "files": files,
+    }
+    tmp = os.path.join(folder, MANIFEST + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True, separators=(",", ": "))
+    os.rename(tmp, os.path.join(folder, MANIFEST))
+    return hashed
+
+
+def load_manifest(folder):
+    path = os.path.join(folder, MANIFEST)
+    try:
+        with open(path, "r") as f:
+            manifest = json.load(f)
+    except (IOError, OSError, ValueError) as e:
+        raise ManifestError("{0}: {1}".format(path, str(e)))
+    if not isinstance(manifest.get("files"), dict):
+        raise ManifestError("{0}: no file list".format(path))
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="BackupSuite image manifest")
+    sub = parser.add_subparsers(dest="command")
+    p = sub.add_parser("tee")
+    p.add_argument("digests")
+    p.add_argument("name")
+    p = sub.add_parser("write")
+    p.add_argument("digests")
+    p.add_argument("folder")
+    p.add_argument("--model", default="")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "tee":
+            stdin = getattr(sys.stdin, "buffer", sys.stdin)
+            stdout = getattr(sys.stdout, "buffer", sys.stdout)
+            size, hexdigest = tee(stdin, stdout)
+            append_digest(args.digests, args.name, hexdigest)
+        elif args.command == "write":
+            hashed = write_manifest(args.folder, read_digests(args.digests), args.model)
+            print("{0} written{1}".format(os.path.join(args.folder, MANIFEST),
+                                          ", hashed afterwards: " + " ".join(hashed) if hashed else ""))
+        else:
+            parser.print_usage(sys.stderr)
+            return 2
+    except (IOError, OSError) as e:
+        print("[BackupSuite] imagemanifest: {0}".format(str(e)), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
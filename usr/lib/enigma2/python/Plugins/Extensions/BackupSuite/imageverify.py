@@ -0,0 +1,414 @@
+# -*- coding: utf-8 -*-
+
+"""
+Integrity check of a backup folder before it is handed to ofgwrite.
+
+With a manifest.json (see imagemanifest.py) the size of every listed file is
+compared first, which catches truncated copies at once, then the sha256 of
+the files is computed, several files at a time.
+
+Older backups have no manifest, their files are checked for structure:
+
+    *.bz2       every bzip2 stream is decompressed (and thrown away). The
+                multi-stream archives of compressor.py are cut at the stream
+                headers and the pieces are tested in parallel.
+    *.ubi       the erase counter and volume id headers of every eraseblock,
+                magic and CRC.
+    uImage      legacy u-boot images (kernel.bin on many boxes), header and
+                data CRC.
+    others      present and not empty.
+
+Usage: imageverify.py FOLDER [-j JOBS]
+Writes "PROGRESS <percent>" lines while it runs, an "ERROR <file>: <reason>"
+line per problem found and a last "OK ..." or "FAIL ..." line. The exit
+status is 0 when the backup passed.
+"""
+
+from __future__ import print_function
+import argparse
+import bz2
+import hashlib
+import os
+import re
+import signal
+import struct
+import sys
+import time
+import zlib
+
+try:
+    from multiprocessing import Pool, Value
+except ImportError:  # stripped python without multiprocessing
+    Pool = None
+
+try:
+    from .compressor import detect_jobs
+    from .imagemanifest import MANIFEST, NOT_IMAGE, ManifestError, load_manifest
+except (ImportError, ValueError, SystemError):
+    from compressor import detect_jobs
+    from imagemanifest import MANIFEST, NOT_IMAGE, ManifestError, load_manifest
+
+BUFSIZE = 1024 * 1024
+# Small reads into the decompressor, the output of a piece is not kept
+BZ2_FEED = 64 * 1024
+# Start of a bzip2 stream: "BZh", the level and the first block magic
+BZ2_STREAM = re.compile(b"BZh[1-9]1AY&SY")
+# Pieces smaller than this are not worth a task of their own
+BZ2_PIECE = 4 * 1024 * 1024
+
+UBI_EC_MAGIC = b"UBI#"
+UBI_VID_MAGIC = b"UBI!"
+UBI_HDR_SIZE = 64
+UBI_PEB_SIZES = [1 << n for n in range(14, 22)]  # 16KiB .. 2MiB
+
+# Files of the image itself, the text files next to them are not checked
+IMAGE_EXTENSIONS = (".bin", ".bz2", ".ubi", ".xz", ".nfi", ".jffs2", ".img", ".ubifs")
+
+UIMAGE_MAGIC = 0x27051956
+UIMAGE_HDR_SIZE = 64
+
+_counter = None
+
+
+def _init_worker(counter):
+    global _counter
+    _counter = counter
+    # The parent terminates the pool, no tracebacks from the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+
+def _advance(count):
+    if _counter is not None:
+        with _counter.get_lock():
+            _counter.value += count
+
+
+def _check_sha256(path, expected):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(BUFSIZE)
+            if not data:
+                break
+            digest.update(data)
+            _advance(len(data))
+    if digest.hexdigest() != expected:
+        return "sha256 mismatch"
+    return None
+
+
+def _stream_ended(decompressor):
+    ended = getattr(decompressor, "eof", None)  # python 3.3+
+    if ended is None:
+        try:
+            decompressor.decompress(b"")
+            ended = False
+        except EOFError:
+            ended = True
+    return ended
+
+
+def _find_stream(f, start, end):
+    """Offset of the first bzip2 stream header starting in [start, end), or None."""
+    overlap = len(b"BZh91AY&SY") - 1
+    pos = start
+    f.seek(pos)
+    while pos < end:
+        data = f.read(min(BUFSIZE, end - pos) + overlap)
+        if not data:
+            return None
+        match = BZ2_STREAM.search(data)
+        if match and pos + match.start() < end:
+            return pos + match.start()
+        if len(data) <= overlap:
+            return None
+        pos += len(data) - overlap
+        f.seek(pos)
+        _advance(len(data) - overlap)
+    return None
+
+
+def _check_bz2(path, start, end):
+    """Test the bzip2 streams starting in [start, end).
+
+    The last stream is followed past end until it finishes. Returns the
+    problem (or None) and the (first, stop) offsets of the data tested, so
+    the caller can check the pieces of a file join up without gaps.
+    """
+    with open(path, "rb") as f:
+        first = _find_stream(f, start, end)
+        if first is None:
+            return None, None
+        f.seek(first)
+        pos = first
+        decompressor = bz2.BZ2Decompressor()
+        fed = False
+        streams = 0
+        while True:
+            data = f.read(BZ2_FEED)
+            if not data:
+                if fed:
+                    return "bzip2 stream {0} incomplete at offset {1}".format(streams + 1, pos), None
+                return None, (first, pos)
+            _advance(len(data))
+            while data:
+                try:
+                    decompressor.decompress(data)
+                except (IOError, OSError, ValueError, EOFError) as e:
+                    return "bzip2 data damaged after offset {0} ({1})".format(pos, str(e)), None
+                fed = True
+                unused = decompressor.unused_data
+                if unused or _stream_ended(decompressor):
+                    pos += len(data) - len(unused)
+                    streams += 1
+                    if pos >= end:
+                        return None, (first, pos)
+                    decompressor = bz2.BZ2Decompressor()
+                    fed = False
+                else:
+                    pos += len(data)
+                data = unused
+
+
+def _check_ubi(path):
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        header = f.read(UBI_HDR_SIZE)
+        if header[:4] != UBI_EC_MAGIC:
+            return "no UBI erase counter header"
+        peb = None
+        for candidate in UBI_PEB_SIZES:
+            if candidate >= size:
+                break
+            f.seek(candidate)
+            if f.read(4) == UBI_EC_MAGIC:
+                peb = candidate
+                break
+        if peb is None:
+            peb = size  # a single eraseblock
+        if size % peb:
+            return "size {0} is not a multiple of the eraseblock size {1}".format(size, peb)
+        for number in range(size // peb):
+            f.seek(number * peb)
+            header = f.read(UBI_HDR_SIZE)
+            _advance(peb)
+            if header == b"\xff" * UBI_HDR_SIZE:
+                continue  # erased block
+            if header[:4] != UBI_EC_MAGIC:
+                return "eraseblock {0}: bad erase counter header".format(number)
+            if not _ubi_crc_ok(header):
+                return "eraseblock {0}: erase counter header CRC error".format(number)
+            vid_offset = struct.unpack(">I", header[16:20])[0]
+            if not UBI_HDR_SIZE <= vid_offset <= peb - UBI_HDR_SIZE:
+                return "eraseblock {0}: bad volume header offset".format(number)
+            f.seek(number * peb + vid_offset)
+            vid = f.read(UBI_HDR_SIZE)
+            if vid == b"\xff" * UBI_HDR_SIZE:
+                continue  # not mapped to a volume
+            if vid[:4] != UBI_VID_MAGIC:
+                return "eraseblock {0}: bad volume id header".format(number)
+            if not _ubi_crc_ok(vid):
+                return "eraseblock {0}: volume id header CRC error".format(number)
+    return None
+
+
+def _ubi_crc_ok(header):
+    # UBI uses crc32 seeded with 0xffffffff and without the final inversion
+    crc = ~zlib.crc32(header[:60]) & 0xffffffff
+    return crc == struct.unpack(">I", header[60:64])[0]
+
+
+def is_uimage(path):
+    with open(path, "rb") as f:
+        magic = f.read(4)
+    return len(magic) == 4 and struct.unpack(">I", magic)[0] == UIMAGE_MAGIC
+
+
+def _check_uimage(path):
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        header = f.read(UIMAGE_HDR_SIZE)
+        if len(header) < UIMAGE_HDR_SIZE:
+            return "truncated uImage header"
+        fields = struct.unpack(">7I", header[:28])
+        expected = fields[1]
+        if zlib.crc32(header[:4] + b"\0\0\0\0" + header[8:]) & 0xffffffff != expected:
+            return "uImage header CRC error"
+        datasize, datacrc = fields[3], fields[6]
+        if UIMAGE_HDR_SIZE + datasize > size:
+            return "uImage data truncated"
+        crc, left = 0, datasize
+        while left:
+            data = f.read(min(BUFSIZE, left))
+            if not data:
+                return "uImage data truncated"
+            left -= len(data)
+            crc = zlib.crc32(data, crc)
+            _advance(len(data))
+        if crc & 0xffffffff != datacrc:
+            return "uImage data CRC error"
+    _advance(size - datasize)
+    return None
+
+
+def _run(task):
+    """Pool entry point, returns (name, problem or None, span of a bzip2 piece)."""
+    kind, path = task[0], task[1]
+    span = None
+    try:
+        if kind == "sha256":
+            problem = _check_sha256(path, task[2])
+        elif kind == "bz2":
+            problem, span = _check_bz2(path, task[2], task[3])
+        elif kind == "ubi":
+            problem = _check_ubi(path)
+        else:
+            problem = _check_uimage(path)
+    except (IOError, OSError, struct.error) as e:
+        problem = str(e)
+    return os.path.basename(path), problem, span
+
+
+def plan(folder, jobs):
+    """Return the check tasks for folder, the problems found already and the bytes to read."""
+    tasks, problems, total = [], [], 0
+    try:
+        manifest = load_manifest(folder)
+    except ManifestError:
+        manifest = None
+    if manifest is not None:
+        # Sizes first, a truncated file is reported without reading anything
+        for name, entry in sorted(manifest["files"].items()):
+            if name in NOT_IMAGE:
+                continue  # listed by older manifests, not part of the image
+            path = os.path.join(folder, name)
+            if not os.path.isfile(path):
+                problems.append((name, "missing"))
+                continue
+            size = os.path.getsize(path)
+            if size != entry.get("size"):
+                problems.append((name, "size {0}, expected {1}".format(size, entry.get("size"))))
+            elif entry.get("sha256"):
+                tasks.append(("sha256", path, entry["sha256"]))
+                total += size
+        return tasks, problems, total
+    for name in sorted(os.listdir(folder)):
+        path = os.path.join(folder, name)
+        if not os.path.isfile(path) or not (name.lower().endswith(IMAGE_EXTENSIONS) or name == "uImage"):
+            continue
+        size = os.path.getsize(path)
+        if not size:
+            problems.append((name, "empty"))
+        elif name.lower().endswith(".bz2"):
+            pieces = max(1, min(jobs * 2, size // BZ2_PIECE))
+            step = -(-size // pieces)
+            for start in range(0, size, step):
+                tasks.append(("bz2", path, start, min(start + step, size)))
+            total += size
+        elif name.lower().endswith(".ubi"):
+            tasks.append(("ubi", path))
+            total += size
+        elif is_uimage(path):
+            tasks.append(("uimage", path))
+            total += size
+    return tasks, problems, total
+
+
+def _join_pieces(tasks, results):
+    """Problems of the bzip2 files whose pieces leave gaps or stray data."""
+    problems = []
+    pieces, failed = {}, set()
+    for task, (name, problem, span) in zip(tasks, results):
+        if task[0] == "bz2":
+            pieces.setdefault(task[1], []).append((task[2], span))
+            if problem:
+                failed.add(task[1])
+    for path, spans in sorted(pieces.items()):
+        if path in failed:
+            continue  # reported already
+        expected = 0
+        for start, span in sorted(spans):
+            if span is None:
+                continue  # no stream starts in this piece
+            first, stop = span
+            if first != expected:
+                break
+            expected = max(expected, stop)
+        if expected != os.path.getsize(path):
+            problems.append((os.path.basename(path), "no bzip2 stream at offset {0}".format(expected)))
+    return problems
+
+
+def _progress(done, total, last):
+    # Bytes scanned by neighbouring pieces can be counted twice, 100 is for the end
+    percent = min(99, int(done * 100 / total)) if total else 0
+    if percent != last:
+        print("PROGRESS {0}".format(percent))
+        sys.stdout.flush()
+    return percent
+
+
+def verify(folder, jobs=None):
+    """Check folder, returns (number of files checked, [(name, problem)])."""
+    jobs = jobs or detect_jobs()
+    tasks, problems, total = plan(folder, jobs)
+    if problems or not tasks:
+        return len(set(task[1] for task in tasks)) + len(problems), problems
+    results = []
+    if Pool is None or jobs == 1:
+        last = -1
+        for number, task in enumerate(tasks):
+            results.append(_run(task))
+            last = _progress(number + 1, len(tasks), last)
+    else:
+        counter = Value("d", 0.0)
+        pool = Pool(jobs, _init_worker, (counter,))
+        try:
+            pending = pool.map_async(_run, tasks, chunksize=1)
+            last = -1
+            while not pending.ready():
+                pending.wait(0.5)
+                last = _progress(counter.value, total, last)
+            results = pending.get()
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+    for name, problem, span in results:
+        if problem and (name, problem) not in problems:
+            problems.append((name, problem))
+    problems.extend(_join_pieces(tasks, results))
+    return len(set(task[1] for task in tasks)), problems
+
+
+def _terminate(signum, frame):
+    sys.exit(1)  # runs the finally of verify(), which stops the pool
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verify a backup before flashing it")
+    parser.add_argument("folder")
+    parser.add_argument("-j", "--jobs", type=int, default=0)
+    args = parser.parse_args(argv)
+    signal.signal(signal.SIGTERM, _terminate)
+    began = time.time()
+    try:
+        checked, problems = verify(args.folder, args.jobs or None)
+    except (IOError, OSError) as e:
+        print("[BackupSuite] imageverify: {0}".format(str(e)), file=sys.stderr)
+        print("FAIL {0}".format(str(e)))
+        return 1
+    for name, problem in problems:
+        print("ERROR {0}: {1}".format(name, problem))
+    mode = "manifest" if os.path.isfile(os.path.join(args.folder, MANIFEST)) else "structure"
+    if problems:
+        print("FAIL {0} problem(s) in {1}".format(len(problems), args.folder))
+        return 1
+    print("PROGRESS 100")
+    print("OK {0} files checked ({1}) in {2:.1f}s".format(checked, mode, time.time() - began))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
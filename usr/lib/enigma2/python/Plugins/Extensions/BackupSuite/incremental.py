@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+
+"""
+Manifests and differential rootfs backups.
+
+A rootfs backup made in a backup mode (BACKUPSUITE_MODE, see backupsuite.sh)
+or next to the store gets a rootfs.manifest next to its archive, one line per
+entry of the root filesystem:
+
+    path <TAB> size <TAB> mtime_ns <TAB> mode <TAB> crc32
+
+The header lines (starting with "#") name the archive that goes with the
+manifest and, for a differential backup, the folder of its base backup.
+
+    incremental.py manifest ROOT OUT [--reuse OLD] [--exclude PATTERN]
+        Write the manifest of ROOT. Entries with the same size and mtime as
+        in OLD keep their checksum, only new and changed files are read.
+
+    incremental.py diff ROOT BASE OUT [--exclude PATTERN]
+        Write a tar stream on stdout holding the entries changed or added
+        since the manifest BASE, plus the list of deleted paths in
+        .backupsuite-deleted. The manifest of ROOT is written to OUT. A
+        file with a new mtime but the same size, mode and checksum, one
+        rewritten with the same content, is left out.
+
+    incremental.py restore FOLDER
+        Follow the chain of bases of the backup in FOLDER back to the full
+        backup and write the complete rootfs tar stream on stdout, ready to
+        be compressed into a flashable rootfs.tar.bz2.
+"""
+
+from __future__ import print_function
+import argparse
+import fnmatch
+import os
+import stat
+import sys
+import tarfile
+import time
+import zlib
+
+MANIFEST = "rootfs.manifest"
+FULL_ARCHIVE = "rootfs.tar.bz2"
+DIFF_ARCHIVE = "rootfs.diff.tar.bz2"
+DELETED = ".backupsuite-deleted"
+HEADER = "# backupsuite-manifest 1"
+BUFSIZE = 1024 * 1024
+
+
+class ManifestError(Exception):
+    pass
+
+
+def _escape(path):
+    return path.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+
+
+def _unescape(path):
+    out, i = [], 0
+    while i < len(path):
+        c = path[i]
+        if c == "\\" and i + 1 < len(path):
+            i += 1
+            c = {"t": "\t", "n": "\n"}.get(path[i], path[i])
+        out.append(c)
+        i += 1
+    return "".join(out)
+
+
+def _mtime_ns(st):
+    mtime = getattr(st, "st_mtime_ns", None)
+    if mtime is None:
+        mtime = int(st.st_mtime * 1000000000)
+    return mtime
+
+
+def file_crc(path):
+    crc = 0
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(BUFSIZE)
+            if not data:
+                break
+            crc = zlib.crc32(data, crc)
+    return "{0:08x}".format(crc & 0xffffffff)
+
+
+class Manifest(object):
+    """Entries of a rootfs, keyed by the path relative to its root."""
+
+    def __init__(self, archive=FULL_ARCHIVE, base=None):
+        self.archive = archive
+        self.base = base
+        self.entries = {}
+        self.order = []
+
+    def add(self, path, size, mtime, mode, crc):
+        if path not in self.entries:
+            self.order.append(path)
+        self.entries[path] = (size, mtime, mode, crc)
+
+    def same(self, path, other):
+        """True when path has the same size, mode and mtime or checksum in both manifests."""
+        mine, theirs = self.entries.get(path), other.entries.get(path)
+        if mine is None or theirs is None:
+            return False
+        if mine[:3] == theirs[:3]:
+            return True
+        # Directories have no checksum, their mtime counts
+        return mine[0] == theirs[0] and mine[2] == theirs[2] and mine[3] != "-" and mine[3] == theirs[3]
+
+    def write(self, filename):
+        tmp = filename + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(HEADER + "\n")
+            f.write("# archive {0}\n".format(self.archive))
+            if self.base:
+                f.write("# base {0}\n".format(self.base))
+            f.write("# created {0}\n".format(time.strftime("%Y-%m-%d %H:%M:%S")))
+            for path in self.order:
+                size, mtime, mode, crc = self.entries[path]
+                f.write("{0}\t{1}\t{2}\t{3:o}\t{4}\n".format(_escape(path), size, mtime, mode, crc))
+        os.rename(tmp, filename)
+
+    @classmethod
+    def read(cls, filename):
+        manifest = cls()
+        with open(filename, "r") as f:
+            first = f.readline().rstrip("\n")
+            if first != HEADER:
+                raise ManifestError("{0} is not a backup manifest".format(filename))
+            for line in f:
+                line = line.rstrip("\n")
+                if line.startswith("# "):
+                    key, _sep, value = line[2:].partition(" ")
+                    if key == "archive":
+                        manifest.archive = value
+                    elif key == "base":
+                        manifest.base = value
+                    continue
+                fields = line.split("\t")
+                if len(fields) != 5:
+                    raise ManifestError("{0}: bad line {1!r}".format(filename, line))
+                manifest.add(_unescape(fields[0]), int(fields[1]), int(fields[2]), int(fields[3], 8), fields[4])
+        return manifest
+
+
+def excluded(path, patterns):
+    path = "/" + path
+    for pattern in patterns:
+        if fnmatch.fnmatch(path, pattern):
+            return True
+    return False
+
+
+def walk(root, patterns=()):
+    """Yield (path, stat) for every entry below root, directories first."""
+    for dirpath, dirs, files in os.walk(root):
+        rel = os.path.relpath(dirpath, root)
+        rel = "" if rel == "." else rel + "/"
+        dirs.sort()
+        for name in list(dirs):
+            path = rel + name
+            if excluded(path, patterns):
+                dirs.remove(name)
+                continue
+            st = os.lstat(os.path.join(root, path))
+            if stat.S_ISLNK(st.st_mode):
+                # os.walk does not descend into it, it's an entry like a file
+                dirs.remove(name)
+            yield path, st
+        for name in sorted(files):
+            path = rel + name
+            if not excluded(path, patterns):
+                yield path, os.lstat(os.path.join(root, path))
+
+
+def build_manifest(root, patterns=(), reuse=None):
+    manifest = Manifest()
+    for path, st in walk(root, patterns):
+        mode = st.st_mode
+        if stat.S_ISSOCK(mode):
+            continue  # tar does not store sockets either
+        size = st.st_size if stat.S_ISREG(mode) else 0
+        mtime = _mtime_ns(st)
+        crc = "-"
+        if stat.S_ISREG(mode):
+            old = reuse.entries.get(path) if reuse else None
+            if old is not None and old[:3] == (size, mtime, mode):
+                crc = old[3]
+            else:
+                crc = file_crc(os.path.join(root, path))
+        elif stat.S_ISLNK(mode):
+            target = os.readlink(os.path.join(root, path))
+            crc = "{0:08x}".format(zlib.crc32(target.encode("utf-8", "surrogateescape")
+                                              if sys.version_info[0] >= 3 else target) & 0xffffffff)
+        manifest.add(path, size, mtime, mode, crc)
+    return manifest
+
+
+def _open_output():
+    return tarfile.open(fileobj=getattr(sys.stdout, "buffer", sys.stdout), mode="w|", format=tarfile.GNU_FORMAT)
+
+
+def _member_path(name):
+    if name.startswith("./"):
+        name = name[2:]
+    return name.rstrip("/")
+
+
+def write_diff(root, base, current, out):
+    """Add the changed and new entries of current to the tar out, returns (changed, deleted)."""
+    changed = [path for path in current.order if not current.same(path, base)]
+    for path in changed:
+        out.add(os.path.join(root, path), arcname="./" + path, recursive=False)
+    deleted = [path for path in base.order if path not in current.entries]
+    data = "".join(_escape(path) + "\n" for path in deleted).encode("utf-8")
+    info = tarfile.TarInfo("./" + DELETED)
+    info.size = len(data)
+    info.mtime = int(time.time())
+    info.mode = 0o644
+    out.addfile(info, _BytesReader(data))
+    return len(changed), len(deleted)
+
+
+class _BytesReader(object):
+    def __init__(self, data):
+        self.data, self.pos = data, 0
+
+    def read(self, size=-1):
+        if size < 0:
+            size = len(self.data) - self.pos
+        chunk = self.data[self.pos:self.pos + size]
+        self.pos += len(chunk)
+        return chunk
+
+
+def backup_chain(folder):
+    """Return [(folder, manifest)] from the full backup up to folder."""
+    chain, seen = [], set()
+    while folder:
+        folder = os.path.realpath(folder)
+        if folder in seen:
+            raise ManifestError("loop in the chain of bases at {0}".format(folder))
+        seen.add(folder)
+        manifest = Manifest.read(os.path.join(folder, MANIFEST))
+        chain.insert(0, (folder, manifest))
+        folder = manifest.base
+    if chain[0][1].archive != FULL_ARCHIVE:
+        raise ManifestError("{0} is not a full backup".format(chain[0][0]))
+    return chain
+
+
+def restore(folder, out):
+    """Merge a full backup and its differentials into the tar out."""
+    chain = backup_chain(folder)
+    wanted = chain[-1][1].entries
+    done = set()
+    # Newest archive first, the first copy of an entry found is the current one
+    for backup, manifest in reversed(chain):
+        archive = tarfile.open(os.path.join(backup, manifest.archive), mode="r|*")
+        try:
+            for member in archive:
+                path = _member_path(member.name)
+                if path == DELETED or path in done:
+                    continue
+                if path and path not in wanted:
+                    continue  # deleted later on, or excluded
+                done.add(path)
+                if member.isreg():
+                    # Left out of a later diff when only its mtime changed
+                    member.mtime = wanted[path][1] // 1000000000
+                    out.addfile(member, archive.extractfile(member))
+                else:
+                    out.addfile(member)
+        finally:
+            archive.close()
+    missing = [path for path in wanted if path not in done]
+    if missing:
+        raise ManifestError("{0} entries missing from the chain, first: {1}".format(len(missing), missing[0]))
+    return len(done)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="BackupSuite rootfs manifests and differential backups")
+    sub = parser.add_subparsers(dest="command")
+    p = sub.add_parser("manifest")
+    p.add_argument("root")
+    p.add_argument("output")
+    p.add_argument("--reuse", default="")
+    p.add_argument("--exclude", action="append", default=[])
+    p = sub.add_parser("diff")
+    p.add_argument("root")
+    p.add_argument("base")
+    p.add_argument("output")
+    p.add_argument("--exclude", action="append", default=[])
+    p = sub.add_parser("restore")
+    p.add_argument("folder")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "manifest":
+            reuse = Manifest.read(args.reuse) if args.reuse and os.path.isfile(args.reuse) else None
+            manifest = build_manifest(args.root, args.exclude, reuse)
+            manifest.write(args.output)
+            print("Manifest of {0}: {1} entries".format(args.root, len(manifest.order)))
+        elif args.command == "diff":
+            base = Manifest.read(args.base)
+            current = build_manifest(args.root, args.exclude, base)
+            current.archive = DIFF_ARCHIVE
+            current.base = os.path.dirname(os.path.realpath(args.base))
+            out = _open_output()
+            changed, deleted = write_diff(args.root, base, current, out)
+            out.close()
+            # Written last, a missing manifest tells the script the diff failed
+            current.write(args.output)
+            print("Differential backup: {0} changed, {1} deleted".format(changed, deleted), file=sys.stderr)
+        elif args.command == "restore":
+            out = _open_output()
+            count = restore(args.folder, out)
+            out.close()
+            print("Restored {0} entries".format(count), file=sys.stderr)
+        else:
+            parser.print_usage(sys.stderr)
+            return 2
+    except (ManifestError, IOError, OSError, tarfile.TarError) as e:
+        print("[BackupSuite] incremental: {0}".format(str(e)), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+"""
+Backups running in the background, one after the other.
+
+The backup script used to run in a modal console, the user had to stay on
+that screen until it ended and closing it left the bind mount and the work
+folder behind. The job manager runs the scripts as background processes
+instead, queues a backup started while another one runs, cancels with
+cleanup, and tells its listeners when a job has ended. The jobs go on while
+the screens are closed.
+
+The manager is job_manager, one per enigma2 session:
+
+    job = BackupJob(_("USB Backup"), cmd, media="/media/usb")
+    job_manager.add(job)
+    job_manager.onFinished.append(callback)   # callback(job)
+    job_manager.cancel(job)
+
+Without enigma2 (the web API run on its own, see webapi.py) job_manager is
+None, BackupJob and JobManager are there for a manager that runs the jobs
+another way.
+"""
+
+from __future__ import print_function
+import os
+import shutil
+import signal
+from os.path import ismount, join
+
+try:
+    from enigma import eConsoleAppContainer
+except ImportError:
+    eConsoleAppContainer = None
+
+try:
+    from .metrics import descendants
+except (ImportError, ValueError, SystemError):
+    from metrics import descendants
+
+BIND_MOUNT = "/tmp/bi/root"
+
+# Output kept per job for the screen showing it, in characters
+MAX_OUTPUT = 65536
+
+
+class BackupJob(object):
+    WAITING = "waiting"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    def __init__(self, name, cmd, media=None):
+        self.name = name
+        self.cmd = cmd
+        self.media = media
+        self.status = self.WAITING
+        self.retval = None
+        self.output = ""
+        self.onOutput = []  # callback(job, text)
+
+    def append(self, text):
+        self.output = (self.output + text)[-MAX_OUTPUT:]
+        for callback in self.onOutput[:]:
+            callback(self, text)
+
+    @property
+    def active(self):
+        return self.status in (self.WAITING, self.RUNNING)
+
+
+class JobManager(object):
+    def __init__(self):
+        self.jobs = []
+        self.current = None
+        self.onChange = []  # callback(job), a job was added or changed state
+        self.onFinished = []  # callback(job), a job has ended
+        self.container = eConsoleAppContainer()
+        try:
+            self.container.appClosed.append(self.runFinished)
+            self.container.dataAvail.append(self.dataAvail)
+        except AttributeError:
+            self.appClosed_conn = self.container.appClosed.connect(self.runFinished)
+            self.dataAvail_conn = self.container.dataAvail.connect(self.dataAvail)
+
+    def _execute(self, cmd):
+        """Start cmd, true when it couldn't be started."""
+        return self.container.execute(cmd)
+
+    def _pid(self):
+        return self.container.getPID()
+
+    def add(self, job):
+        """Queue job, it starts at once when nothing runs."""
+        self.jobs.append(job)
+        self._changed(job)
+        self._startNext()
+        return job
+
+    def active(self):
+        return [job for job in self.jobs if job.active]
+
+    def cancel(self, job):
+        if job.status == BackupJob.WAITING:
+            job.status = BackupJob.CANCELLED
+            self._changed(job)
+            self._finished(job)
+        elif job is self.current and job.status == BackupJob.RUNNING:
+            job.status = BackupJob.CANCELLED
+            self._changed(job)
+            # The scripts clean up on SIGTERM. The whole tree gets it, the
+            # shells first so their trap is pending when tar or mkfs end
+            pid = self._pid()
+            for child in [pid] + descendants(pid):
+                try:
+                    os.kill(child, signal.SIGTERM)
+                except OSError:
+                    pass
+
+    def _startNext(self):
+        if self.current is not None:
+            return
+        for job in self.jobs:
+            if job.status == BackupJob.WAITING:
+                break
+        else:
+            return
+        self.current = job
+        job.status = BackupJob.RUNNING
+        self._changed(job)
+        print("[BackupSuite] Starting job {0}: {1}".format(job.name, job.cmd))
+        if self._execute(job.cmd):
+            self.runFinished(-1)
+
+    def dataAvail(self, data):
+        if isinstance(data, bytes):
+            data = data.decode("utf-8", "ignore")
+        if self.current is not None:
+            self.current.append(data)
+
+    def runFinished(self, retval):
+        job = self.current
+        if job is None:
+            return
+        self.current = None
+        job.retval = retval
+        if job.status == BackupJob.CANCELLED:
+            self._cleanup(job)
+        else:
+            job.status = BackupJob.DONE if retval == 0 else BackupJob.FAILED
+        print("[BackupSuite] Job {0} ended: {1} ({2})".format(job.name, job.status, retval))
+        self._changed(job)
+        self._finished(job)
+        self._startNext()
+
+    def _cleanup(self, job):
+        """What the script leaves when it couldn't run its own cleanup."""
+        if ismount(BIND_MOUNT):
+            os.system("umount {0} > /dev/null 2>&1".format(BIND_MOUNT))
+        for folder in (BIND_MOUNT, os.path.dirname(BIND_MOUNT)):
+            try:
+                os.rmdir(folder)
+            except OSError:
+                pass
+        if job.media:
+            shutil.rmtree(join(job.media, "bi"), ignore_errors=True)
+
+    def _changed(self, job):
+        for callback in self.onChange[:]:
+            callback(job)
+
+    def _finished(self, job):
+        for callback in self.onFinished[:]:
+            callback(job)
+
+
+job_manager = JobManager() if eConsoleAppContainer is not None else None
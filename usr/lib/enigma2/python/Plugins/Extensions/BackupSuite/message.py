@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+
+"""
+Messages shown by the backup scripts.
+
+    message.py LANG KEY
+        Print one message translated to LANG (one python start per message,
+        kept for scripts that don't load the compiled catalog).
+
+    message.py --compile LANG OUT
+        Write all messages translated to LANG as a shell file. The scripts
+        source it once and print a message with "show_message KEY", no
+        python is started for it.
+
+The translations come from locale/LANG/LC_MESSAGES/BackupSuite.mo. Messages
+that are no longer in the .mo are looked up in the .po next to it, which
+keeps them as obsolete ("#~") entries.
+"""
+
+from __future__ import print_function
+import gettext
+import os
+import sys
+
+DOMAIN = "BackupSuite"
+LOCALEDIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "locale")
+
+MESSAGES = {
+    "message01": "No supported receiver found!",
+    "message02": "BACK-UP TOOL, FOR MAKING A COMPLETE BACK-UP",
+    "message03": "Please be patient, a backup will now be made, this will take about: ",
+    "message04": " size to be backed up: ",
+    "message05": "not found, the backup process will be aborted!",
+    "message06": "Some information about the task",
+    "message06a": "Create: root.ubifs",
+    "message07": "Create: kerneldump",
+    "message09": "Additional backup -> ",
+    "message10": "USB Image created in: ",
+    "message11": "and there is made an extra copy in: ",
+    "message14": "Please check the manual of the receiver on how to restore the image.",
+    "message15": "Image creation FAILED!",
+    "message16": "available ",
+    "message17": "There is a valid USB-flashdrive detected in one of the USB-ports, "
+                 "therefore an extra copy of the back-up image will now be copied to that USB-flashdrive.",
+    "message19": "Backup finished and copied to your USB-flashdrive.",
+    "message20": "Full back-up to the harddisk",
+    "message21": "No backup media found!",
+    "message22": "Backup media found:",
+    "message23": "The content of the folder is:",
+    "message24": "Time required for this process: ",
+    "message25": "minutes",
+    "message26": "Backup done with: ",
+    "message27": "KB per second",
+    "message28": "Most likely this back-up can't be restored because of it's size, it's simply too big to restore. "
+                 "This is a limitation of the bootloader not of the back-up or the BackupSuite.",
+    "message29": "There COULD be a problem with restoring this back-up because the size of the back-up comes "
+                 "close to the maximum size. This is a limitation of the bootloader not of the back-up or the BackupSuite.",
+    "message30": "Not enough free space on ",
+    "message31": " to make a back-up!",
+    "message32": " MB available space",
+    "message33": " MB needed space",
+    "message34": "The program will abort, please try another medium with more free space to create your back-up.",
+    "message35": "is not executable...",
+    "message36": "Using your own custom lookuptable.txt from the folder /etc",
+    "message37": "Version unknown, probably not installed the right way.",
+    "message38": "not installed yet, now installing",
+    "message39": "Probably you are trying to make the back-up in flash memory",
+    "message40": "No additional USB-stick found to copy an extra backup",
+    "message41": "Installed packages contained in this backup:",
+    "message42": "NFI Image created in: ",
+    "message42a": "Mount point does not exist! Please check your network share configuration.",
+    "message42b": "Network path not specified!",
+    "message42c": "Write permission denied! Check share permissions.",
+    "message42d": "Insufficient free space on NAS!",
+    "message42e": "Unable to create backup directories!",
+    "message42f": "Unable to create the backup marker file!",
+    "message44": "Backup started...",
+    "message45": "Phase 1/3: Preparing backup environment",
+    "message46": "Phase 2/3: Creating backup image",
+    "message47": "Phase 3/3: Finalizing backup",
+    "message48": "Backup completed successfully!",
+    "message49a": "Backup size:",
+    "message50a": "Backup created in:",
+    "message51": "Dumping kernel (25%)",
+    "message52": "Creating root filesystem (50%)",
+    "message53": "Assembling image (75%)",
+    "message54": "Making extra copy (90%)",
+    "message55": "Finalizing (95%)",
+    "message56": "Backup complete (100%)",
+}
+
+# Printed without a newline, the script completes the line
+INLINE = frozenset([
+    "message03", "message04", "message09", "message10", "message11", "message16", "message24",
+    "message26", "message30", "message42", "message49a", "message50a",
+])
+
+
+def _unquote(text):
+    text = text.strip()
+    if text.startswith('"') and text.endswith('"'):
+        text = text[1:-1]
+    out, i = [], 0
+    while i < len(text):
+        c = text[i]
+        if c == "\\" and i + 1 < len(text):
+            i += 1
+            c = {"n": "\n", "t": "\t"}.get(text[i], text[i])
+        out.append(c)
+        i += 1
+    return "".join(out)
+
+
+def read_po(path):
+    """Return {msgid: msgstr} of a .po file, obsolete entries included, fuzzy ones left out."""
+    catalog = {}
+    if not os.path.isfile(path):
+        return catalog
+    with open(path, "rb") as f:
+        lines = f.read().decode("utf-8", "replace").splitlines()
+    msgid = msgstr = None
+    current = None
+    fuzzy = False
+
+    def flush():
+        if msgid and msgstr and not fuzzy:
+            catalog[msgid] = msgstr
+
+    for line in lines + [""]:
+        if line.startswith("#~"):
+            line = line[2:].strip()
+        elif line.startswith("#"):
+            if line.startswith("#,") and "fuzzy" in line:
+                flush()
+                msgid = msgstr = current = None
+                fuzzy = True
+            continue
+        line = line.strip()
+        if line.startswith("msgid "):
+            if msgid is not None:
+                flush()
+                fuzzy = False
+            msgid, msgstr, current = _unquote(line[6:]), None, "msgid"
+        elif line.startswith("msgstr "):
+            msgstr, current = _unquote(line[7:]), "msgstr"
+        elif line.startswith('"') and current == "msgid":
+            msgid += _unquote(line)
+        elif line.startswith('"') and current == "msgstr":
+            msgstr += _unquote(line)
+        elif not line:
+            flush()
+            msgid = msgstr = current = None
+            fuzzy = False
+    return catalog
+
+
+class Catalog(object):
+    def __init__(self, lang):
+        self.mo = None
+        self.po = {}
+        for code in (lang, lang[:2]):
+            folder = os.path.join(LOCALEDIR, code, "LC_MESSAGES")
+            mo = os.path.join(folder, DOMAIN + ".mo")
+            if os.path.isfile(mo):
+                with open(mo, "rb") as f:
+                    self.mo = gettext.GNUTranslations(f)
+            self.po = read_po(os.path.join(folder, DOMAIN + ".po"))
+            if self.mo is not None or self.po:
+                break
+
+    def _lookup(self, text):
+        if self.mo is not None:
+            translated = self.mo.ugettext(text) if sys.version_info[0] < 3 else self.mo.gettext(text)
+            if translated != text:
+                return translated
+        return self.po.get(text)
+
+    def translate(self, text):
+        translated = self._lookup(text)
+        if translated is None:
+            # Older catalogs have the message without its surrounding spaces
+            stripped = text.strip()
+            translated = self._lookup(stripped) if stripped != text else None
+            if translated is not None:
+                lead = text[:len(text) - len(text.lstrip())]
+                trail = text[len(text.rstrip()):]
+                translated = lead + translated.strip() + trail
+        return translated or text
+
+    def message(self, key):
+        """The text printed for key, newline included unless it's an inline one."""
+        text = self.translate(MESSAGES[key]) if key in MESSAGES else key
+        return text if key in INLINE else text + "\n"
+
+
+def _shell_quote(text):
+    return "'" + text.replace("'", "'\\''") + "'"
+
+
+def compile_catalog(lang, output):
+    catalog = Catalog(lang)
+    lines = [
+        "# BackupSuite messages ({0}), written by message.py --compile, do not edit".format(lang),
+    ]
+    for key in sorted(MESSAGES):
+        # Not format(), the text is unicode and the template a str on python 2
+        lines.append("BSMSG_" + key + "=" + _shell_quote(catalog.message(key)))
+    lines.extend([
+        "show_message()",
+        "{",
+        'eval "_BSMSG=\\${BSMSG_$1-}"',
+        'if [ -n "$_BSMSG" ] ; then',
+        "    printf '%s' \"$_BSMSG\"",
+        "else",
+        '    echo "$1"',
+        "fi",
+        "}",
+        "",
+    ])
+    tmp = "{0}.{1}.tmp".format(output, os.getpid())
+    with open(tmp, "wb") as f:
+        f.write("\n".join(lines).encode("utf-8"))
+    os.rename(tmp, output)
+    return len(MESSAGES)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) == 3 and argv[0] == "--compile":
+        try:
+            count = compile_catalog(argv[1], argv[2])
+        except (IOError, OSError) as e:
+            print("[BackupSuite] message: {0}".format(str(e)), file=sys.stderr)
+            return 1
+        print("{0}: {1} messages".format(argv[2], count))
+        return 0
+    if len(argv) == 2:
+        out = getattr(sys.stdout, "buffer", sys.stdout)
+        out.write(Catalog(argv[0]).message(argv[1]).encode("utf-8"))
+        out.flush()
+        return 0
+    print("Usage: message.py LANG KEY | --compile LANG OUTPUT", file=sys.stderr)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
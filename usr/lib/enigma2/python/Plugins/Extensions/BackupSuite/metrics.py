@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+
+"""
+Metrics of a backup, one JSON record per run.
+
+BackupSuite.log is written for people: localized messages, ls output and the
+package list. For comparing runs and boxes every backup also gets
+backupsuite-metrics.json next to it, with per phase (model lookup, kernel
+dump, root filesystem with its compression, finalizing, zip, extra copy) the
+wall time, the KB that went in and came out, the ratio of the two, the
+throughput and the peak memory. The records are also added to a history file
+on the backup media, which keeps the newest MAX_HISTORY of them.
+
+The timings come from the phase log of backupsuite.sh (see speedhistory.py).
+The peak memory is sampled while the backup runs: the resident sets of the
+script and everything below it are added up once a second and the highest
+sum is kept per phase.
+
+    metrics.py sample PID PHASEFILE RSSFILE
+        Sample process PID and its children until it ends, PHASEFILE holds
+        the name of the running phase, the peaks go to RSSFILE.
+
+    metrics.py write PHASELOG FOLDER [--rss RSSFILE] [--history FILE]
+                     [--model MODEL] [--rootname NAME] [--root-kb KB]
+                     [--wall SECONDS]
+        Write FOLDER/backupsuite-metrics.json and add it to the history.
+
+    metrics.py rotate FILE [--max-kb KB] [--keep N]
+        Move FILE to FILE.1 (and so on) when it is larger than KB.
+"""
+
+from __future__ import print_function
+import argparse
+import json
+import os
+import sys
+import time
+
+try:
+    from .speedhistory import read_phaselog
+except (ImportError, ValueError, SystemError):
+    from speedhistory import read_phaselog
+
+METRICS = "backupsuite-metrics.json"
+MAX_HISTORY = 100
+INTERVAL = 1.0
+
+# Logs rotated by size
+MAX_LOG_KB = 1024
+KEEP_LOGS = 3
+
+
+def descendants(pid):
+    """All processes below pid, parents before their children."""
+    parents = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open("/proc/{0}/stat".format(entry), "r") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (IOError, OSError, IndexError, ValueError):
+            continue
+        parents.setdefault(ppid, []).append(int(entry))
+    found = []
+    todo = [pid]
+    while todo:
+        for child in parents.get(todo.pop(0), []):
+            found.append(child)
+            todo.append(child)
+    return found
+
+
+def rss_kb(pid):
+    try:
+        with open("/proc/{0}/status".format(pid), "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except (IOError, OSError, IndexError, ValueError):
+        pass
+    return 0  # kernel threads and processes that just ended
+
+
+def _write_json(path, data):
+    tmp = "{0}.{1}.tmp".format(path, os.getpid())
+    with open(tmp, "w") as f:
+        json.dump(data, f, sort_keys=True)
+    os.rename(tmp, path)
+
+
+def _read_json(path):
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def sample(pid, phasefile, rssfile, interval=INTERVAL):
+    """Keep the peak resident memory per phase of pid and its children in rssfile."""
+    peaks = {}
+    me = os.getpid()
+    while os.path.exists("/proc/{0}".format(pid)):
+        try:
+            with open(phasefile, "r") as f:
+                phase = f.read().strip() or "start"
+        except (IOError, OSError):
+            phase = "start"
+        total = sum(rss_kb(p) for p in [pid] + descendants(pid) if p != me)
+        if total > peaks.get(phase, 0):
+            peaks[phase] = total
+            _write_json(rssfile, peaks)
+        time.sleep(interval)
+    return 0
+
+
+def folder_kb(path):
+    total = 0
+    for dirpath, dirnames, filenames in os.walk(path):
+        for name in filenames:
+            full = os.path.join(dirpath, name)
+            if name != METRICS and not os.path.islink(full):
+                total += os.path.getsize(full)
+    return total // 1024
+
+
+def build(phaselog, folder, rss=None, model="", rootname="", root_kb=0, wall=0):
+    """The metrics record of a backup."""
+    rss = rss or {}
+    phases = []
+    for phase, kb_in, seconds, kb_out, target in read_phaselog(phaselog, phases=None):
+        entry = {
+            "phase": phase,
+            "seconds": round(seconds, 2),
+            "kb_in": kb_in,
+            "kb_out": kb_out,
+            "target": target,
+        }
+        if kb_in and kb_out:
+            entry["ratio"] = round(float(kb_out) / kb_in, 3)
+        if kb_in and seconds > 0:
+            entry["kb_per_s"] = round(kb_in / seconds, 1)
+        if phase in rss:
+            entry["peak_rss_kb"] = rss[phase]
+        phases.append(entry)
+    image_kb = folder_kb(folder)
+    record = {
+        "version": 1,
+        "model": model,
+        "rootname": rootname,
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "folder": folder,
+        "wall_seconds": wall,
+        "root_kb": root_kb,
+        "image_kb": image_kb,
+        "peak_rss_kb": max(rss.values()) if rss else None,
+        "phases": phases,
+    }
+    if root_kb:
+        record["ratio"] = round(float(image_kb) / root_kb, 3)
+    if wall:
+        record["kb_per_s"] = round(float(root_kb) / wall, 1)
+    return record
+
+
+def read_metrics(folder):
+    """The metrics record of the backup in folder, {} when it has none."""
+    return _read_json(os.path.join(folder, METRICS))
+
+
+def add_history(path, record, keep=MAX_HISTORY):
+    """Append record to the JSON lines file path, only the newest keep are kept."""
+    try:
+        with open(path, "r") as f:
+            lines = [line for line in f.read().splitlines() if line.strip()]
+    except (IOError, OSError):
+        lines = []
+    lines.append(json.dumps(record, sort_keys=True))
+    tmp = "{0}.{1}.tmp".format(path, os.getpid())
+    with open(tmp, "w") as f:
+        f.write("\n".join(lines[-keep:]) + "\n")
+    os.rename(tmp, path)
+
+
+def rotate(path, max_kb=MAX_LOG_KB, keep=KEEP_LOGS):
+    """Rotate path when it is larger than max_kb, returns True when it was."""
+    try:
+        if os.path.getsize(path) <= max_kb * 1024:
+            return False
+    except OSError:
+        return False
+    for number in range(keep - 1, 0, -1):
+        older = "{0}.{1}".format(path, number)
+        if os.path.exists(older):
+            os.rename(older, "{0}.{1}".format(path, number + 1))
+    os.rename(path, path + ".1")
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="BackupSuite backup metrics")
+    sub = parser.add_subparsers(dest="command")
+    p = sub.add_parser("sample")
+    p.add_argument("pid", type=int)
+    p.add_argument("phasefile")
+    p.add_argument("rssfile")
+    p = sub.add_parser("write")
+    p.add_argument("phaselog")
+    p.add_argument("folder")
+    p.add_argument("--rss")
+    p.add_argument("--history")
+    p.add_argument("--model", default="")
+    p.add_argument("--rootname", default="")
+    p.add_argument("--root-kb", type=int, default=0)
+    p.add_argument("--wall", type=int, default=0)
+    p = sub.add_parser("rotate")
+    p.add_argument("file")
+    p.add_argument("--max-kb", type=int, default=MAX_LOG_KB)
+    p.add_argument("--keep", type=int, default=KEEP_LOGS)
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "sample":
+            return sample(args.pid, args.phasefile, args.rssfile)
+        elif args.command == "write":
+            rss = _read_json(args.rss) if args.rss else {}
+            record = build(args.phaselog, args.folder, rss, args.model, args.rootname,
+                           args.root_kb, args.wall)
+            _write_json(os.path.join(args.folder, METRICS), record)
+            if args.history:
+                add_history(args.history, record)
+            for entry in record["phases"]:
+                print("{phase}: {seconds}s, {kb_in} KB in, {kb_out} KB out".format(**entry))
+        elif args.command == "rotate":
+            if rotate(args.file, args.max_kb, args.keep):
+                print("{0} rotated".format(args.file))
+        else:
+            parser.print_usage(sys.stderr)
+            return 2
+    except (IOError, OSError) as e:
+        print("[BackupSuite] metrics: {0}".format(str(e)), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -30,9 +30,9 @@ This rewrite aims to improve stability, usability, and maintainability compared
 
 from __future__ import print_function
 from os import (
+    kill as os_kill,
     listdir,
     system as os_system,
-    statvfs,
     makedirs,
     getenv,
     access,
@@ -43,14 +43,19 @@ from os.path import (
     ismount,
     exists,
     isfile,
-    join,
-    realpath
+    join
 )
+from signal import SIGTERM
+from sys import version_info
+from time import time
 
 from Components.ActionMap import ActionMap
 from Components.Button import Button
+from Components.config import ConfigSelection, ConfigYesNo, getConfigListEntry
+from Components.ConfigList import ConfigListScreen
 from Components.FileList import FileList
 from Components.MenuList import MenuList
+from Components.ProgressBar import ProgressBar
 from Components.ScrollLabel import ScrollLabel
 from Components.Sources.StaticText import StaticText
 from Components.Harddisk import harddiskmanager
@@ -59,19 +64,31 @@ from Plugins.Plugin import PluginDescriptor
 from enigma import (
     RT_HALIGN_LEFT,
     RT_VALIGN_CENTER,
+    eConsoleAppContainer,
     eListboxPythonMultiContent,
+    eTimer,
     gFont,
     getDesktop
 )
 
+from Screens.ChoiceBox import ChoiceBox
 from Screens.Console import Console
 from Screens.MessageBox import MessageBox
 from Screens.Screen import Screen
+from Tools import Notifications
 from Tools.LoadPixmap import LoadPixmap
 from Tools.Directories import resolveFilename, SCOPE_PLUGINS
 
 from . import _
 from .findkerneldevice import *     # fallback for to compile on test develop..
+from .boxprofile import get_profile
+from .devices import get_device_type, network_shares as network_shares_of_mounts
+from .jobmanager import BackupJob, job_manager
+from .progress import percent, read_status
+from .result import read_result
+from . import scheduler, settings
+from .sizeestimate import KERNEL_KB, root_size_kb
+from .speedhistory import SpeedHistory, backup_phases
 
 # Global constants
 VERSION = '3.0-r10'
@@ -79,6 +96,7 @@ LOGFILE = "/tmp/BackupSuite.log"
 VERSIONFILE = "imageversion"
 ENIGMA2VERSIONFILE = "/tmp/enigma2version"
 OFGWRITE_BIN = "/usr/bin/ofgwrite"
+PYTHON_BIN = "python3" if version_info[0] >= 3 else "python"
 
 # Global variables
 autoStartTimer = None
@@ -129,38 +147,6 @@ def BackupDeviceEntryComponent(device):
     return res
 
 
-def get_box_type():
-    try:
-        from enigma import getBoxType
-        return getBoxType().lower()
-    except ImportError:
-        try:
-            from boxbranding import getBoxType
-            return getBoxType().lower()
-        except ImportError:
-            return "unknown"
-
-
-def is_dual_boot():
-    if get_box_type() != "et8500":
-        return False
-    try:
-        with open("/proc/mtd") as f:
-            content = f.read()
-            return 'rootfs2' in content and 'kernel2' in content
-    except BaseException:
-        return False
-
-
-def requires_force_mode():
-    model = get_box_type()
-    force_models = [
-        'h9', 'h9se', 'h9combo', 'h9combose', 'i55plus',
-        'i55se', 'h10', 'hzero', 'h8'
-    ]
-    return any(x in model for x in force_models)
-
-
 def get_skin(type):
     try:
         sz_w = getDesktop(0).size().width()
@@ -176,158 +162,47 @@ def get_skin(type):
         return globals().get("skin" + skin_prefix + "sd", "")
 
 
-def get_backup_files_pattern():
-    """Return the regex pattern for backup file extensions based on the device model."""
-    model = get_box_type()
-
-    if "dm" in model:
-        if "dm9" in model:
-            return r"\.(xz)$"
-        elif any(x in model for x in ["dm520", "dm7080", "dm820"]):
-            return r"\.(xz)$"
-        else:
-            return r"\.(nfi)$"
-
-    elif "vu" in model:
-        if "4k" in model:
-            return r"\.(bin|bz2)$"
-        elif any(x in model for x in ["vuduo2", "vusolose", "vusolo2", "vuzero"]):
-            return r"\.(bin|jffs2)$"
-        else:
-            return r"\.(bin|jffs2)$"
-
-    elif any(x in model for x in ["hd51", "h7", "sf4008", "sf5008", "sf8008", "sf8008m", "vs1500", "et11000", "et13000"]):
-        return r"\.(bin|bz2)$"
-
-    elif any(x in model for x in ["h9", "h9se", "h9combo", "h9combose", "i55plus", "i55se", "h10", "hzero", "h8"]):
-        return r"\.(ubi)$"
-
-    elif any(x in model for x in ["hd60", "hd61", "multibox", "multiboxse", "multiboxplus"]):
-        return r"\.(bz2)$"
-
-    elif model.startswith(("et4", "et5", "et6", "et7", "et8", "et9", "et10")):
-        return r"\.(bin)$"
-
-    elif "ebox" in model:
-        return r"\.(jffs2)$"
+def get_helper(name):
+    """Path of a helper module of the plugin, the source or the compiled one."""
+    base = resolveFilename(SCOPE_PLUGINS, "Extensions/BackupSuite/" + name)
+    for ext in (".py", ".pyc", ".pyo"):
+        if exists(base + ext):
+            return base + ext
+    return None
 
-    elif any(x in model for x in ["4k", "uhd"]):
-        return r"\.(bz2)$"
 
-    return r"\.(zip|bin|bz2)$"
+def estimate_backup_minutes(path):
+    """Expected minutes of a backup to path from the speeds of earlier ones, None if unknown."""
+    try:
+        receiver = get_profile().receiver
+        rootname = receiver.rootname if receiver is not None else "rootfs.tar.bz2"
+        seconds = SpeedHistory().estimate(
+            path, root_size_kb(walk=False), KERNEL_KB, backup_phases(rootname))
+    except (IOError, OSError) as e:
+        print("[BackupSuite] No time estimate for {0}: {1}".format(path, str(e)))
+        return None
+    return max(1, (seconds + 59) // 60)
 
 
 def get_mounted_network_shares():
-    """Detect mounted network shares by reading /proc/mounts"""
+    """The mounted network shares with their space for the screens, see devices.py."""
     network_shares = []
-    processed = set()
-    try:
-        with open("/proc/mounts", "r") as f:
-            for line in f:
-                parts = line.split()
-                if len(parts) < 3:
-                    continue
-
-                device, mountpoint, fstype = parts[0], parts[1], parts[2]
-
-                if fstype.lower() in ("cifs", "nfs", "nfs4", "smbfs"):
-                    try:
-                        stat = statvfs(mountpoint)
-                        free_gb = (stat.f_bavail * stat.f_frsize) / (1024 ** 3)
-                        total_gb = (stat.f_blocks *
-                                    stat.f_frsize) / (1024 ** 3)
-                        free_str = "{0:.2f} {1}".format(free_gb, _('GB'))
-                        total_str = "{0:.2f} {1}".format(total_gb, _('GB'))
-                    except Exception as e:
-                        free_str = total_str = _("Unknown")
-                        print('error: {0}'.format(str(e)))
-
-                    server_name = device.split("/")[-1].split(":")[0]
-                    if not server_name:
-                        server_name = mountpoint.split("/")[-1]
-
-                    # Skip if we've already processed this
-                    if server_name in processed:
-                        continue
-
-                    processed.add(server_name)
-
-                    network_shares.append({
-                        "server": server_name,
-                        "mountpoint": mountpoint,
-                        "freespace": free_str,
-                        "totalspace": total_str,
-                        "fstype": fstype.upper()
-                    })
-    except Exception as e:
-        print("[BackupSuite] Error reading /proc/mounts: {0}".format(str(e)))
+    for share in network_shares_of_mounts():
+        if share["total"] is None:
+            free_str = total_str = _("Unknown")
+        else:
+            free_str = "{0:.2f} {1}".format(share["free"] / float(1024 ** 3), _('GB'))
+            total_str = "{0:.2f} {1}".format(share["total"] / float(1024 ** 3), _('GB'))
+        network_shares.append({
+            "server": share["server"],
+            "mountpoint": share["mountpoint"],
+            "freespace": free_str,
+            "totalspace": total_str,
+            "fstype": share["fstype"].upper()
+        })
     return network_shares
 
 
-def get_root_device_type():
-    """Determine the type of the root filesystem device with special cases"""
-    try:
-        with open("/proc/cmdline", "r") as f:
-            cmdline = f.read()
-
-            # Check for special cases before generic checks
-            if "root=/dev/mmcblk0p1" in cmdline:
-                return "MMC_SWITCH_ERROR"
-            elif "root=/dev/mmc" in cmdline:
-                return "MMC"
-            elif "root=/dev/nand" in cmdline or "root=/dev/mtd" in cmdline:
-                return "FLASH"
-            elif "root=/dev/sd" in cmdline:
-                return "USB"
-            elif "root=/dev/hd" in cmdline:
-                return "HDD"
-    except BaseException:
-        pass
-    return "USB"  # Safer default
-
-
-def get_device_type_from_sysfs(device_base):
-    """Determine the device type by analyzing sysfs block information."""
-    try:
-        sysfs_path = "/sys/block/{0}".format(device_base)
-        if not exists(sysfs_path):
-            return "USB"  # Assume USB if the path doesn't exist
-
-        if device_base.startswith("mmcblk"):
-            return "MMC"
-
-        if device_base.startswith("nvme"):
-            return "HDD"
-
-        device_path = realpath(join(sysfs_path, "device"))
-
-        if "ata" in device_path or "sata" in device_path:
-            return "HDD"
-
-        if "usb" in device_path.lower():
-            return "USB"
-
-        uevent_path = join(sysfs_path, "device/uevent")
-        if exists(uevent_path):
-            with open(uevent_path, "r") as f:
-                content = f.read()
-                if "DRIVER=mmc" in content:
-                    return "MMC"
-                if "DRIVER=sd" in content and "ata" in content:
-                    return "HDD"
-
-        rotational_path = join(sysfs_path, "queue/rotational")
-        if exists(rotational_path):
-            with open(rotational_path, "r") as f:
-                if f.read().strip() == "1":
-                    return "HDD"
-
-    except Exception as e:
-        print("[BackupSuite] Error checking sysfs: {0}".format(str(e)))
-
-    return "USB"  # Fallback default
-
-
 # Global map for icons and scripts
 SCRIPTS_DIR = resolveFilename(SCOPE_PLUGINS, "Extensions/BackupSuite/scripts")
 ICONS_DIR = resolveFilename(SCOPE_PLUGINS, "Extensions/BackupSuite/img")
@@ -366,37 +241,11 @@ DEVICE_PROFILES = {
 }
 
 
-def get_device_type(device_name, description, model, mountpoint):
-    """Determine device type by combining multiple information sources."""
-    # Normalize texts for case-insensitive matching
-    desc = (description + " " + model + " " + mountpoint).lower()
-
-    # Search for specific keywords
-    if "mmc" in desc or "sd" in desc or "card" in desc or "emmc" in desc:
-        return "MMC"
-    elif "sata" in desc or "ata" in desc or "hdd" in desc or "hard disk" in desc:
-        return "HDD"
-    elif "nvme" in desc or "ssd" in desc:
-        return "HDD"
-    elif "usb" in desc or "flash" in desc or "pen" in desc:
-        return "USB"
-
-    # Analyze device name prefix
-    if device_name.startswith("mmcblk"):
-        return "MMC"
-    elif device_name.startswith("nvme"):
-        return "HDD"
-    elif device_name.startswith("sd"):
-        return "USB"
-
-    return "USB"  # Default fallback
-
-
 def get_available_backup_devices():
     """Retrieve a list of available backup devices excluding the root filesystem."""
     devices = []
     partitions = harddiskmanager.getMountedPartitions()
-    root_device_type = get_root_device_type()
+    root_device_type = get_profile().root_device
 
     print("[BackupSuite] Found {0} mounted partitions".format(len(partitions)))
     print("[BackupSuite] Root device type: {0}".format(root_device_type))
@@ -457,6 +306,38 @@ def get_available_backup_devices():
     return devices
 
 
+def find_backup_target(path):
+    """(device type, media path, script) of the mounted target at path, None when it isn't there."""
+    if not path:
+        return None
+    for dev in get_available_backup_devices():
+        if dev["path"] == path and dev["script"]:
+            return dev["type"], path, dev["script"]
+    for share in get_mounted_network_shares():
+        if share["mountpoint"] == path:
+            backup_dir = join(path, "backup")
+            if not exists(backup_dir):
+                makedirs(backup_dir)
+            return "NET", backup_dir, DEVICE_PROFILES["NET"]["script"]
+    return None
+
+
+def backup_command(script_path, device_type, media_path, lang=None):
+    """Shell command running the backup script of a device, in lang or that of enigma2."""
+    return "chmod +x '{0}'; '{0}' '{1}' '{2}' '{3}'".format(
+        script_path, lang or get_lang(), device_type, media_path)
+
+
+def write_enigma2_version():
+    """Write the current Enigma2 version string to a file."""
+    try:
+        from Components.About import getEnigmaVersionString
+        with open(ENIGMA2VERSIONFILE, 'w') as f:
+            f.write(getEnigmaVersionString())
+    except BaseException:
+        pass
+
+
 def requires_openpli_fix():
     return exists("/usr/lib/enigma2/python/Plugins/PLi")
 
@@ -483,6 +364,146 @@ def get_lang():
         return "en"
 
 
+def backup_error_message():
+    """Why the last backup failed, from the result record of the scripts."""
+    record = read_result()
+    if record is None or record["code"] in ("OK", "RUNNING"):
+        # Killed, or stopped before it could write its result
+        return _("Backup failed! Check log: {0}").format(LOGFILE)
+    code = record["code"]
+    if code == "NO_SPACE":
+        return _("Backup failed: Not enough free space on device!")
+    elif code == "PERMISSION":
+        return _("Backup failed: Write permission denied!")
+    elif code == "READ_ONLY":
+        return _("Backup failed: Device is read-only!")
+    elif code == "NOT_FOUND":
+        return _("Backup failed: Required files not found!")
+    elif code == "NETWORK":
+        return _("Backup failed: Network connection lost!")
+    elif code == "NO_TARGET":
+        return _("Backup failed: No backup media found!")
+    elif code == "NO_RECEIVER":
+        return _("Backup failed: This receiver is not supported!")
+    elif code == "UNSUPPORTED":
+        return _("Backup failed: Wrong backup script for this receiver!")
+    elif code == "CANCELLED":
+        return _("Backup cancelled")
+    elif code == "TOOL_MISSING":
+        return _("Backup failed: {0} is missing or not executable!").format(record["command"])
+    elif record["phase"]:
+        return _("Backup failed in phase {0}! Check log: {1}").format(record["phase"], LOGFILE)
+    return _("Backup failed! Check log: {0}").format(LOGFILE)
+
+
+def backup_finished(job):
+    """Tell the user how a backup job ended, whatever screen is open."""
+    if job.status == BackupJob.DONE:
+        Notifications.AddNotification(
+            MessageBox, _("{0} finished.").format(job.name), MessageBox.TYPE_INFO, timeout=10)
+    elif job.status == BackupJob.CANCELLED:
+        Notifications.AddNotification(
+            MessageBox, _("{0} cancelled.").format(job.name), MessageBox.TYPE_INFO, timeout=10)
+    else:
+        Notifications.AddNotification(
+            MessageBox, backup_error_message(), MessageBox.TYPE_ERROR, timeout=30)
+
+
+job_manager.onFinished.append(backup_finished)
+
+
+class BackupScheduler(object):
+    """Starts the scheduled backups when they are due, never on top of a recording."""
+
+    # Seconds between two looks at the schedule
+    CHECK = 300
+    # Expected duration times this is kept free of timers
+    MARGIN = 1.5
+
+    def __init__(self, session):
+        self.session = session
+        self.job = None
+        self.fingerprint = None
+        self.timer = eTimer()
+        try:
+            self.timer.callback.append(self.check)
+        except AttributeError:
+            self.timer_conn = self.timer.timeout.connect(self.check)
+        job_manager.onFinished.append(self.jobFinished)
+        # Leave the box some time to mount the devices after a boot
+        self.schedule(120)
+
+    def schedule(self, seconds):
+        self.timer.start(int(seconds * 1000), True)
+
+    def check(self):
+        values = settings.load()
+        if values["schedule"] == "off" or (self.job is not None and self.job.active):
+            return self.schedule(self.CHECK)
+        state = scheduler.read_state()
+        now = time()
+        if not scheduler.due(values, state, now):
+            return self.schedule(self.CHECK)
+        target = find_backup_target(values["schedule_target"])
+        if target is None:
+            print("[BackupSuite] Scheduled backup: target {0} not mounted".format(values["schedule_target"]))
+            return self.schedule(self.CHECK)
+        self.fingerprint = scheduler.fingerprint()
+        if values["schedule_skip_unchanged"] == "yes" and scheduler.unchanged(state, self.fingerprint):
+            print("[BackupSuite] Scheduled backup skipped, nothing changed since the last one")
+            state["last_check"] = now
+            scheduler.write_state(state)
+            return self.schedule(self.CHECK)
+        if job_manager.active() or self.recording():
+            print("[BackupSuite] Scheduled backup postponed, the box is busy")
+            return self.schedule(self.CHECK)
+        device_type, media_path, script_path = target
+        minutes = estimate_backup_minutes(media_path) or 30
+        start = scheduler.idle_start(now, minutes * 60 * self.MARGIN, self.timers())
+        if start > now:
+            print("[BackupSuite] Scheduled backup postponed to {0}, a timer is due".format(int(start)))
+            return self.schedule(start - now)
+        write_enigma2_version()
+        cmd = backup_command(script_path, device_type, media_path)
+        self.job = job_manager.add(BackupJob(_("Scheduled {0} Backup").format(device_type), cmd, media_path))
+        self.schedule(self.CHECK)
+
+    def recording(self):
+        """True while a recording runs or timeshift writes to the disk."""
+        nav = self.session.nav
+        if nav.RecordTimer.isRecording():
+            return True
+        try:
+            service = nav.getCurrentService()
+            timeshift = service and service.timeshift()
+            return bool(timeshift and timeshift.isTimeshiftEnabled())
+        except Exception:
+            return False
+
+    def timers(self):
+        """(begin, end) of the record timers to come."""
+        busy = []
+        for timer in self.session.nav.RecordTimer.timer_list:
+            if timer.disabled or getattr(timer, "justplay", False):
+                continue
+            busy.append((timer.begin, timer.end))
+        return busy
+
+    def jobFinished(self, job):
+        if job is not self.job:
+            return
+        state = scheduler.read_state()
+        if job.status == BackupJob.DONE:
+            state.update(last_run=time(), fingerprint=self.fingerprint)
+        else:
+            # Not again before the next slot
+            state["last_check"] = time()
+        try:
+            scheduler.write_state(state)
+        except (IOError, OSError) as e:
+            print("[BackupSuite] Error writing the schedule state: {0}".format(str(e)))
+
+
 class BackupStart(Screen):
     def __init__(self, session, args=0):
         self.skin = """
@@ -501,7 +522,7 @@ class BackupStart(Screen):
         Screen.__init__(self, session)
         self.session = session
         self.setup_title = _("Make or restore a backup")
-        self["key_menu"] = StaticText()
+        self["key_menu"] = StaticText(_("Menu"))
         self["key_red"] = StaticText(_("Close"))
         self["key_green"] = StaticText(_("Backup"))
         self["key_yellow"] = StaticText(_("Restore"))
@@ -523,6 +544,7 @@ class BackupStart(Screen):
                                      "displayHelp": self.show_help,
                                      "help": self.show_help,
                                      "ok": self.deviceSelected,
+                                     "menu": self.showMenu,
                                      },
                                     -1)
         self.setTitle(self.setup_title)
@@ -602,6 +624,9 @@ class BackupStart(Screen):
             # Create descriptive name
             short_path = basename(dev_path.rstrip('/'))
             description = "{0} ({1})".format(dev['desc'], short_path)
+            minutes = estimate_backup_minutes(dev_path)
+            if minutes is not None:
+                description += " - " + _("about {0} min").format(minutes)
             self.addDevice(
                 _("Backup to {0}").format(description),
                 dev["icon"],
@@ -747,6 +772,12 @@ class BackupStart(Screen):
             "BA": _("Barry Allen")
         }
         device_name = device_names.get(dev_type, dev_type)
+        minutes = estimate_backup_minutes(dev_path) if dev_path else None
+        if minutes is not None:
+            question = _("Do you want to make a backup to {0}?\n\nThis will take about {1} minutes.").format(
+                device_name, minutes)
+        else:
+            question = _("Do you want to make a backup to {0}?\n\nThis may take several minutes.").format(device_name)
 
         self.session.openWithCallback(
             lambda result,
@@ -758,13 +789,13 @@ class BackupStart(Screen):
                 dev_path,
                 dev_script),
             MessageBox,
-            _("Do you want to make a backup to {0}?\n\nThis may take several minutes.").format(device_name),
+            question,
             MessageBox.TYPE_YESNO)
 
     def confirmBackup(self, result, dev_type, dev_path, dev_script):
         """Execute the backup if the user confirmed."""
         if result:
-            self.write_enigma2_version()
+            write_enigma2_version()
             self.execute_backup(dev_type, dev_path, dev_script)
 
     def execute_backup(self, device_type, media_path=None, script_path=None):
@@ -790,15 +821,33 @@ class BackupStart(Screen):
 
         print("[BackupSuite] Using script: {0}".format(script_path))
 
-        lang = get_lang()
         title = _("{0} Backup").format(device_type)
+        cmd = backup_command(script_path, device_type, media_path)
+        print("[BackupSuite] Queueing command: {0}".format(cmd))
+        # Runs in the background, the screen only shows it
+        job = job_manager.add(BackupJob(title, cmd, media_path))
+        self.session.open(BackupConsole, job)
+
+    def showMenu(self):
+        """The settings and the backup jobs of this session."""
+        states = {
+            BackupJob.WAITING: _("waiting"),
+            BackupJob.RUNNING: _("running"),
+            BackupJob.DONE: _("finished"),
+            BackupJob.FAILED: _("failed"),
+            BackupJob.CANCELLED: _("cancelled"),
+        }
+        choices = [(_("Settings"), "setup")]
+        choices += [("{0} ({1})".format(job.name, states[job.status]), job) for job in reversed(job_manager.jobs)]
+        self.session.openWithCallback(self.menuSelected, ChoiceBox, title=_("Backup Suite"), list=choices)
 
-        # Build the command
-        cmd = "chmod +x '{0}'; '{0}' '{1}' '{2}' '{3}'".format(
-            script_path, lang, device_type, media_path)
-        print("[BackupSuite] Executing command: {0}".format(cmd))
-        self.session.openWithCallback(
-            self.console_closed, Console, title, [cmd])
+    def menuSelected(self, choice):
+        if not choice:
+            return
+        if choice[1] == "setup":
+            self.session.open(BackupSetup)
+        else:
+            self.session.open(BackupConsole, choice[1])
 
     def start_net_backup(self):
         """Start the network backup process."""
@@ -858,13 +907,11 @@ class BackupStart(Screen):
 
     def startRestore(self):
         """Start the restore process opening the FlashImageConfig with the backup file pattern."""
-        file_pattern = get_backup_files_pattern()
-        self.session.open(FlashImageConfig, '/media/', file_pattern)
+        self.session.open(FlashImageConfig, '/media/', get_profile().file_pattern)
 
     def flash_image(self):
         """Open FlashImageConfig to flash a backup image from /media/ with matching file pattern."""
-        file_pattern = get_backup_files_pattern()
-        self.session.open(FlashImageConfig, '/media/', file_pattern)
+        self.session.open(FlashImageConfig, '/media/', get_profile().file_pattern)
 
     def show_help(self):
         """Open the help screen."""
@@ -874,54 +921,344 @@ class BackupStart(Screen):
         """Open the 'What's New' info screen."""
         self.session.open(WhatisNewInfo)
 
-    def write_enigma2_version(self):
-        """Write the current Enigma2 version string to a file."""
+    def cancel(self):
+        self.close(False, self.session)
+
+
+class BackupConsole(Screen):
+    """Output and progress of a backup job, closing it leaves the job running."""
+
+    skin = """
+        <screen position="center,center" size="1000,600" title="Backup">
+            <widget name="text" position="10,10" size="980,450" font="Regular;20" />
+            <widget name="progress" position="10,470" size="980,20" borderWidth="1" />
+            <widget source="progress_text" render="Label" position="10,500" size="980,50" font="Regular;22" />
+            <ePixmap position="10,560" size="35,25" pixmap="skin_default/buttons/red.png" zPosition="1" alphatest="on" />
+            <widget source="key_red" render="Label" position="50,560" size="250,25" zPosition="2" font="Regular;20" halign="left" valign="center" transparent="1" />
+            <ePixmap position="320,560" size="35,25" pixmap="skin_default/buttons/green.png" zPosition="1" alphatest="on" />
+            <widget source="key_green" render="Label" position="360,560" size="250,25" zPosition="2" font="Regular;20" halign="left" valign="center" transparent="1" />
+        </screen>"""
+
+    PHASES = {
+        "kernel": _("Dumping kernel"),
+        "tar": _("Packing the root filesystem"),
+        "mkfs": _("Creating root filesystem"),
+        "ubinize": _("Assembling image"),
+        "copy": _("Making extra copy"),
+        "zip": _("Creating zip archive"),
+    }
+
+    def __init__(self, session, job):
+        Screen.__init__(self, session)
+        self.job = job
+        self.setTitle(job.name)
+        self["text"] = ScrollLabel(job.output)
+        self["progress"] = ProgressBar()
+        self["progress_text"] = StaticText("")
+        self["key_red"] = StaticText("")
+        self["key_green"] = StaticText(_("Hide"))
+        self["actions"] = ActionMap(
+            ["SetupActions", "ColorActions", "DirectionActions"],
+            {
+                "red": self.keyCancelJob,
+                "green": self.close,
+                "ok": self.close,
+                "cancel": self.close,
+                "up": self["text"].pageUp,
+                "down": self["text"].pageDown
+            }
+        )
+        job.onOutput.append(self.output)
+        job_manager.onChange.append(self.jobChanged)
+        self.progress_timer = eTimer()
         try:
-            from Components.About import getEnigmaVersionString
-            with open(ENIGMA2VERSIONFILE, 'w') as f:
-                f.write(getEnigmaVersionString())
-        except BaseException:
-            pass
+            self.progress_timer.callback.append(self.updateProgress)
+        except AttributeError:
+            self.progress_timer_conn = self.progress_timer.timeout.connect(self.updateProgress)
+        self.progress_timer.start(1000, False)
+        self.onClose.append(self.detach)
+        self.onLayoutFinish.append(self.layoutFinished)
+
+    def layoutFinished(self):
+        self["text"].lastPage()
+        self.jobChanged(self.job)
+
+    def detach(self):
+        self.progress_timer.stop()
+        if self.output in self.job.onOutput:
+            self.job.onOutput.remove(self.output)
+        if self.jobChanged in job_manager.onChange:
+            job_manager.onChange.remove(self.jobChanged)
+
+    def output(self, job, text):
+        self["text"].appendText(text)
+        self["text"].lastPage()
+
+    def jobChanged(self, job):
+        if job is not self.job:
+            return
+        self["key_red"].setText(_("Cancel backup") if job.active else "")
+        if job.status == BackupJob.WAITING:
+            self["progress_text"].setText(_("Waiting for the running backup to finish"))
+        elif not job.active:
+            self["progress"].setValue(100 if job.status == BackupJob.DONE else 0)
+            self["progress_text"].setText({
+                BackupJob.DONE: _("Backup finished"),
+                BackupJob.FAILED: _("Backup failed"),
+                BackupJob.CANCELLED: _("Backup cancelled"),
+            }[job.status])
+
+    def keyCancelJob(self):
+        if self.job.active:
+            self.session.openWithCallback(
+                self.cancelConfirmed, MessageBox,
+                _("Cancel this backup? Everything made so far is removed."), MessageBox.TYPE_YESNO)
 
-    def console_closed(self, retval=None):
-        """Handle backup process completion and show errors if any."""
-        if retval is not None and retval != 0:
-            error_msg = ""
-            try:
-                with open(LOGFILE, "r") as f:
-                    log_content = f.read()
-
-                if "No space left" in log_content:
-                    error_msg = _(
-                        "Backup failed: Not enough free space on device!")
-                elif "Permission denied" in log_content:
-                    error_msg = _("Backup failed: Write permission denied!")
-                elif "Read-only file system" in log_content:
-                    error_msg = _("Backup failed: Device is read-only!")
-                elif "No such file or directory" in log_content:
-                    error_msg = _("Backup failed: Required files not found!")
-                elif "Connection refused" in log_content or "Host is down" in log_content:
-                    error_msg = _("Backup failed: Network connection lost!")
-                else:
-                    lines = log_content.splitlines()
-                    last_lines = "\n".join(
-                        lines[-5:]) if len(lines) > 5 else log_content
-                    error_msg = _("Backup failed! Last errors:") + \
-                        "\n" + last_lines
+    def cancelConfirmed(self, answer):
+        if answer:
+            job_manager.cancel(self.job)
 
-            except Exception as e:
-                print("[BackupSuite] Error reading log: {0}".format(str(e)))
-                error_msg = _("Backup failed! Check log: {0}").format(LOGFILE)
+    def updateProgress(self):
+        if self.job.status != BackupJob.RUNNING:
+            return
+        status = read_status()
+        if status is None:
+            self["progress_text"].setText("")
+            return
+        self["progress"].setValue(percent(status))
+        text = self.PHASES.get(status.get("phase"), status.get("phase", ""))
+        if status.get("expected"):
+            text += ": {0} / {1} MB".format(status["done"] // 1048576, status["expected"] // 1048576)
+        if status.get("speed"):
+            text += ", {0} KB/s".format(status["speed"] // 1024)
+        if status.get("eta") is not None:
+            text += ", " + _("{0}:{1:02d} min left").format(status["eta"] // 60, status["eta"] % 60)
+        self["progress_text"].setText(text)
+
+
+class BackupSetup(ConfigListScreen, Screen):
+    """Settings of the plugin: scheduled backups and how hard a backup may load the box."""
+
+    skin = """
+        <screen position="center,center" size="800,400" title="Backup Suite settings">
+            <widget name="config" position="10,10" size="780,330" scrollbarMode="showOnDemand" />
+            <ePixmap position="10,360" size="35,25" pixmap="skin_default/buttons/red.png" zPosition="1" alphatest="on" />
+            <widget source="key_red" render="Label" position="50,360" size="200,25" zPosition="2" font="Regular;20" halign="left" valign="center" transparent="1" />
+            <ePixmap position="270,360" size="35,25" pixmap="skin_default/buttons/green.png" zPosition="1" alphatest="on" />
+            <widget source="key_green" render="Label" position="310,360" size="200,25" zPosition="2" font="Regular;20" halign="left" valign="center" transparent="1" />
+        </screen>"""
 
-            self.session.open(
-                MessageBox,
-                error_msg,
-                MessageBox.TYPE_ERROR,
-                timeout=30
-            )
+    def __init__(self, session):
+        Screen.__init__(self, session)
+        self.setTitle(_("Backup Suite settings"))
+        self.values = settings.load()
+        times = ["{0:02d}:{1:02d}".format(hour, minute) for hour in range(24) for minute in (0, 30)]
+        if self.values["schedule_time"] not in times:
+            times.append(self.values["schedule_time"])
+        targets = [(dev["path"], "{0} ({1})".format(dev["desc"], dev["path"])) for dev in get_available_backup_devices()]
+        targets += [(share["mountpoint"], "{0} ({1})".format(share["server"], share["mountpoint"]))
+                    for share in get_mounted_network_shares()]
+        if self.values["schedule_target"] not in [path for path, desc in targets]:
+            targets.append((self.values["schedule_target"], self.values["schedule_target"] or _("none")))
+        self.schedule = ConfigSelection(default=self.values["schedule"], choices=[
+            ("off", _("off")),
+            ("daily", _("daily")),
+            ("weekly", _("weekly")),
+            ("upgrade", _("after software updates"))])
+        self.time = ConfigSelection(default=self.values["schedule_time"], choices=times)
+        self.weekday = ConfigSelection(default=self.values["schedule_weekday"], choices=[
+            ("0", _("Monday")),
+            ("1", _("Tuesday")),
+            ("2", _("Wednesday")),
+            ("3", _("Thursday")),
+            ("4", _("Friday")),
+            ("5", _("Saturday")),
+            ("6", _("Sunday"))])
+        self.target = ConfigSelection(default=self.values["schedule_target"], choices=targets)
+        self.skip_unchanged = ConfigYesNo(default=self.values["schedule_skip_unchanged"] == "yes")
+        self.governor = ConfigSelection(default=self.values["governor"], choices=[
+            ("fast", _("fast, full priority")),
+            ("normal", _("normal, lower priority")),
+            ("background", _("background, lowest priority and limited writes"))])
+        self.webapi = ConfigYesNo(default=self.values["webapi"] == "yes")
+        keep = [("0", _("all"))] + [(str(n), str(n)) for n in (1, 2, 3, 5, 10)]
+        if self.values["retention_keep"] not in [value for value, desc in keep]:
+            keep.append((self.values["retention_keep"], self.values["retention_keep"]))
+        self.keep = ConfigSelection(default=self.values["retention_keep"], choices=keep)
+        self.make_room = ConfigYesNo(default=self.values["retention_make_room"] == "yes")
+        self.schedule.addNotifier(self.createSetup, initial_call=False)
+        ConfigListScreen.__init__(self, [], session=session)
+        self["key_red"] = StaticText(_("Cancel"))
+        self["key_green"] = StaticText(_("Save"))
+        self["actions"] = ActionMap(
+            ["SetupActions", "ColorActions"],
+            {
+                "red": self.keyCancel,
+                "green": self.keySave,
+                "save": self.keySave,
+                "cancel": self.keyCancel,
+                "ok": self.keySave
+            }, -2
+        )
+        self.createSetup()
+
+    def createSetup(self, configElement=None):
+        entries = [
+            getConfigListEntry(_("Backup priority"), self.governor),
+            getConfigListEntry(_("Web API in OpenWebif (after a restart)"), self.webapi),
+            getConfigListEntry(_("Backups kept per receiver"), self.keep),
+            getConfigListEntry(_("Remove the oldest backups when space runs out"), self.make_room),
+            getConfigListEntry(_("Automatic backup"), self.schedule)]
+        if self.schedule.value != "off":
+            if self.schedule.value in ("daily", "weekly"):
+                entries.append(getConfigListEntry(_("Time"), self.time))
+            if self.schedule.value == "weekly":
+                entries.append(getConfigListEntry(_("Day"), self.weekday))
+            entries.append(getConfigListEntry(_("Backup to"), self.target))
+            entries.append(getConfigListEntry(_("Skip when nothing changed"), self.skip_unchanged))
+        self["config"].list = entries
+
+    def keySave(self):
+        changed = (self.schedule.value, self.time.value, self.weekday.value) != (
+            self.values["schedule"], self.values["schedule_time"], self.values["schedule_weekday"])
+        self.values.update(
+            schedule=self.schedule.value,
+            schedule_time=self.time.value,
+            schedule_weekday=self.weekday.value,
+            schedule_target=self.target.value,
+            schedule_skip_unchanged="yes" if self.skip_unchanged.value else "no",
+            governor=self.governor.value,
+            webapi="yes" if self.webapi.value else "no",
+            retention_keep=self.keep.value,
+            retention_make_room="yes" if self.make_room.value else "no")
+        try:
+            settings.save(self.values)
+            if changed:
+                # The first backup is at the next slot, not the one just gone
+                state = scheduler.read_state()
+                state["last_check"] = time()
+                scheduler.write_state(state)
+        except (IOError, OSError) as e:
+            self.session.open(MessageBox, _("Could not save the settings: {0}").format(str(e)), MessageBox.TYPE_ERROR)
+            return
+        self.close()
 
-    def cancel(self):
-        self.close(False, self.session)
+    def keyCancel(self):
+        self.close()
+
+
+class ImageVerify(Screen):
+    """Check the backup folder in the background before anything is flashed."""
+
+    def __init__(self, session, folder):
+        self.skin = """
+        <screen position="center,center" size="700,400" title="Verify backup">
+            <widget source="status" render="Label" position="20,20" size="660,40" font="Regular;24" />
+            <widget name="progress" position="20,70" size="660,20" borderWidth="1" />
+            <widget name="details" position="20,110" size="660,240" font="Regular;20" />
+            <ePixmap position="20,360" size="35,25" pixmap="skin_default/buttons/red.png" zPosition="1" alphatest="on" />
+            <widget source="key_red" render="Label" position="60,360" size="200,25" zPosition="2" font="Regular;20" halign="left" valign="center" transparent="1" />
+            <ePixmap position="280,360" size="35,25" pixmap="skin_default/buttons/green.png" zPosition="1" alphatest="on" />
+            <widget source="key_green" render="Label" position="320,360" size="200,25" zPosition="2" font="Regular;20" halign="left" valign="center" transparent="1" />
+        </screen>"""
+
+        Screen.__init__(self, session)
+        self.folder = folder
+        self.setTitle(_("Verify backup"))
+        self["status"] = StaticText(_("Checking {0} ...").format(basename(folder.rstrip("/"))))
+        self["progress"] = ProgressBar()
+        self["details"] = ScrollLabel()
+        self["key_red"] = StaticText(_("Cancel"))
+        self["key_green"] = StaticText("")
+        self["actions"] = ActionMap(
+            ["SetupActions", "ColorActions", "DirectionActions"],
+            {
+                "red": self.keyCancel,
+                "cancel": self.keyCancel,
+                "green": self.keyContinue,
+                "ok": self.keyContinue,
+                "up": self["details"].pageUp,
+                "down": self["details"].pageDown
+            }
+        )
+        self.running = False
+        self.finished = False
+        self.buffer = ""
+        self.errors = []
+        self.container = eConsoleAppContainer()
+        try:
+            self.container.appClosed.append(self.runFinished)
+            self.container.dataAvail.append(self.dataAvail)
+        except AttributeError:
+            self.appClosed_conn = self.container.appClosed.connect(self.runFinished)
+            self.dataAvail_conn = self.container.dataAvail.connect(self.dataAvail)
+        self.onLayoutFinish.append(self.startVerify)
+
+    def startVerify(self):
+        helper = get_helper("imageverify")
+        if not helper:
+            # Nothing to check with, the flash options come as before
+            self.close(True)
+            return
+        print("[BackupSuite] Verifying backup: {0} {1}".format(helper, self.folder))
+        self["progress"].setValue(0)
+        self.running = True
+        # No shell in between, the helper gets the SIGTERM on cancel itself
+        if self.container.execute(PYTHON_BIN, PYTHON_BIN, helper, self.folder):
+            self.runFinished(-1)
+
+    def dataAvail(self, data):
+        if isinstance(data, bytes):
+            data = data.decode("utf-8", "ignore")
+        self.buffer += data
+        while "\n" in self.buffer:
+            line, self.buffer = self.buffer.split("\n", 1)
+            self.parseLine(line.strip())
+
+    def parseLine(self, line):
+        if line.startswith("PROGRESS "):
+            try:
+                self["progress"].setValue(int(line.split()[1]))
+            except ValueError:
+                pass
+        elif line.startswith("ERROR "):
+            self.errors.append(line[6:])
+            self["details"].setText("\n".join(self.errors))
+        elif line.startswith("OK ") or line.startswith("FAIL "):
+            print("[BackupSuite] Verify result: {0}".format(line))
+
+    def runFinished(self, retval):
+        if not self.running:
+            return  # cancelled, the screen is gone
+        self.running = False
+        self.finished = True
+        if self.buffer:
+            self.parseLine(self.buffer.strip())
+            self.buffer = ""
+        if retval == 0:
+            self["progress"].setValue(100)
+            self.close(True)
+            return
+        if not self.errors:
+            self.errors.append(_("The check could not be run (exit code {0})").format(retval))
+        self["status"].setText(_("The backup failed the check, flashing it is not recommended!"))
+        self["details"].setText("\n".join(self.errors))
+        self["key_red"].setText(_("Close"))
+        self["key_green"].setText(_("Flash anyway"))
+
+    def keyContinue(self):
+        if self.finished and self["key_green"].getText():
+            self.close(True)
+
+    def keyCancel(self):
+        if self.running:
+            self.running = False
+            try:
+                # It stops its worker processes on SIGTERM, not on SIGKILL
+                os_kill(self.container.getPID(), SIGTERM)
+            except Exception:
+                self.container.kill()
+        self.close(False)
 
 
 class FlashImageConfig(Screen):
@@ -935,8 +1272,9 @@ class FlashImageConfig(Screen):
         self["key_blue"] = StaticText("")
         self["curdir"] = StaticText(_("current:  {0}").format(curdir or ''))
         self.founds = False
-        self.dualboot = is_dual_boot()
-        self.ForceMode = requires_force_mode()
+        self.profile = get_profile()
+        self.dualboot = self.profile.dual_boot
+        self.ForceMode = self.profile.force_mode
 
         if matchingPattern:
             original_extensions = matchingPattern.split("(")[-1].rstrip(")$")
@@ -1011,6 +1349,13 @@ class FlashImageConfig(Screen):
     def confirmedWarning(self, result):
         if result:
             self.founds = False
+            self.session.openWithCallback(
+                self.verifyClosed,
+                ImageVerify,
+                self.getCurrentSelected())
+
+    def verifyClosed(self, result=False):
+        if result:
             self.showparameterlist()
 
     def get_current_selected(self):
@@ -1044,259 +1389,14 @@ class FlashImageConfig(Screen):
         """
         Display parameters and required files information for flashing, depending on the box model.
         """
-        if self["key_green"].getText() == _("Run flash"):
+        if self["key_green"].getText() == _("Flash"):
             dirname = self.getCurrentSelected()
-            model = get_box_type()
             if dirname:
-                backup_files = []
-                no_backup_files = []
+                backup_files = self.profile.required_files
+                no_backup_files = self.profile.forbidden_files
                 text = _("Select parameter for start flash!\n")
                 text += _('For flashing your receiver files are needed:\n')
-                if exists('/var/lib/dpkg/info'):
-                    if "dm9" in model:
-                        backup_files = [("kernel.bin"), ("rootfs.tar.bz2")]
-                        no_backup_files = [
-                            ("kernel_cfe_auto.bin"),
-                            ("rootfs.bin"),
-                            ("root_cfe_auto.jffs2"),
-                            ("root_cfe_auto.bin"),
-                            ("oe_kernel.bin"),
-                            ("oe_rootfs.bin"),
-                            ("kernel_auto.bin"),
-                            ("uImage"),
-                            ("rootfs.ubi")]
-                        text += "kernel.bin, rootfs.tar.bz2"
-                    elif model in ("dm520", "dm7080", "dm820"):
-                        backup_files = [("*.xz")]
-                        no_backup_files = [
-                            ("kernel_cfe_auto.bin"),
-                            ("rootfs.bin"),
-                            ("root_cfe_auto.jffs2"),
-                            ("root_cfe_auto.bin"),
-                            ("oe_kernel.bin"),
-                            ("oe_rootfs.bin"),
-                            ("kernel_auto.bin"),
-                            ("kernel.bin"),
-                            ("rootfs.tar.bz2"),
-                            ("uImage"),
-                            ("rootfs.ubi")]
-                        text += "*.xz"
-                    else:
-                        backup_files = [("*.nfi")]
-                        no_backup_files = [
-                            ("kernel_cfe_auto.bin"),
-                            ("rootfs.bin"),
-                            ("root_cfe_auto.jffs2"),
-                            ("root_cfe_auto.bin"),
-                            ("oe_kernel.bin"),
-                            ("oe_rootfs.bin"),
-                            ("kernel_auto.bin"),
-                            ("kernel.bin"),
-                            ("rootfs.tar.bz2"),
-                            ("uImage"),
-                            ("rootfs.ubi")]
-                        text += "*.nfi"
-                elif model.startswith("gb"):
-                    if "4k" not in model:
-                        backup_files = [("kernel.bin"), ("rootfs.bin")]
-                        no_backup_files = [
-                            ("kernel_cfe_auto.bin"),
-                            ("root_cfe_auto.jffs2"),
-                            ("root_cfe_auto.bin"),
-                            ("oe_kernel.bin"),
-                            ("oe_rootfs.bin"),
-                            ("rootfs.tar.bz2"),
-                            ("kernel_auto.bin"),
-                            ("uImage"),
-                            ("rootfs.ubi")]
-                        text += "kernel.bin, rootfs.bin"
-                    else:
-                        backup_files = [("kernel.bin"), ("rootfs.tar.bz2")]
-                        no_backup_files = [
-                            ("kernel_cfe_auto.bin"),
-                            ("rootfs.bin"),
-                            ("root_cfe_auto.jffs2"),
-                            ("root_cfe_auto.bin"),
-                            ("oe_kernel.bin"),
-                            ("oe_rootfs.bin"),
-                            ("kernel_auto.bin"),
-                            ("uImage"),
-                            ("rootfs.ubi")]
-                        text += "kernel.bin, rootfs.tar.bz2"
-                elif model.startswith("vu"):
-                    if "4k" in model:
-                        backup_files = [
-                            ("kernel_auto.bin"), ("rootfs.tar.bz2")]
-                        no_backup_files = [
-                            ("kernel_cfe_auto.bin"),
-                            ("rootfs.bin"),
-                            ("root_cfe_auto.jffs2"),
-                            ("root_cfe_auto.bin"),
-                            ("oe_kernel.bin"),
-                            ("oe_rootfs.bin"),
-                            ("kernel.bin"),
-                            ("uImage"),
-                            ("rootfs.ubi")]
-                        text += "kernel_auto.bin, rootfs.tar.bz2"
-                    elif model in ("vuduo2", "vusolose", "vusolo2", "vuzero"):
-                        backup_files = [
-                            ("kernel_cfe_auto.bin"), ("root_cfe_auto.bin")]
-                        no_backup_files = [
-                            ("rootfs.bin"),
-                            ("root_cfe_auto.jffs2"),
-                            ("oe_kernel.bin"),
-                            ("oe_rootfs.bin"),
-                            ("kernel.bin"),
-                            ("rootfs.tar.bz2"),
-                            ("kernel_auto.bin"),
-                            ("uImage"),
-                            ("rootfs.ubi")]
-                        text += "kernel_cfe_auto.bin, root_cfe_auto.bin"
-                    else:
-                        backup_files = [
-                            ("kernel_cfe_auto.bin"),
-                            ("root_cfe_auto.jffs2")]
-                        no_backup_files = [
-                            ("rootfs.bin"),
-                            ("root_cfe_auto.bin"),
-                            ("oe_kernel.bin"),
-                            ("oe_rootfs.bin"),
-                            ("kernel.bin"),
-                            ("rootfs.tar.bz2"),
-                            ("kernel_auto.bin"),
-                            ("uImage"),
-                            ("rootfs.ubi")]
-                        text += "kernel_cfe_auto.bin, root_cfe_auto.jffs2"
-
-                else:
-                    if model in (
-                        "hd51",
-                        "h7",
-                        "sf4008",
-                        "sf5008",
-                        "sf8008",
-                        "sf8008m",
-                        "vs1500",
-                        "et11000",
-                        "et13000",
-                        "bre2ze4k",
-                        "spycat4k",
-                        "spycat4kmini",
-                        "protek4k",
-                        "e4hdultra",
-                        "arivacombo",
-                        "arivatwin",
-                        "dual") or model.startswith(
-                        ("anadol",
-                         "axashis4",
-                         "dinobot4",
-                         "ferguson4",
-                         "mediabox4",
-                         "axashisc4")):
-                        backup_files = [("kernel.bin"), ("rootfs.tar.bz2")]
-                        no_backup_files = [
-                            ("kernel_cfe_auto.bin"),
-                            ("rootfs.bin"),
-                            ("root_cfe_auto.jffs2"),
-                            ("root_cfe_auto.bin"),
-                            ("oe_kernel.bin"),
-                            ("oe_rootfs.bin"),
-                            ("kernel_auto.bin"),
-                            ("uImage"),
-                            ("rootfs.ubi")]
-                        text += "kernel.bin, rootfs.tar.bz2"
-                    elif model in ("h9", "h9se", "h9combo", "h9combose", "i55plus", "i55se", "h10", "hzero", "h8", "dinobotu55", "iziboxx3", "dinoboth265", "axashistwin", "protek4kx1"):
-                        backup_files = [("uImage"), ("rootfs.ubi")]
-                        no_backup_files = [
-                            ("kernel_cfe_auto.bin"),
-                            ("root_cfe_auto.jffs2"),
-                            ("root_cfe_auto.bin"),
-                            ("oe_kernel.bin"),
-                            ("oe_rootfs.bin"),
-                            ("rootfs.tar.bz2"),
-                            ("kernel_auto.bin"),
-                            ("kernel.bin"),
-                            ("rootfs.tar.bz2")]
-                        text += "uImage, rootfs.ubi"
-                    elif model in ("hd60", "hd61", "multibox", "multiboxse", "multiboxplus", "pulse4k", "pulse4kmini"):
-                        backup_files = [("uImage"), ("rootfs.tar.bz2")]
-                        no_backup_files = [
-                            ("kernel_cfe_auto.bin"),
-                            ("root_cfe_auto.jffs2"),
-                            ("root_cfe_auto.bin"),
-                            ("oe_kernel.bin"),
-                            ("oe_rootfs.bin"),
-                            ("rootfs.ubi"),
-                            ("kernel_auto.bin"),
-                            ("kernel.bin")]
-                        text += "uImage, rootfs.tar.bz2"
-                    elif model.startswith(("et4", "et5", "et6", "et7", "et8", "et9", "et10")):
-                        backup_files = [("kernel.bin"), ("rootfs.bin")]
-                        no_backup_files = [
-                            ("kernel_cfe_auto.bin"),
-                            ("root_cfe_auto.jffs2"),
-                            ("root_cfe_auto.bin"),
-                            ("oe_kernel.bin"),
-                            ("oe_rootfs.bin"),
-                            ("rootfs.tar.bz2"),
-                            ("kernel_auto.bin"),
-                            ("uImage"),
-                            ("rootfs.ubi")]
-                        text += "kernel.bin, rootfs.bin"
-                    elif model.startswith("ebox"):
-                        backup_files = [
-                            ("kernel_cfe_auto.bin"),
-                            ("root_cfe_auto.jffs2")]
-                        no_backup_files = [
-                            ("rootfs.bin"),
-                            ("root_cfe_auto.bin"),
-                            ("oe_kernel.bin"),
-                            ("oe_rootfs.bin"),
-                            ("kernel.bin"),
-                            ("rootfs.tar.bz2"),
-                            ("kernel_auto.bin"),
-                            ("uImage"),
-                            ("rootfs.ubi")]
-                        text += "kernel_cfe_auto.bin, root_cfe_auto.jffs2"
-                    elif model.startswith(("fusion", "pure", "optimus", "force", "iqon", "ios", "tm2", "tmn", "tmt", "tms", "lunix", "mediabox", "vala")):
-                        backup_files = [("oe_kernel.bin"), ("oe_rootfs.bin")]
-                        no_backup_files = [
-                            ("kernel_cfe_auto.bin"),
-                            ("rootfs.bin"),
-                            ("root_cfe_auto.jffs2"),
-                            ("root_cfe_auto.bin"),
-                            ("kernel.bin"),
-                            ("rootfs.tar.bz2"),
-                            ("kernel_auto.bin"),
-                            ("uImage"),
-                            ("rootfs.ubi")]
-                        text += "oe_kernel.bin, oe_rootfs.bin"
-                    elif "4k" or "uhd" in model:
-                        backup_files = [("oe_kernel.bin"), ("rootfs.tar.bz2")]
-                        no_backup_files = [
-                            ("kernel_cfe_auto.bin"),
-                            ("rootfs.bin"),
-                            ("root_cfe_auto.jffs2"),
-                            ("root_cfe_auto.bin"),
-                            ("oe_rootfs.bin"),
-                            ("kernel.bin"),
-                            ("kernel_auto.bin"),
-                            ("uImage"),
-                            ("rootfs.ubi")]
-                        text += "oe_kernel.bin, rootfs.tar.bz2"
-                    else:
-                        backup_files = [("kernel.bin"), ("rootfs.bin")]
-                        no_backup_files = [
-                            ("kernel_cfe_auto.bin"),
-                            ("root_cfe_auto.jffs2"),
-                            ("root_cfe_auto.bin"),
-                            ("oe_kernel.bin"),
-                            ("oe_rootfs.bin"),
-                            ("rootfs.tar.bz2"),
-                            ("kernel_auto.bin"),
-                            ("uImage"),
-                            ("rootfs.ubi")]
-                        text += "kernel.bin, rootfs.bin"
+                text += ", ".join(backup_files)
                 try:
                     self.founds = False
                     text += _('\nThe found files:')
@@ -1588,6 +1688,38 @@ class WhatisNewInfo(Screen):
             self["AboutScrollLabel"].setText(_("Change log not available"))
 
 
+def sessionstart(reason, session=None, **kwargs):
+    """Start the backup scheduler with the enigma2 session."""
+    global autoStartTimer, _session
+    if reason == 0 and session is not None and autoStartTimer is None:
+        _session = session
+        autoStartTimer = BackupScheduler(session)
+        if settings.get("webapi") == "yes":
+            add_web_api()
+
+
+def web_command(target, lang):
+    """Shell command of a backup started over the web API."""
+    write_enigma2_version()
+    return backup_command(target["script"], target["type"], target["media"], lang)
+
+
+def add_web_api():
+    """Make the HTTP API (webapi.py) part of OpenWebif as /backupsuite."""
+    # Anyone reaching OpenWebif could start backups and download the rootfs
+    if not settings.get("webapi_token"):
+        print("[BackupSuite] No web API: webapi_token is not set")
+        return
+    try:
+        from Plugins.Extensions.OpenWebif.WebChilds.Toplevel import addExternalChild
+        from .webapi import BackupAPI
+    except ImportError as e:
+        print("[BackupSuite] No web API: {0}".format(str(e)))
+        return
+    addExternalChild(("backupsuite", BackupAPI(job_manager, web_command), "BackupSuite", VERSION, False))
+    print("[BackupSuite] Web API added to OpenWebif as /backupsuite")
+
+
 def main(session, **kwargs):
     print("[BackupSuite] Starting plugin...")
     if requires_openpli_fix():
@@ -1621,5 +1753,9 @@ def Plugins(path, **kwargs):
             description=description,
             where=PluginDescriptor.WHERE_EXTENSIONSMENU,
             fnc=main
+        ),
+        PluginDescriptor(
+            where=PluginDescriptor.WHERE_SESSIONSTART,
+            fnc=sessionstart
         )
     ]
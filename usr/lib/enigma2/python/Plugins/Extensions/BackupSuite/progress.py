@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+
+"""
+Progress of the running backup, for the screens.
+
+The scripts print fixed milestones ("Creating root filesystem (50%)") and
+nothing during the long phases. Here the bytes going through a phase are
+counted, and the expected total, the speed and the time left are written to
+a small status file, at most once a second. BackupConsole in plugin.py reads
+it and shows a progress bar.
+
+    progress.py phase PHASE [EXPECTEDKB]
+        A phase starts, nothing is done yet.
+
+    progress.py meter PHASE EXPECTEDKB
+        Copy stdin to stdout and count the bytes, for a pipe.
+
+    progress.py watch PHASE FILE EXPECTEDKB --pid PID
+        Follow the size of FILE while process PID writes it, returns when
+        the process has ended.
+
+    progress.py done
+        Remove the status file, the backup is over.
+"""
+
+from __future__ import print_function
+import argparse
+import errno
+import json
+import os
+import sys
+import time
+
+STATUS = "/tmp/BackupSuite.progress"
+INTERVAL = 1.0
+BLOCK = 256 * 1024
+
+
+class ProgressWriter(object):
+    """Writes the status of one phase, not more often than every interval seconds."""
+
+    def __init__(self, phase, expected, path=STATUS, interval=INTERVAL):
+        self.phase = phase
+        self.expected = expected
+        self.path = path
+        self.interval = interval
+        self.start = time.time()
+        self.last = 0
+        self.done = 0
+
+    def update(self, done, force=False):
+        self.done = done
+        now = time.time()
+        if force or now - self.last >= self.interval:
+            self.last = now
+            self.write(now)
+
+    def write(self, now=None):
+        now = now or time.time()
+        elapsed = now - self.start
+        speed = self.done / elapsed if elapsed > 0 else 0
+        eta = None
+        if speed and self.expected:
+            eta = int(max(self.expected - self.done, 0) / speed)
+        status = {
+            "phase": self.phase,
+            "done": self.done,
+            "expected": self.expected,
+            "speed": int(speed),
+            "eta": eta,
+            "time": int(now),
+        }
+        tmp = "{0}.{1}.tmp".format(self.path, os.getpid())
+        try:
+            with open(tmp, "w") as f:
+                json.dump(status, f)
+            os.rename(tmp, self.path)
+        except (IOError, OSError):
+            pass  # The backup goes on without progress
+
+
+def read_status(path=STATUS):
+    """The status dict of the running phase, None when there is none."""
+    try:
+        with open(path, "r") as f:
+            status = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    return status if isinstance(status, dict) else None
+
+
+def percent(status):
+    if not status or not status.get("expected"):
+        return 0
+    return min(100, int(status["done"] * 100 / status["expected"]))
+
+
+def meter(writer, source=0, target=1):
+    """Copy fd source to fd target, counting the bytes for writer."""
+    done = 0
+    while True:
+        data = os.read(source, BLOCK)
+        if not data:
+            break
+        while data:
+            try:
+                written = os.write(target, data)
+            except OSError as e:
+                if e.errno == errno.EPIPE:
+                    writer.update(done, force=True)
+                    return 1
+                raise
+            data = data[written:]
+            done += written
+        writer.update(done)
+    writer.update(done, force=True)
+    return 0
+
+
+def _running(pid):
+    try:
+        with open("/proc/{0}/stat".format(pid), "r") as f:
+            # The state follows the name in brackets, Z is a finished process
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except (IOError, OSError, IndexError):
+        return False
+
+
+def watch(writer, path, pid):
+    while _running(pid):
+        try:
+            writer.update(os.path.getsize(path))
+        except OSError:
+            pass
+        time.sleep(writer.interval)
+    try:
+        writer.update(os.path.getsize(path), force=True)
+    except OSError:
+        pass
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="BackupSuite progress status")
+    sub = parser.add_subparsers(dest="command")
+    p = sub.add_parser("phase")
+    p.add_argument("phase")
+    p.add_argument("expected_kb", type=int, nargs="?", default=0)
+    p = sub.add_parser("meter")
+    p.add_argument("phase")
+    p.add_argument("expected_kb", type=int)
+    p = sub.add_parser("watch")
+    p.add_argument("phase")
+    p.add_argument("file")
+    p.add_argument("expected_kb", type=int)
+    p.add_argument("--pid", type=int, required=True)
+    sub.add_parser("done")
+    args = parser.parse_args(argv)
+
+    if args.command == "done":
+        try:
+            os.remove(STATUS)
+        except OSError:
+            pass
+        return 0
+    if args.command is None:
+        parser.print_usage(sys.stderr)
+        return 2
+    writer = ProgressWriter(args.phase, args.expected_kb * 1024)
+    if args.command == "phase":
+        writer.update(0, force=True)
+        return 0
+    if args.command == "meter":
+        return meter(writer)
+    return watch(writer, args.file, args.pid)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+
+"""
+Receiver database compiled from lookuptable.txt.
+
+The lookuptable is meant to have ten tab separated columns after the brand
+(MODEL, SHOWNAME, FOLDER, EXTR1, EXTR2, MKUBIFS_ARGS, UBINIZE_ARGS, ROOTNAME,
+KERNELNAME, ACTION), but many rows mix tabs and spaces, so cutting a column
+by number gives the wrong field. The rows are parsed from the right instead,
+where the fields have a recognisable shape (action, kernel and root names,
+the mkfs options, the paths), and the model is picked out of the remaining
+text. Every row is checked, a row that can't be read is reported and left
+out instead of producing a broken image.
+
+The result is written as one line per model, fields separated by "|", so
+the scripts get all the fields of a model with a single grep:
+
+    model|brand|showname|folder|extr1|extr2|mkubifs|ubinize|rootname|kernelname|action
+
+    receiverdb.py compile DB TABLE [TABLE...]
+        Write the database, for a model present in several tables the first
+        table wins (pass /etc/lookuptable.txt first).
+
+    receiverdb.py show MODEL [TABLE...]
+        Print the fields of MODEL, exit code 1 when it's not supported.
+
+    receiverdb.py check [TABLE...]
+        Report the rows that can't be read and the duplicate models.
+"""
+
+from __future__ import print_function
+import argparse
+import os
+import re
+import sys
+from collections import namedtuple
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    OrderedDict = dict
+
+PLUGIN_DIR = os.path.dirname(os.path.abspath(__file__))
+TABLE = os.path.join(PLUGIN_DIR, "lookuptable.txt")
+USER_TABLE = "/etc/lookuptable.txt"
+DATABASE = os.path.join(PLUGIN_DIR, "receivers.db")
+
+FIELDS = (
+    "model", "brand", "showname", "folder", "extr1", "extr2",
+    "mkubifs_args", "ubinize_args", "rootname", "kernelname", "action",
+)
+SEPARATOR = "|"
+
+ACTIONS = ("none", "noforce", "force", "reboot")
+ROOTNAMES = (
+    "rootfs.bin", "rootfs.tar.bz2", "rootfs.ubi", "oe_rootfs.bin",
+    "root_cfe_auto.bin", "root_cfe_auto.jffs2",
+)
+KERNELNAMES = ("kernel.bin", "kernel_auto.bin", "kernel_cfe_auto.bin", "oe_kernel.bin", "uImage")
+
+_MODEL = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._+-]*$")
+_OPTION_VALUE = re.compile(r"^\d+(KiB|MiB)?$")
+_PATH = re.compile(r"^(/[\w.+-]+)+$")
+
+Receiver = namedtuple("Receiver", FIELDS)
+
+
+class ReceiverError(Exception):
+    pass
+
+
+def _is_option(token):
+    return token.startswith("-") or _OPTION_VALUE.match(token) is not None
+
+
+def _split_options(options):
+    """Split the option tokens in the mkfs.ubifs and the ubinize part."""
+    if not options:
+        return "", ""
+    starts = [i for i, token in enumerate(options) if token == "-m"]
+    if len(starts) < 2 or "-p" not in options[starts[-1]:]:
+        raise ReceiverError("can't tell mkfs.ubifs from ubinize options: " + " ".join(options))
+    return " ".join(options[:starts[-1]]), " ".join(options[starts[-1]:])
+
+
+def _pick_model(groups):
+    """Split the text in front of the paths into brand, model and showname.
+
+    groups are the tab separated parts of the text, each a list of words.
+    Normally it's brand, model, showname, but often a tab is a space, so
+    every word is tried as the model and scored: a tab next to it (before
+    it most of all, that's where the column is), being lowercase and
+    brand == showname around it make it likely.
+    """
+    words = []
+    for group in groups:
+        for i, word in enumerate(group):
+            words.append((word, i == 0, i == len(group) - 1))
+    best = None
+    for i, (word, first, last) in enumerate(words):
+        if not _MODEL.match(word) or i == 0 and len(words) > 1:
+            continue
+        brand = " ".join(w[0] for w in words[:i])
+        showname = " ".join(w[0] for w in words[i + 1:])
+        score = 0
+        if first and i > 0:
+            score += 2
+        if last and i < len(words) - 1:
+            score += 1.5
+        if word.lower() == word and re.search("[a-z]", word):
+            score += 1
+        if brand.lower() == showname.lower():
+            score += 2
+        if best is None or score > best[0]:
+            best = (score, brand, word, showname)
+    if best is None:
+        raise ReceiverError("no model found")
+    return best[1], best[2], best[3] or best[1]
+
+
+def parse_line(line):
+    """Return the Receiver of one lookuptable row, raises ReceiverError."""
+    tokens = [(m.group(), m.start()) for m in re.finditer(r"\S+", line)]
+    if len(tokens) < 5:
+        raise ReceiverError("too few fields")
+    action, kernelname, rootname = tokens[-1][0], tokens[-2][0], tokens[-3][0]
+    if action not in ACTIONS:
+        raise ReceiverError("unknown action " + action)
+    if kernelname not in KERNELNAMES:
+        raise ReceiverError("unknown kernel name " + kernelname)
+    if rootname not in ROOTNAMES:
+        raise ReceiverError("unknown root name " + rootname)
+
+    end = len(tokens) - 3
+    start = end
+    while start > 0 and _is_option(tokens[start - 1][0]):
+        start -= 1
+    mkubifs_args, ubinize_args = _split_options([t[0] for t in tokens[start:end]])
+    if rootname != "rootfs.tar.bz2" and not ubinize_args and rootname.endswith(".bin"):
+        raise ReceiverError("{0} without mkfs.ubifs options".format(rootname))
+
+    paths = []
+    while start > 0:
+        token, offset = tokens[start - 1]
+        if _PATH.match(token):
+            paths.insert(0, token)
+            start -= 1
+            continue
+        # A missing tab between showname and folder: "ET7000 mini/et7x00"
+        slash = token.find("/")
+        if slash > 0 and _PATH.match(token[slash:]):
+            paths.insert(0, token[slash:])
+            textend = offset + slash
+        else:
+            textend = offset + len(token)
+        break
+    else:
+        textend = 0
+    if not paths:
+        raise ReceiverError("no folder")
+    backup = [i for i, path in enumerate(paths) if path.startswith("/fullbackup")]
+    if len(backup) != 1 or backup[0] > 1 or len(paths) > 3:
+        raise ReceiverError("unexpected folders: " + " ".join(paths))
+    if backup[0] == 0:
+        # No folder in front of the backup folder, the image goes straight in it
+        paths.insert(0, "")
+    folder, extr1 = paths[0], paths[1]
+    extr2 = paths[2] if len(paths) > 2 else ""
+
+    groups = [part.split() for part in line[:textend].split("\t") if part.strip()]
+    if not groups:
+        raise ReceiverError("no model")
+    brand, model, showname = _pick_model(groups)
+    return Receiver(model, brand, showname, folder, extr1, extr2,
+                    mkubifs_args, ubinize_args, rootname, kernelname, action)
+
+
+def read_table(path):
+    """Return ([Receiver], [(line number, problem)]) of a lookuptable."""
+    receivers, problems = [], []
+    with open(path, "rb") as f:
+        lines = f.read().decode("utf-8", "replace").splitlines()
+    for number, line in enumerate(lines, 1):
+        if not line.strip() or line.lstrip().startswith("#") or line.rstrip().endswith("\tACTION"):
+            continue
+        try:
+            receivers.append(parse_line(line))
+        except ReceiverError as e:
+            problems.append((number, str(e)))
+    return receivers, problems
+
+
+def build(tables):
+    """Return ({model: Receiver}, [problem text]), the first table having a model wins."""
+    database = OrderedDict()
+    problems = []
+    for table in tables:
+        receivers, bad = read_table(table)
+        problems.extend("{0}:{1}: {2}".format(table, number, text) for number, text in bad)
+        seen = set()
+        for receiver in receivers:
+            if receiver.model in seen:
+                problems.append("{0}: {1} listed twice, the first row is used".format(table, receiver.model))
+                continue
+            seen.add(receiver.model)
+            if receiver.model not in database:
+                database[receiver.model] = receiver
+    return database, problems
+
+
+def write_database(database, output):
+    lines = ["# BackupSuite receivers, written by receiverdb.py compile, do not edit",
+             "# " + SEPARATOR.join(FIELDS)]
+    for receiver in database.values():
+        lines.append(SEPARATOR.join(receiver))
+    tmp = "{0}.{1}.tmp".format(output, os.getpid())
+    with open(tmp, "wb") as f:
+        f.write(("\n".join(lines) + "\n").encode("utf-8"))
+    os.rename(tmp, output)
+
+
+def read_database(path):
+    database = OrderedDict()
+    with open(path, "rb") as f:
+        for line in f.read().decode("utf-8", "replace").splitlines():
+            fields = line.split(SEPARATOR)
+            if line.startswith("#") or len(fields) != len(FIELDS):
+                continue
+            database[fields[0]] = Receiver(*fields)
+    return database
+
+
+def default_tables():
+    tables = [TABLE]
+    if os.path.isfile(USER_TABLE):
+        tables.insert(0, USER_TABLE)
+    return tables
+
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0
+
+
+_cache = {}
+
+
+def load(tables=None):
+    """{model: Receiver} of the tables, read once per process.
+
+    The compiled database is used when it's newer than the tables, otherwise
+    the tables are parsed.
+    """
+    tables = tuple(tables or default_tables())
+    if tables not in _cache:
+        database = None
+        if tables == (TABLE,) and _mtime(DATABASE) > max(_mtime(t) for t in tables):
+            try:
+                database = read_database(DATABASE)
+            except (IOError, OSError):
+                database = None
+        if not database:
+            try:
+                database = build(tables)[0]
+            except (IOError, OSError):
+                database = {}
+        _cache[tables] = database
+    return _cache[tables]
+
+
+def get_receiver(model, tables=None):
+    """The Receiver of model, None when it's not in the lookuptable."""
+    return load(tables).get(model)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="BackupSuite receiver database")
+    sub = parser.add_subparsers(dest="command")
+    p = sub.add_parser("compile")
+    p.add_argument("database")
+    p.add_argument("tables", nargs="+")
+    p = sub.add_parser("show")
+    p.add_argument("model")
+    p.add_argument("tables", nargs="*")
+    p = sub.add_parser("check")
+    p.add_argument("tables", nargs="*")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "compile":
+            database, problems = build(args.tables)
+            for problem in problems:
+                print("[BackupSuite] receiverdb: " + problem, file=sys.stderr)
+            write_database(database, args.database)
+            print("{0}: {1} receivers".format(args.database, len(database)))
+        elif args.command == "show":
+            receiver = get_receiver(args.model, args.tables)
+            if receiver is None:
+                print("[BackupSuite] receiverdb: {0} not supported".format(args.model), file=sys.stderr)
+                return 1
+            for name, value in zip(FIELDS, receiver):
+                print("{0}={1}".format(name.upper(), value))
+        elif args.command == "check":
+            database, problems = build(args.tables or default_tables())
+            for problem in problems:
+                print(problem)
+            print("{0} receivers, {1} problem(s)".format(len(database), len(problems)))
+            return 1 if problems else 0
+        else:
+            parser.print_usage(sys.stderr)
+            return 2
+    except (IOError, OSError) as e:
+        print("[BackupSuite] receiverdb: {0}".format(str(e)), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
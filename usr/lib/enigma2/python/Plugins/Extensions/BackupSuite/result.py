@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+"""
+The result of the last backup, for the plugin.
+
+The plugin used to find out why a backup failed by reading the whole
+BackupSuite.log, package list included, and looking for English error texts
+in it, which the localized messages and the busybox tools don't always
+write. The scripts write a small record instead, "key=value" lines in
+/tmp/BackupSuite.result:
+
+    code=NO_SPACE
+    phase=tar
+    command=tar
+    folder=/media/usb/vuplus/solo2
+    time=1700000000
+
+code is one of CODES, phase the phase of backupsuite.sh that ran (see
+speedhistory.py), command the program that failed and folder the image
+folder, when known. A backup writes RUNNING when it starts and OK when the
+image is complete.
+
+    result.py write CODE [--phase PHASE] [--command COMMAND] [--folder FOLDER]
+        Write the record, for the scripts that have no write_result.
+
+    result.py show
+        Print the record of the last backup.
+"""
+
+from __future__ import print_function
+import argparse
+import os
+import sys
+import time
+
+RESULT = "/tmp/BackupSuite.result"
+
+CODES = (
+    "OK",
+    "RUNNING",
+    "CANCELLED",
+    "FAILED",  # none of the others
+    "NO_SPACE",
+    "READ_ONLY",
+    "PERMISSION",
+    "NO_TARGET",  # the backup media is not there
+    "NETWORK",  # the network share went away
+    "NOT_FOUND",  # a file or script of the backup is missing
+    "TOOL_MISSING",  # command is the missing program
+    "NO_RECEIVER",  # the model is not in the receiver database
+    "UNSUPPORTED",  # the wrong script for this receiver
+    "BUSY",  # another backup is running
+)
+
+
+def read_result(path=RESULT):
+    """{"code", "phase", "command", "folder", "time"} of the last backup, None without one."""
+    try:
+        with open(path, "r") as f:
+            lines = f.read().splitlines()
+    except (IOError, OSError):
+        return None
+    record = {"code": "FAILED", "phase": "", "command": "", "folder": "", "time": 0}
+    for line in lines:
+        if "=" in line:
+            key, value = line.split("=", 1)
+            record[key.strip()] = value.strip()
+    if record["code"] not in CODES:
+        record["code"] = "FAILED"
+    try:
+        record["time"] = int(record["time"])
+    except ValueError:
+        record["time"] = 0
+    return record
+
+
+def job_result(retval, since, path=RESULT):
+    """The record of a backup started at since that ended with retval.
+
+    A script that stopped before it wrote a result (or has none) leaves an
+    older record or RUNNING, the code then comes from retval.
+    """
+    record = read_result(path)
+    if record is None or record["time"] < int(since):
+        record = {"code": "OK" if retval == 0 else "FAILED",
+                  "phase": "", "command": "", "folder": "", "time": int(since)}
+    elif record["code"] == "RUNNING":
+        record["code"] = "FAILED"
+    return record
+
+
+def write_result(code, phase="", command="", folder="", path=RESULT):
+    lines = [
+        "code={0}".format(code),
+        "phase={0}".format(phase),
+        "command={0}".format(command),
+        "folder={0}".format(folder),
+        "time={0}".format(int(time.time())),
+    ]
+    tmp = "{0}.{1}.tmp".format(path, os.getpid())
+    with open(tmp, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.rename(tmp, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="BackupSuite backup result")
+    sub = parser.add_subparsers(dest="command")
+    p = sub.add_parser("write")
+    p.add_argument("code", choices=CODES)
+    p.add_argument("--phase", default="")
+    p.add_argument("--command", dest="failed", default="")
+    p.add_argument("--folder", default="")
+    sub.add_parser("show")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "write":
+            write_result(args.code, args.phase, args.failed, args.folder)
+        elif args.command == "show":
+            record = read_result()
+            if record is None:
+                print("No backup result in {0}".format(RESULT))
+                return 1
+            for key in sorted(record):
+                print("{0}: {1}".format(key, record[key]))
+        else:
+            parser.print_usage(sys.stderr)
+            return 2
+    except (IOError, OSError) as e:
+        print("[BackupSuite] result: {0}".format(str(e)), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,341 @@
+# -*- coding: utf-8 -*-
+
+"""
+Removing old backups by a policy, before the next backup needs the space.
+
+Every backup goes to a dated folder, MEDIA/fullbackup_<model>/<YYYYmmdd_HHMM>,
+and most to a ZIP in MEDIA/imagebackups as well. Nothing removed them, the
+media filled up until a backup failed halfway. Here the backups of a media
+are indexed as generations, the dated folder with the ZIP of the same model
+and time, and removed by the retention settings (see settings.py):
+
+    retention_keep          the newest N backups of every model
+    retention_daily         the newest backup of each of the last N days
+    retention_weekly        the newest backup of each of the last N weeks
+    retention_max_mb        all backups on the media together at most this
+    retention_make_room     "yes": remove the oldest backups until the next
+                            backup fits (the size from sizeestimate.py)
+
+A backup is kept when one of the first three keeps it, all are kept when
+they are all 0 (the default). The size limit and the room for the next
+backup take the oldest first. The newest complete backup of a model always
+stays, and so does the base of a differential backup that stays (see
+incremental.py). A folder without the BackupSuite.log a finished backup
+leaves there is incomplete, it goes once a newer backup is complete.
+
+The settings of a media can differ: a backupsuite-retention.conf on it, with
+lines like those of the settings file, overrides them there.
+
+    retention.py list [MEDIA ...] [--json]
+        The backups of MEDIA (of every backup target when none is given) and
+        what the policy does with them.
+
+    retention.py apply [MEDIA ...] [--make-room] [--copies N] [--dry-run]
+        Remove what the policy removes. --make-room also makes room for the
+        next backup, when retention_make_room is "yes".
+"""
+
+from __future__ import print_function
+import argparse
+import datetime
+import json
+import os
+import re
+import shutil
+import sys
+import time
+
+try:
+    from . import devices, settings
+    from .sizeestimate import COPIES, estimate
+except (ImportError, ValueError, SystemError):
+    import devices
+    import settings
+    from sizeestimate import COPIES, estimate
+
+DEVICE_SETTINGS = "backupsuite-retention.conf"
+ZIP_DIR = "imagebackups"
+# What backupsuite.sh copies into the dated folder when it is done
+DONE_MARKER = "BackupSuite.log"
+DATE_FORMAT = "%Y%m%d_%H%M"
+DATE = re.compile(r"^\d{8}_\d{4}$")
+# A zip of backupsuite.sh: backup-<image version>-<model>-<date>.zip
+ZIP_NAME = re.compile(r"^backup-(.*)-(\d{8}_\d{4})\.zip$")
+# The base folder of a differential backup, wherever the media was mounted
+BASE = re.compile(r"/(fullbackup_[^/]+)/(\d{8}_\d{4})(?:/|$)")
+
+
+class Generation(object):
+    """One backup on a media: its dated folder, its ZIP or both."""
+
+    def __init__(self, series, date):
+        self.series = series  # fullbackup_<model>, or imagebackups for a ZIP alone
+        self.date = date
+        self.time = time.mktime(time.strptime(date, DATE_FORMAT))
+        self.paths = []
+        self.bytes = 0
+        self.complete = False
+        self.base = None  # (series, date) of the base of a differential backup
+        self.reason = None  # why it goes, None when it stays
+
+    @property
+    def key(self):
+        return self.series, self.date
+
+    def info(self):
+        return {
+            "series": self.series,
+            "date": self.date,
+            "paths": self.paths,
+            "bytes": self.bytes,
+            "complete": self.complete,
+            "base": "/".join(self.base) if self.base else None,
+            "remove": self.reason,
+        }
+
+
+def tree_bytes(path):
+    total = 0
+    for dirpath, dirnames, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def _base_of(folder):
+    """(series, date) of the base of a differential backup in folder, None for a full one."""
+    for dirpath, dirnames, filenames in os.walk(folder):
+        if "rootfs.manifest" not in filenames:
+            continue
+        try:
+            with open(os.path.join(dirpath, "rootfs.manifest"), "r") as f:
+                for line in f:
+                    if not line.startswith("#"):
+                        break
+                    if line.startswith("# base "):
+                        match = BASE.search(line[7:].strip())
+                        if match:
+                            return match.group(1), match.group(2)
+        except (IOError, OSError):
+            pass
+    return None
+
+
+def _done(folder):
+    for dirpath, dirnames, filenames in os.walk(folder):
+        if DONE_MARKER in filenames:
+            return True
+    return False
+
+
+def scan(media):
+    """The generations on media, oldest first."""
+    found = {}
+    try:
+        names = sorted(os.listdir(media))
+    except OSError:
+        return []
+    for name in names:
+        top = os.path.join(media, name)
+        if not name.startswith("fullbackup_") or not os.path.isdir(top):
+            continue
+        for date in sorted(os.listdir(top)):
+            folder = os.path.join(top, date)
+            if not DATE.match(date) or not os.path.isdir(folder):
+                continue
+            generation = found[(name, date)] = Generation(name, date)
+            generation.paths.append(folder)
+            generation.bytes += tree_bytes(folder)
+            generation.complete = _done(folder)
+            generation.base = _base_of(folder)
+    zips = os.path.join(media, ZIP_DIR)
+    for name in sorted(os.listdir(zips)) if os.path.isdir(zips) else []:
+        match = ZIP_NAME.match(name)
+        if not match:
+            continue
+        date = match.group(2)
+        # The folder of the same time, of the model the name ends with
+        owners = [g for key, g in found.items() if key[1] == date and
+                  match.group(1).endswith("-" + key[0][len("fullbackup_"):])]
+        owners = owners or [g for key, g in found.items() if key[1] == date]
+        generation = owners[0] if owners else found.setdefault((ZIP_DIR, date), Generation(ZIP_DIR, date))
+        path = os.path.join(zips, name)
+        generation.paths.append(path)
+        generation.bytes += os.path.getsize(path)
+        generation.complete = True
+    return sorted(found.values(), key=lambda g: (g.time, g.series))
+
+
+def policy(media):
+    """The retention settings of media, its backupsuite-retention.conf over the settings."""
+    values = settings.load(os.path.join(media, DEVICE_SETTINGS), settings.load())
+
+    def number(key):
+        try:
+            return max(0, int(values[key]))
+        except ValueError:
+            return 0
+    return {
+        "keep": number("retention_keep"),
+        "daily": number("retention_daily"),
+        "weekly": number("retention_weekly"),
+        "max_bytes": number("retention_max_mb") * 1024 * 1024,
+        "make_room": values["retention_make_room"] == "yes",
+    }
+
+
+def _newest_per(generations, period, count):
+    kept, periods = [], []
+    for generation in generations:
+        key = period(generation)
+        if key not in periods:
+            if len(periods) == count:
+                break
+            periods.append(key)
+            kept.append(generation)
+    return kept
+
+
+def _day(generation):
+    return generation.date[:8]
+
+
+def _week(generation):
+    return datetime.datetime.fromtimestamp(generation.time).isocalendar()[:2]
+
+
+def plan(generations, rules, free_bytes=None, needed_bytes=None):
+    """Set the reason of every generation that goes, returns those."""
+    by_series = {}
+    for generation in generations:
+        generation.reason = None
+        by_series.setdefault(generation.series, []).append(generation)
+
+    for series in by_series.values():
+        done = [g for g in reversed(series) if g.complete]  # newest first
+        if done:
+            # Left behind by a backup that stopped, the newer ones may still run
+            for generation in series:
+                if not generation.complete and generation.time < done[0].time:
+                    generation.reason = "incomplete"
+        if rules["keep"] or rules["daily"] or rules["weekly"]:
+            kept = set(done[:rules["keep"]])
+            kept.update(_newest_per(done, _day, rules["daily"]))
+            kept.update(_newest_per(done, _week, rules["weekly"]))
+            for generation in done:
+                if generation not in kept:
+                    generation.reason = "policy"
+
+    _keep_bases(generations)
+
+    def staying():
+        return [g for g in generations if g.reason is None]
+
+    def take_oldest(reason):
+        needed = set(g.base for g in staying() if g.base)
+        for generation in staying():
+            newest = [g for g in by_series[generation.series] if g.complete and g.reason is None][-1:]
+            if generation.complete and generation not in newest and generation.key not in needed:
+                generation.reason = reason
+                return True
+        return False
+
+    if rules["max_bytes"]:
+        while sum(g.bytes for g in staying()) > rules["max_bytes"] and take_oldest("max_mb"):
+            pass
+    if free_bytes is not None and needed_bytes:
+        while free_bytes + sum(g.bytes for g in generations if g.reason) < needed_bytes and take_oldest("make_room"):
+            pass
+    return [g for g in generations if g.reason]
+
+
+def _keep_bases(generations):
+    by_key = dict((g.key, g) for g in generations)
+    todo = [g for g in generations if g.reason is None]
+    while todo:
+        base = by_key.get(todo.pop().base)
+        if base is not None and base.reason is not None:
+            base.reason = None
+            todo.append(base)
+
+
+def remove(generation):
+    for path in generation.paths:
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.exists(path):
+            os.remove(path)
+        try:
+            os.rmdir(os.path.dirname(path))  # fullbackup_<model> when it is empty now
+        except OSError:
+            pass
+
+
+def _all_media():
+    return [target["media"] for target in devices.targets()]
+
+
+def apply(media, make_room=False, copies=COPIES, dry_run=False):
+    """Remove the generations the policy of media removes, returns them."""
+    rules = policy(media)
+    free = needed = None
+    if make_room and rules["make_room"]:
+        used, compressed, needed, free = estimate(copies=copies, target=media)
+        needed, free = needed * 1024, free * 1024
+    generations = scan(media)
+    removed = plan(generations, rules, free, needed)
+    if not dry_run:
+        for generation in removed:
+            remove(generation)
+    return removed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="BackupSuite backup retention")
+    sub = parser.add_subparsers(dest="command")
+    p = sub.add_parser("list")
+    p.add_argument("media", nargs="*")
+    p.add_argument("--json", action="store_true")
+    p = sub.add_parser("apply")
+    p.add_argument("media", nargs="*")
+    p.add_argument("--make-room", action="store_true")
+    p.add_argument("--copies", type=int, default=COPIES)
+    p.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "list":
+            index = {}
+            for media in args.media or _all_media():
+                generations = scan(media)
+                plan(generations, policy(media))
+                index[media] = [g.info() for g in generations]
+            if args.json:
+                print(json.dumps(index, sort_keys=True))
+                return 0
+            for media in sorted(index):
+                print(media)
+                for entry in index[media]:
+                    print("  {series}/{date} {0} MB{1}{2}".format(
+                        entry["bytes"] // (1024 * 1024), "" if entry["complete"] else " incomplete",
+                        " remove ({0})".format(entry["remove"]) if entry["remove"] else "", **entry))
+        elif args.command == "apply":
+            for media in args.media or _all_media():
+                for generation in apply(media, args.make_room, args.copies, args.dry_run):
+                    print("{0}: {1}/{2} {3} MB ({4})".format(
+                        "would remove" if args.dry_run else "removed", generation.series, generation.date,
+                        generation.bytes // (1024 * 1024), generation.reason))
+        else:
+            parser.print_usage(sys.stderr)
+            return 2
+    except (IOError, OSError) as e:
+        print("[BackupSuite] retention: {0}".format(str(e)), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
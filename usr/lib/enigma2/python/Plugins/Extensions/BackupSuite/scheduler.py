@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+"""
+When the scheduled backup is due, and when it can run.
+
+A backup is due daily or weekly at the time of the settings (see
+settings.py), or after opkg changed the installed packages. It never starts
+on top of a recording: the timers of the RecordTimer are passed in as busy
+intervals and the backup waits for the first gap long enough to hold it.
+When the image didn't change since the last scheduled backup (same package
+database, same files in /etc/enigma2 by name, size and time) the run is
+skipped, that costs a few stat calls and no backup.
+
+This module doesn't need enigma2, the timer and the RecordTimer are in
+plugin.py (BackupScheduler).
+
+    scheduler.py status
+        Print the state of the last run, the fingerprint of the image now
+        and whether a backup is due.
+"""
+
+from __future__ import print_function
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+try:
+    from . import settings
+except (ImportError, ValueError, SystemError):
+    import settings
+
+PLUGIN_DIR = os.path.dirname(os.path.abspath(__file__))
+STATE = os.path.join(PLUGIN_DIR, "schedule.json")
+
+OPKG_STATUS = ("/var/lib/opkg/status", "/usr/lib/opkg/status")
+ETC_DIR = "/etc/enigma2"
+# Written by the plugin itself, no reason for a backup
+IGNORED = (os.path.basename(settings.SETTINGS),)
+
+# Seconds kept free before a timer begins and after it ends
+PADDING = 300
+
+
+def opkg_status(candidates=OPKG_STATUS):
+    for path in candidates:
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def fingerprint(etc_dir=ETC_DIR, status=None):
+    """Hash of the package database and of the files in etc_dir by name, size and time."""
+    digest = hashlib.sha1()
+    status = status or opkg_status()
+    entries = []
+    if status:
+        entries.append(status)
+    for dirpath, dirnames, filenames in os.walk(etc_dir):
+        dirnames.sort()
+        entries.extend(os.path.join(dirpath, name) for name in sorted(filenames) if name not in IGNORED)
+    for path in entries:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        line = "{0} {1} {2}\n".format(path, st.st_size, int(st.st_mtime))
+        # Already bytes on python 2; keep undecodable names intact on python 3
+        digest.update(line if isinstance(line, bytes) else line.encode("utf-8", "surrogateescape"))
+    return digest.hexdigest()
+
+
+def read_state(path=STATE):
+    try:
+        with open(path, "r") as f:
+            state = json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+    return state if isinstance(state, dict) else {}
+
+
+def write_state(state, path=STATE):
+    tmp = "{0}.{1}.tmp".format(path, os.getpid())
+    with open(tmp, "w") as f:
+        json.dump(state, f, sort_keys=True)
+    os.rename(tmp, path)
+
+
+def last_slot(values, now=None):
+    """Time of the latest daily or weekly slot not after now, None for the other schedules."""
+    schedule = values.get("schedule")
+    if schedule not in ("daily", "weekly"):
+        return None
+    now = now or time.time()
+    try:
+        hour, minute = [int(x) for x in values.get("schedule_time", "").split(":")]
+        weekday = int(values.get("schedule_weekday", 0)) % 7
+    except ValueError:
+        return None
+    t = time.localtime(now)
+    slot = time.mktime((t.tm_year, t.tm_mon, t.tm_mday, hour, minute, 0, 0, 0, -1))
+    if slot > now:
+        slot = _previous_day(slot)
+    if schedule == "weekly":
+        while time.localtime(slot).tm_wday != weekday:
+            slot = _previous_day(slot)
+    return slot
+
+
+def _previous_day(slot):
+    # Same clock time a day earlier, also across daylight saving changes
+    t = time.localtime(slot - 86400)
+    s = time.localtime(slot)
+    return time.mktime((t.tm_year, t.tm_mon, t.tm_mday, s.tm_hour, s.tm_min, 0, 0, 0, -1))
+
+
+def due(values, state, now=None):
+    """True when a scheduled backup should run now, busy or not."""
+    now = now or time.time()
+    handled = max(state.get("last_run", 0), state.get("last_check", 0))
+    if values.get("schedule") == "upgrade":
+        status = opkg_status()
+        return status is not None and os.stat(status).st_mtime > handled
+    slot = last_slot(values, now)
+    return slot is not None and handled < slot
+
+
+def unchanged(state, current):
+    """True when the image is the same as at the last scheduled backup."""
+    return bool(state.get("fingerprint")) and state["fingerprint"] == current
+
+
+def idle_start(now, duration, busy, padding=PADDING):
+    """Earliest start not before now with duration seconds free of the busy (begin, end) intervals."""
+    start = now
+    for begin, end in sorted(busy):
+        if end + padding <= start:
+            continue
+        if start + duration <= begin - padding:
+            break
+        start = max(start, end + padding)
+    return start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="BackupSuite backup schedule")
+    sub = parser.add_subparsers(dest="command")
+    sub.add_parser("status")
+    args = parser.parse_args(argv)
+
+    if args.command != "status":
+        parser.print_usage(sys.stderr)
+        return 2
+    try:
+        values = settings.load()
+        state = read_state()
+        current = fingerprint()
+        for key in sorted(state):
+            print("{0}: {1}".format(key, state[key]))
+        print("schedule: {0}".format(values["schedule"]))
+        print("fingerprint now: {0}{1}".format(current, " (unchanged)" if unchanged(state, current) else ""))
+        print("due: {0}".format("yes" if due(values, state) else "no"))
+    except (IOError, OSError) as e:
+        print("[BackupSuite] scheduler: {0}".format(str(e)), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
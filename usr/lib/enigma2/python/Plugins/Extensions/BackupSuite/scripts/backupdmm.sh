@@ -118,8 +118,47 @@ else
     LIBDIR="/usr/lib"
 fi
 
-export LANG="$1"
-export SHOW="$PYTHON $LIBDIR/enigma2/python/Plugins/Extensions/BackupSuite/message.$PYEXT $LANG"
+# The wrapper scripts export the language, $1 is the backup media. It is part
+# of the catalog path below, so nothing with a "/" is taken
+export LANG="${LANG:-en}"
+case "$LANG" in
+    */*) LANG=en ;;
+esac
+
+# Run one of the python helpers of the plugin, compiled version first
+pyhelper()
+{
+HELPER="$LIBDIR/enigma2/python/Plugins/Extensions/BackupSuite/$1"
+shift
+if [ -f "$HELPER.$PYEXT" ] ; then
+    $PYTHON "$HELPER.$PYEXT" "$@"
+else
+    $PYTHON "$HELPER.py" "$@"
+fi
+}
+
+# The messages of the language are compiled once into a shell file, printing
+# one is then a shell function instead of a python start per line
+PYBASE="$LIBDIR/enigma2/python/Plugins/Extensions/BackupSuite"
+MSGCATALOG="$PYBASE/locale/messages.$LANG.sh"
+for SOURCE in "$PYBASE/message.py" "$PYBASE/message.$PYEXT" "$PYBASE/locale/$LANG/LC_MESSAGES/BackupSuite.mo" ; do
+    [ "$SOURCE" -nt "$MSGCATALOG" ] && rm -f "$MSGCATALOG"
+done
+if [ ! -s "$MSGCATALOG" ] ; then
+    pyhelper message --compile "$LANG" "$MSGCATALOG" > /dev/null 2>&1 || {
+        MSGCATALOG="/tmp/backupsuite-messages.$LANG.sh"
+        pyhelper message --compile "$LANG" "$MSGCATALOG" > /dev/null 2>&1
+    }
+fi
+if [ -s "$MSGCATALOG" ] && . "$MSGCATALOG" ; then
+    SHOW="show_message"
+else
+    SHOW="pyhelper message $LANG"
+fi
+
+# Number of cores, more than one means the parallel compressor is used
+CORES=$(grep -c ^processor /proc/cpuinfo 2>/dev/null)
+[ -z "$CORES" ] && CORES=1
 
 # Dynamic device type setting
 case "$2" in
@@ -156,11 +195,67 @@ umount /tmp/bi/root > /dev/null 2>&1
 rmdir /tmp/bi/root > /dev/null 2>&1
 rmdir /tmp/bi > /dev/null 2>&1
 rm -rf "$WORKDIR" > /dev/null 2>&1
+[ -n "$NEWDEST" ] && rm -rf "$NEWDEST"
 }
 
+########################### CANCELLED FROM THE PLUGIN ##########################
+# The job manager of the plugin cancels with SIGTERM, nothing is left behind
+cancelled()
+{
+log "CANCELLED"
+write_result CANCELLED
+clean_up
+exit 143
+}
+trap cancelled INT TERM HUP
+########################## RESULT FOR THE PLUGIN ##############################
+# A stable code instead of log texts, see result.py for the codes
+RESULTFILE=/tmp/BackupSuite.result
+write_result()
+{
+{
+echo "code=$1"
+echo "phase=`cat "$PHASEMARK" 2> /dev/null`"
+echo "command=$2"
+echo "folder=$MAINDEST"
+echo "time=`date +%s`"
+} > "$RESULTFILE.tmp" && mv -f "$RESULTFILE.tmp" "$RESULTFILE"
+}
+# Field $2 of the line in /proc/mounts of the mount $MEDIA is on
+media_mount()
+{
+awk -v m="$MEDIA/" -v f=$1 'index(m, $2 "/") == 1 && length($2) >= l { l = length($2) ; v = $f } END { print v }' /proc/mounts
+}
+# Why a command failed, from the state of the backup media. Asked before the
+# clean up, which frees the space of the work folder again
+failure_code()
+{
+case "`media_mount 3`" in
+    cifs|smb*|nfs*) NETFS=1 ;;
+    *) NETFS=0 ;;
+esac
+if [ -z "$MEDIA" ] || [ ! -d "$MEDIA" ] ; then
+    [ $NETFS = 1 -o "$DEVICE_TYPE" = "NET" ] && echo NETWORK || echo NO_TARGET
+elif ! touch "$MEDIA/.backupsuite-write-test" > /dev/null 2>&1 ; then
+    case ",`media_mount 4`," in
+        *,ro,*) echo READ_ONLY ;;
+        *) [ $NETFS = 1 ] && echo NETWORK || echo PERMISSION ;;
+    esac
+else
+    rm -f "$MEDIA/.backupsuite-write-test"
+    FREEKB=`df -P -k "$MEDIA" 2> /dev/null | awk 'END { print $4 }'`
+    if [ "${FREEKB:-0}" -lt 4096 ] 2> /dev/null ; then
+        echo NO_SPACE
+    else
+        echo FAILED
+    fi
+fi
+}
 ###################### BIG OOPS!, HOLY SH... (SHELL SCRIPT :-))################
+# big_fail [CODE] [COMMAND], without a code failure_code finds it
 big_fail()
 {
+write_result "${1:-`failure_code`}" "$2"
 if [ -d $WORKDIR ] ; then
     log "FAIL!"
     log "Content so far of the working directory $WORKDIR "
@@ -170,7 +265,7 @@ clean_up
 echo $RED
 $SHOW "message15" 2>&1 | tee -a $LOGFILE # Image creation FAILED!
 echo $WHITE
-exit 0
+exit 1
 }
 
 ############################ DEFINE IMAGE_VERSION #############################
@@ -188,12 +283,32 @@ echo $LINE
 }
 
 #################### CLEAN UP AND MAKE DESTINATION FOLDERS ####################
+# The new image is put together in $NEWDEST, the last complete one stays in
+# $MAINDEST until commit_folders swaps them
 make_folders()
 {
-rm -rf "$MAINDEST"
-log "Removed directory  = $MAINDEST"
-mkdir -p "$MAINDEST"
-log "Created directory  = $MAINDEST"
+NEWDEST="$MAINDEST.new"
+rm -rf "$NEWDEST"
+mkdir -p "$NEWDEST"
+log "Created directory  = $NEWDEST"
+}
+commit_folders()
+{
+if [ -d "$MAINDEST" ] ; then
+    mv "$MAINDEST" "$MAINDEST.old"
+fi
+mv "$NEWDEST" "$MAINDEST" && NEWDEST=""
+rm -rf "$MAINDEST.old"
+log "Committed directory = $MAINDEST"
+}
+# A backup that stopped in commit_folders left the last image in $MAINDEST.old
+restore_folders()
+{
+if [ -d "$MAINDEST.old" -a ! -d "$MAINDEST" ] ; then
+    mv "$MAINDEST.old" "$MAINDEST"
+    log "Restored directory = $MAINDEST"
+fi
+rm -rf "$MAINDEST.old" "$MAINDEST.new"
 }
 
 ################ CHECK FOR THE NEEDED BINARIES IF THEY EXIST ##################
@@ -202,12 +317,75 @@ checkbinary()
 if [ ! -f "$1" ] ; then {
     echo -n "$1 " ; $SHOW "message05"
     } 2>&1 | tee -a $LOGFILE
-    big_fail
+    big_fail TOOL_MISSING "$1"
 elif [ ! -x "$1" ] ; then
     {
     echo "Error: $1 " ; $SHOW "message35"
     } 2>&1 | tee -a $LOGFILE
-    big_fail
+    big_fail TOOL_MISSING "$1"
+fi
+}
+
+################ STREAM THE ROOTFS TAR STRAIGHT INTO BZIP2 ####################
+# $1 = source directory, $2 = archive to write, the rest are extra tar options
+# Only the compressed archive ever touches the backup media, no rootfs.tar.
+# The exit status of tar is kept in a file, the pipeline only returns that of
+# the last command and a tar that died halfway still leaves valid bzip2.
+tar_bzip2()
+{
+SRCDIR="$1"
+ARCHIVE="$2"
+shift 2
+rm -f "$WORKDIR/tar.status"
+{ $MKFS -cf - -C "$SRCDIR" "$@" . ; echo $? > "$WORKDIR/tar.status" ; } | compress_stream | pyhelper imagemanifest tee "$WORKDIR/digests" "${ARCHIVE##*/}" > "$ARCHIVE"
+TARSTATUS=`cat "$WORKDIR/tar.status" 2> /dev/null`
+# GNU tar returns 1 when a file changed while it was read, the archive is complete
+if [ "$TARSTATUS" = 1 ] && $MKFS --version 2> /dev/null | grep -q GNU ; then
+    log "tar: files changed while they were read"
+elif [ "$TARSTATUS" != 0 ] ; then
+    log "tar failed with status ${TARSTATUS:-unknown}"
+    rm -f "$ARCHIVE"
+    big_fail "" tar
+fi
+}
+
+###################### COMPRESS STDIN TO BZIP2 ON STDOUT ######################
+# Multi-core boxes use the parallel compressor, it writes independent bzip2
+# streams that bzip2, tar -xjf and ofgwrite read like any other .bz2 file
+compress_stream()
+{
+if [ "$CORES" -gt 1 ] ; then
+    pyhelper compressor -j $CORES
+else
+    $BZIP2 -c
+fi
+}
+
+############### DUMP A PARTITION IN LARGE BLOCKS WITH ITS SHA256 ##############
+# $1 = device, $2 = image file, the digest is added to $WORKDIR/digests
+dump_partition()
+{
+pyhelper blockcopy "$1" "$2" --direct --digests "$WORKDIR/digests" >> $LOGFILE 2>&1 || dd if="$1" of="$2" bs=1M > /dev/null 2>&1
+}
+###################### ONE RECEIVER FROM THE DATABASE #########################
+# The lookuptables are compiled by receiverdb.py into one checked line per
+# model (fields separated by "|"), all the fields come from a single grep.
+# Without python the line is cut from the lookuptable as before.
+receiver_entry()
+{
+for SOURCE in $TABLES "$PYBASE/receiverdb.py" "$PYBASE/receiverdb.$PYEXT" ; do
+    [ "$SOURCE" -nt "$RECEIVERDB" ] && rm -f "$RECEIVERDB"
+done
+if [ ! -s "$RECEIVERDB" ] ; then
+    pyhelper receiverdb compile "$RECEIVERDB" $TABLES > /dev/null 2>> $LOGFILE || {
+        RECEIVERDB="/tmp/backupsuite-$(basename $RECEIVERDB)"
+        pyhelper receiverdb compile "$RECEIVERDB" $TABLES > /dev/null 2>&1
+    }
+fi
+if [ -s "$RECEIVERDB" ] ; then
+    grep -m1 "^$1|" "$RECEIVERDB" || grep -v "^#" "$RECEIVERDB" | grep -w -m1 "$1"
+else
+    grep -w -m1 "$1" $LOOKUP | awk -F "\t" -v OFS="|" '{print $2, $1, $3, $4, $5, $6, $7, $8, $9, $10, $11}'
 fi
 }
 
@@ -268,16 +446,28 @@ BUILDIMAGE=/usr/bin/buildimage
 MTDPLACE=$(cat /proc/mtd | grep -w "kernel" | cut -d ":" -f 1)
 NANDDUMP=/usr/sbin/nanddump
 START=$(date +%s)
+write_result RUNNING
+# CPU and I/O priority of the settings for this script and all it starts,
+# see governor.py
+pyhelper governor apply $$ > /dev/null 2>&1
 if [ -f "/etc/lookuptable.txt" ] ; then
     LOOKUP="/etc/lookuptable.txt"
     $SHOW "message36"
+    RECEIVERDB="$PYBASE/receivers.etc.db"
+    TABLES="$LOOKUP $PYBASE/lookuptable.txt"
 else
     LOOKUP="$LIBDIR/enigma2/python/Plugins/Extensions/BackupSuite/lookuptable.txt"
+    RECEIVERDB="$PYBASE/receivers.db"
+    TABLES="$LOOKUP"
 fi
 TARGET="XX"
 UBINIZE=/usr/sbin/ubinize
-USEDsizebytes=$(df -B 1 /usr/ | grep [0-9]% | tr -s " " | cut -d " " -f 3)
-USEDsizekb=$(df -k /usr/ | grep [0-9]% | tr -s " " | cut -d " " -f 3)
+# Root filesystem size from statvfs and cached totals, see sizeestimate.py
+USEDsizekb=$(pyhelper sizeestimate estimate 2> /dev/null | cut -d " " -f 1)
+if [ -z "$USEDsizekb" ] ; then
+    USEDsizekb=$(df -k /usr/ | grep [0-9]% | tr -s " " | cut -d " " -f 3)
+fi
+USEDsizebytes=$(($USEDsizekb*1024))
 if [ -f "/var/lib/opkg/info/enigma2-plugin-extensions-backupsuite.control" ] ; then
     VERSION="Version: "$(cat /var/lib/opkg/info/enigma2-plugin-extensions-backupsuite.control | grep "Version: " | cut -d "+" -f 2)
 else
@@ -316,6 +506,7 @@ if [ -f /etc/modules-load.d/dreambox-dvb-modules-dm*.conf ] || [ -f /etc/modules
     fi
 else
     log "Not a dreambox! Exiting..."
+    write_result UNSUPPORTED
     exit 1
 fi
 
@@ -323,22 +514,22 @@ fi
 dm9x0_situation()
 {
 log "Found dm9x0, bz2 mode"
-MODEL=$(cat $LOOKUP | grep -w -m1 "$SEARCH" | cut -f 2)
-SHOWNAME=$(cat $LOOKUP | grep -w -m1 "$SEARCH" | cut -f 3)
-FOLDER="$(cat $LOOKUP | grep -w -m1 "$SEARCH" | cut -f 4)"
-EXTR1="$(cat $LOOKUP | grep -w -m1 "$SEARCH" | cut -f 5)/$DATE"
-EXTR2="$(cat $LOOKUP | grep -w -m1 "$SEARCH" | cut -f 6)"
+ENTRY=$(receiver_entry "$SEARCH")
+if [ -z "$ENTRY" ] ; then
+    echo -n "$RED"
+    $SHOW "message01" 2>&1 | tee -a $LOGFILE # No supported receiver found!
+    big_fail NO_RECEIVER
+fi
+IFS="|" read -r MODEL BRAND SHOWNAME FOLDER EXTR1 EXTR2 MKUBIFS_ARGS UBINIZE_ARGS ROOTNAME KERNELNAME ACTION <<EOF
+$ENTRY
+EOF
+EXTR1="$EXTR1/$DATE"
 EXTRA="$MEDIA$EXTR1$EXTR2"
 if  [ $HARDDISK = 1 ]; then
     MAINDEST="$MEDIA$EXTR1$FOLDER"
 else
     MAINDEST="$MEDIA$FOLDER"
 fi
-MKUBIFS_ARGS=$(cat $LOOKUP | grep -w -m1 "$SEARCH" | cut -f 7)
-UBINIZE_ARGS=$(cat $LOOKUP | grep -w -m1 "$SEARCH" | cut -f 8)
-ROOTNAME=$(cat $LOOKUP | grep -w -m1 "$SEARCH" | cut -f 9)
-KERNELNAME=$(cat $LOOKUP | grep -w -m1 "$SEARCH" | cut -f 10)
-ACTION=$(cat $LOOKUP | grep -w -m1 "$SEARCH" | cut -f 11)
 MKFS=/bin/tar
 checkbinary $MKFS
 BZIP2=/usr/bin/bzip2
@@ -389,9 +580,9 @@ rm -rf "$WORKDIR"       # GETTING RID OF THE OLD REMAINS IF ANY
 log "Remove directory   = $WORKDIR"
 mkdir -p "$WORKDIR"     # MAKING THE WORKING FOLDER WHERE EVERYTHING HAPPENS
 log "Recreate directory = $WORKDIR"
+restore_folders
 mkdir -p /tmp/bi/root # this is where the complete content will be available
 log "Create directory   = /tmp/bi/root"
-sync
 mount --bind / /tmp/bi/root # the complete root at /tmp/bi/root
 ## TEMPORARY WORKAROUND TO REMOVE
 ##      /var/lib/samba/private/msg.sock
@@ -404,15 +595,18 @@ fi
 log $LINE
 $SHOW "message07" 2>&1 | tee -a $LOGFILE            # Create: kerneldump
 if [ $SEARCH = "dm900" -o $SEARCH = "dm920" ] ; then
-    dd if=/dev/mmcblk0p1 of=$WORKDIR/$KERNELNAME
+    dump_partition /dev/mmcblk0p1 "$WORKDIR/$KERNELNAME"
     log "Kernel resides on /dev/mmcblk0p1"
 else
-    $PYTHON $LIBDIR/enigma2/python/Plugins/Extensions/BackupSuite/findkerneldevice.$PYEXT
     KERNEL=$(cat /sys/firmware/devicetree/base/chosen/kerneldev)
     KERNELNAME=${KERNEL:11:7}.bin
     echo "$KERNELNAME = STARTUP_${KERNEL:17:1}"
     log "$KERNELNAME = STARTUP_${KERNEL:17:1}"
-    dd if=/dev/kernel of=$WORKDIR/$KERNELNAME > /dev/null 2>&1
+    # Links /dev/kernel and dumps it
+    pyhelper findkerneldevice "$WORKDIR/$KERNELNAME" "$WORKDIR/digests" >> $LOGFILE 2>&1
+    if [ ! -s "$WORKDIR/$KERNELNAME" ] ; then
+        dump_partition /dev/kernel "$WORKDIR/$KERNELNAME"
+    fi
 fi
 
 #############################  MAKING ROOT.UBI(FS) ############################
@@ -427,32 +621,36 @@ if [ -b "/dev/mmcblk0p16" ] && [ -b "/dev/mmcblk0p12" ]; then
     # Mount rootfs partition and create tar directly
     mkdir -p /tmp/rootfs_mount
     if mount /dev/mmcblk0p16 /tmp/rootfs_mount; then
-        cd /tmp/rootfs_mount
-        $MKFS -cf $WORKDIR/rootfs.tar .
-        cd /
+        tar_bzip2 /tmp/rootfs_mount "$WORKDIR/rootfs.tar.bz2"
         umount /tmp/rootfs_mount
         rm -rf /tmp/rootfs_mount
         echo "RootFS tar created directly from eMMC partition"
     else
         echo "ERROR: Cannot mount rootfs partition, using standard method"
-        $MKFS -cf $WORKDIR/rootfs.tar -C /tmp/bi/root .
+        tar_bzip2 /tmp/bi/root "$WORKDIR/rootfs.tar.bz2"
     fi
 else
     # Standard method for other devices
-    $MKFS -cf $WORKDIR/rootfs.tar -C /tmp/bi/root .
+    tar_bzip2 /tmp/bi/root "$WORKDIR/rootfs.tar.bz2"
+fi
+if [ ! -s "$WORKDIR/rootfs.tar.bz2" ] ; then
+    log "$WORKDIR/rootfs.tar.bz2 NOT FOUND"
+    big_fail "" tar
 fi
-
-$BZIP2 $WORKDIR/rootfs.tar
 
 ############################ ASSEMBLING THE IMAGE #############################
 make_folders
-mv "$WORKDIR/$ROOTNAME" "$MAINDEST/$ROOTNAME"
-mv "$WORKDIR/$KERNELNAME" "$MAINDEST/$KERNELNAME"
-image_version > "$MAINDEST/imageversion"
+mv "$WORKDIR/$ROOTNAME" "$NEWDEST/$ROOTNAME"
+mv "$WORKDIR/$KERNELNAME" "$NEWDEST/$KERNELNAME"
+image_version > "$NEWDEST/imageversion"
+# Digests taken while the files were made, nothing of the image is read again
+pyhelper imagemanifest write "$WORKDIR/digests" "$NEWDEST" --model "$SEARCH" >> $LOGFILE 2>&1
+commit_folders
 if  [ $HARDDISK != 1 ]; then
     mkdir -p "$EXTRA"
     log "Created directory  = $EXTRA"
-    cp -r "$MAINDEST" "$EXTRA"   #copy the made back-up to images
+    # link the made back-up into images, a real copy only where links are impossible
+    pyhelper finalize link "$MAINDEST" "$EXTRA/${MAINDEST##*/}" >> $LOGFILE 2>&1 || cp -r "$MAINDEST" "$EXTRA"
 fi
 if [ -f "$MAINDEST/$ROOTNAME" -a -f "$MAINDEST/$KERNELNAME" ] ; then
         backup_made
@@ -481,7 +679,8 @@ if  [ $HARDDISK = 1 ]; then                     # looking for a valid usb-stick
         } 2>&1 | tee -a $LOGFILE
         rm -rf "$TARGET$FOLDER"
         mkdir -p "$TARGET$FOLDER"
-        cp -r "$MAINDEST/." "$TARGET$FOLDER"
+        pyhelper finalize link "$MAINDEST" "$TARGET$FOLDER" >> $LOGFILE 2>&1 || cp -r "$MAINDEST/." "$TARGET$FOLDER"
+        pyhelper governor fsync "$TARGET$FOLDER" >> $LOGFILE 2>&1 || sync
         echo $LINE >> $LOGFILE
         echo "MADE AN EXTRA COPY IN: $TARGET" >> $LOGFILE
         df -h "$TARGET"  >> $LOGFILE
@@ -489,10 +688,12 @@ if  [ $HARDDISK = 1 ]; then                     # looking for a valid usb-stick
     else
         $SHOW "message40" >> $LOGFILE
     fi
-sync
 fi
 
 ################## CLEANING UP AND REPORTING SOME STATISTICS ##################
+# Only the files of this backup are written to the disk, a sync would also
+# flush the dirty pages of a running recording
+pyhelper governor fsync "$MAINDEST" "$EXTRA/${MAINDEST##*/}" >> $LOGFILE 2>&1 || sync
 clean_up
 END=$(date +%s)
 DIFF=$(( $END - $START ))
@@ -507,6 +708,7 @@ KERNELSIZE=$(get_file_size "$MAINDEST/$KERNELNAME")
 TOTALSIZE=$((($ROOTSIZE+$KERNELSIZE)/1024))
 SPEED=$(( $TOTALSIZE/$DIFF ))
 echo $SPEED > $LIBDIR/enigma2/python/Plugins/Extensions/BackupSuite/speed.txt
+pyhelper sizeestimate record "$MAINDEST/$ROOTNAME" >> $LOGFILE 2>&1
 echo $LINE >> $LOGFILE
 # "Back up done with $SPEED KB per second"
 {
@@ -585,9 +787,9 @@ rm -rf "$WORKDIR"       # GETTING RID OF THE OLD REMAINS IF ANY
 log "Remove directory   = $WORKDIR"
 mkdir -p "$WORKDIR"     # MAKING THE WORKING FOLDER WHERE EVERYTHING HAPPENS
 log "Recreate directory = $WORKDIR"
+restore_folders
 mkdir -p /tmp/bi/root # this is where the complete content will be available
 log "Create directory   = /tmp/bi/root"
-sync
 mount --bind / /tmp/bi/root # the complete root at /tmp/bi/root
 ## TEMPORARY WORKAROUND TO REMOVE
 ##      /var/lib/samba/private/msg.sock
@@ -603,11 +805,13 @@ $MKFS -cf $WORKDIR/rootfs.tar -C /tmp/bi/root .
 
 ############################ ASSEMBLING THE IMAGE #############################
 make_folders
-image_version > "$MAINDEST/imageversion"
+image_version > "$NEWDEST/imageversion"
+commit_folders
 if  [ $HARDDISK != 1 ]; then
     mkdir -p "$EXTRA"
     log "Created directory  = $EXTRA"
-    cp -r "$MAINDEST" "$EXTRA"   #copy the made back-up to images
+    # link the made back-up into images, a real copy only where links are impossible
+    pyhelper finalize link "$MAINDEST" "$EXTRA/${MAINDEST##*/}" >> $LOGFILE 2>&1 || cp -r "$MAINDEST" "$EXTRA"
 fi
 backup_made
 $SHOW "message14"            # Instructions on how to restore the image.
@@ -632,7 +836,8 @@ if  [ $HARDDISK = 1 ]; then                     # looking for a valid usb-stick
         } 2>&1 | tee -a $LOGFILE
         rm -rf "$TARGET$FOLDER"
         mkdir -p "$TARGET$FOLDER"
-        cp -r "$MAINDEST/." "$TARGET$FOLDER"
+        pyhelper finalize link "$MAINDEST" "$TARGET$FOLDER" >> $LOGFILE 2>&1 || cp -r "$MAINDEST/." "$TARGET$FOLDER"
+        pyhelper governor fsync "$TARGET$FOLDER" >> $LOGFILE 2>&1 || sync
         echo $LINE >> $LOGFILE
         echo "MADE AN EXTRA COPY IN: $TARGET" >> $LOGFILE
         df -h "$TARGET"  >> $LOGFILE
@@ -640,10 +845,12 @@ if  [ $HARDDISK = 1 ]; then                     # looking for a valid usb-stick
     else
         $SHOW "message40" >> $LOGFILE
     fi
-sync
 fi
 
 ################## CLEANING UP AND REPORTING SOME STATISTICS ##################
+# Only the files of this backup are written to the disk, a sync would also
+# flush the dirty pages of a running recording
+pyhelper governor fsync "$MAINDEST" "$EXTRA/${MAINDEST##*/}" >> $LOGFILE 2>&1 || sync
 clean_up
 END=$(date +%s)
 DIFF=$(( $END - $START ))
@@ -658,6 +865,7 @@ KERNELSIZE=$(get_file_size "$MAINDEST/$KERNELNAME")
 TOTALSIZE=$((($ROOTSIZE+$KERNELSIZE)/1024))
 SPEED=$(( $TOTALSIZE/$DIFF ))
 echo $SPEED > $LIBDIR/enigma2/python/Plugins/Extensions/BackupSuite/speed.txt
+pyhelper sizeestimate record "$MAINDEST/$ROOTNAME" >> $LOGFILE 2>&1
 echo $LINE >> $LOGFILE
 # "Back up done with $SPEED KB per second"
 {
@@ -826,6 +1034,7 @@ case $SEARCH in
       ;;
    *)
       log "Error: Unknown dreambox?"
+      write_result UNSUPPORTED
       exit 3
       ;;
 esac
@@ -854,6 +1063,7 @@ if [ $? -ne 0 ] && [ ! -f "$SECSTAGE" ] ; then
    rm -rf "$SBI" 2>/dev/null
    rm -rf "$TBI" 2>/dev/null
    log "Error: nanddump failed to dump secondstage!"
+   write_result "`failure_code`" nanddump
    exit 8
 fi
 #
@@ -872,6 +1082,7 @@ if [ $SIZE -gt 200 ] ; then
    log "opkg install --force-reinstall dreambox-secondstage-$SEARCH"
    rm -rf "$SBI" 2>/dev/null
    rm -rf "$TBI" 2>/dev/null
+   write_result FAILED secondstage
    exit 9
 fi
 #
@@ -959,7 +1170,7 @@ log "$(du -h $NFI)"
 if [ -z "$CREATE_ZIP" ] ; then
    mkdir -p "$EXTRA"
    touch "$NFI/$IMVER"
-   cp -r "$NFI" "$EXTRA"
+   ln -f "$NFI" "$EXTRA/" 2>/dev/null || cp -r "$NFI" "$EXTRA"
    touch "$MEDIA/fullbackup/.timestamp"
 else
    if [ $CREATE_ZIP != "none" ] ; then
@@ -988,6 +1199,9 @@ fi
 log "Completed!"
 
 ################## CLEANING UP AND REPORTING SOME STATISTICS ##################
+# Only the files of this backup are written to the disk, a sync would also
+# flush the dirty pages of a running recording
+pyhelper governor fsync "$MAINDEST" "$EXTRA" >> $LOGFILE 2>&1 || sync
 clean_up
 END=$(date +%s)
 DIFF=$(( $END - $START ))
@@ -1011,4 +1225,5 @@ if [ $SEARCH != "dm900" ] && [ $SEARCH != "dm920" ] && [ $SEARCH != "dm520" ] &&
     old_dreambox_situation
 fi
 
+write_result OK
 exit 0
@@ -117,7 +117,20 @@ find_message_script() {
 # Parameters
 export LANG="${1:-en}"
 MESSAGE_SCRIPT=$(find_message_script)
-export SHOW="$PYTHON $MESSAGE_SCRIPT $LANG"
+# Messages come from the compiled catalog of the language, see message.py
+MSGCATALOG="$MESSAGE_DIR/locale/messages.$LANG.sh"
+if [ ! -s "$MSGCATALOG" -o "$MESSAGE_SCRIPT" -nt "$MSGCATALOG" ] ; then
+    $PYTHON "$MESSAGE_SCRIPT" --compile "$LANG" "$MSGCATALOG" > /dev/null 2>&1 || rm -f "$MSGCATALOG"
+fi
+if [ -s "$MSGCATALOG" ] && . "$MSGCATALOG" ; then
+    SHOW="show_message"
+else
+    SHOW="$PYTHON $MESSAGE_SCRIPT $LANG"
+fi
+
+# CPU and I/O priority of the settings for this script and the backup it
+# starts, see governor.py
+[ -n "$PYTHON" ] && $PYTHON "$MESSAGE_DIR/governor.py" apply $$ > /dev/null 2>&1
 
 # Device type detection
 case "${2:-HDD}" in
@@ -190,8 +203,9 @@ echo -n "$YELLOW"
 echo "$LINE"
 if [ -z "$TARGET" ]; then
     echo -n "$RED"
-    $SHOW "message15" 2>&1  # No backup media found!
+    $SHOW "message21" 2>&1  # No backup media found!
     echo -n "$WHITE"
+    [ -n "$PYTHON" ] && $PYTHON "$MESSAGE_DIR/result.py" write NO_TARGET > /dev/null 2>&1
     exit 1
 fi
 # Show target information
@@ -223,6 +237,43 @@ echo -n " -> $TARGET ($TOTALSIZE, "
 $SHOW "message16"  # Free
 echo "$FREESIZE)"
 
+# Size of the backup and free space on $1 in KB: "USED COMPRESSED NEEDED FREE",
+# sizeestimate.py answers from statvfs and its cache without walking the flash
+calculate_space() {
+    if [ -n "$PYTHON" ] && [ -f "$MESSAGE_DIR/sizeestimate.py" ] && \
+        $PYTHON "$MESSAGE_DIR/sizeestimate.py" estimate --target "$1" 2>/dev/null; then
+        return
+    fi
+    # No python: the used size of the root, uncompressed, as needed space
+    USEDSIZE=$(df -P -k / 2>/dev/null | tail -1 | awk '{print $3}')
+    FREESIZE=$(df -P -k "$1" 2>/dev/null | tail -1 | awk '{print $4}')
+    echo "${USEDSIZE:-0} ${USEDSIZE:-0} ${USEDSIZE:-0} ${FREESIZE:-0}"
+}
+
+# Old backups go first by the retention settings, so the space check below
+# counts the room they leave, see retention.py
+[ -n "$PYTHON" ] && [ -f "$MESSAGE_DIR/retention.py" ] && $PYTHON "$MESSAGE_DIR/retention.py" apply "$TARGET" --make-room
+read USEDSIZE ESTIMATED NEEDEDSPACE FREE_KB <<EOF
+$(calculate_space "$TARGET")
+EOF
+
+# ========================= SIZE WARNING (RED) ==============================
+if [ -z "$FREE_KB" ] || [ "$FREE_KB" -lt "$NEEDEDSPACE" ]; then
+    echo -n "$RED"
+    $SHOW "message30"  # Not enough free space on
+    echo -n "$TARGET"
+    $SHOW "message31"  # to make a back-up!
+    printf '%5s' "$((FREE_KB / 1024))"
+    $SHOW "message32"  # MB available space
+    printf '%5s' "$((NEEDEDSPACE / 1024))"
+    $SHOW "message33"  # MB needed space
+    echo " "
+    $SHOW "message34"  # The program will abort...
+    echo -n "$WHITE"
+    [ -n "$PYTHON" ] && $PYTHON "$MESSAGE_DIR/result.py" write NO_SPACE > /dev/null 2>&1
+    exit 1
+fi
+
 echo -n "$YELLOW"
 echo "$LINE"
 echo -n "$WHITE"
@@ -250,11 +301,11 @@ if [ -x "$BACKUP_SCRIPT" ]; then
     # Run backup
     "$BACKUP_SCRIPT" "$TARGET"
     ret=$?
-    sync
 else
     echo -n "$RED"
     $SHOW "message05" 2>&1  # Backup script not found!
     echo -n "$WHITE"
+    [ -n "$PYTHON" ] && $PYTHON "$MESSAGE_DIR/result.py" write NOT_FOUND --command "${BACKUP_SCRIPT##*/}" > /dev/null 2>&1
     exit 1
 fi
 echo -n "$YELLOW"
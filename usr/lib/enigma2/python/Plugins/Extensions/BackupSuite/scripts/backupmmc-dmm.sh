@@ -69,6 +69,47 @@ LANG="$1"
 DEVICE_TYPE="${2:-auto}"
 MEDIA="$3"
 
+# ===================== SYSTEM DETECTION =====================================
+if [ -d "/usr/lib64" ]; then
+    LIBDIR="/usr/lib64"
+else
+    LIBDIR="/usr/lib"
+fi
+PYBASE="$LIBDIR/enigma2/python/Plugins/Extensions/BackupSuite"
+
+# CPU and I/O priority of the settings for this script and all it starts,
+# see governor.py
+for py in python3 python2 python; do
+    if command -v $py >/dev/null 2>&1; then
+        $py "$PYBASE/governor.py" apply $$ > /dev/null 2>&1
+        break
+    fi
+done
+
+# Result code for the plugin, see result.py
+write_result() {
+    for py in python3 python2 python; do
+        if command -v $py >/dev/null 2>&1; then
+            $py "$PYBASE/result.py" write "$@" > /dev/null 2>&1
+            return
+        fi
+    done
+}
+write_result RUNNING
+
+# Space the backup needs in MB from the size estimate (see sizeestimate.py),
+# 300MB without python
+needed_space_mb() {
+    for py in python3 python2 python; do
+        if command -v $py >/dev/null 2>&1 && [ -f "$PYBASE/sizeestimate.py" ]; then
+            set -- $($py "$PYBASE/sizeestimate.py" estimate --copies 1 2>/dev/null)
+            [ -n "$3" ] && echo $(($3 / 1024)) && return
+            break
+        fi
+    done
+    echo 300
+}
+
 # ===================== MEDIA DETECTION ======================================
 detect_media() {
     echo -n "$BLUE"
@@ -80,6 +121,8 @@ detect_media() {
         return
     fi
 
+    min_space_mb=$(needed_space_mb)
+
     # Potential media locations
     candidates="/mmc /media/hdd /media/usb /media/mmc /mnt/usb /mnt/mmc"
 
@@ -105,7 +148,7 @@ detect_media() {
         free_kb=$(df -k "$candidate" | tail -1 | awk '{print $4}')
         free_mb=$((free_kb / 1024))
         
-        if [ $free_mb -lt 300 ]; then
+        if [ $free_mb -lt $min_space_mb ]; then
             echo "Insufficient space: ${free_mb}MB in $candidate"
             continue
         fi
@@ -120,6 +163,7 @@ detect_media() {
     echo -n "$RED"
     echo "ERROR: No suitable backup media found!"
     echo -n "$WHITE"
+    write_result NO_TARGET
     exit 1
 }
 
@@ -169,6 +213,7 @@ perform_backup() {
     mkdir -p "$TMP_DIR" || {
         echo -n "$RED"
         echo "ERROR: Cannot create temp directory!"
+        write_result FAILED --command mkdir
         exit 1
     }
 
@@ -233,5 +278,13 @@ perform_backup() {
 
 # ===================== MAIN EXECUTION =======================================
 detect_media
+# Old backups go by the retention settings, see retention.py
+for py in python3 python2 python; do
+    if command -v $py >/dev/null 2>&1; then
+        $py "$PYBASE/retention.py" apply "$MEDIA" --make-room --copies 1
+        break
+    fi
+done
 perform_backup
+write_result OK
 exit 0
\ No newline at end of file
@@ -65,6 +65,48 @@ LANG="$1"
 DEVICE_TYPE="$2"
 MEDIA="$3"
 
+# ==================== SYSTEM DETECTION =====================================
+if [ -d "/usr/lib64" ]; then
+    LIBDIR="/usr/lib64"
+else
+    LIBDIR="/usr/lib"
+fi
+PYBASE="$LIBDIR/enigma2/python/Plugins/Extensions/BackupSuite"
+PYTHON=""
+for py in python3 python2 python; do
+    if command -v $py >/dev/null 2>&1; then
+        PYTHON=$py
+        break
+    fi
+done
+# CPU and I/O priority of the settings for this script and all it starts,
+# see governor.py
+[ -n "$PYTHON" ] && $PYTHON "$PYBASE/governor.py" apply $$ > /dev/null 2>&1
+# Result code for the plugin, see result.py
+write_result() {
+    [ -n "$PYTHON" ] && $PYTHON "$PYBASE/result.py" write "$@" > /dev/null 2>&1
+}
+write_result RUNNING
+CORES=$(grep -c ^processor /proc/cpuinfo 2>/dev/null)
+[ -z "$CORES" ] && CORES=1
+
+# Compress stdin to bzip2 on stdout, on all cores when there is more than one
+compress_stream() {
+    if [ "$CORES" -gt 1 ] && [ -n "$PYTHON" ] && [ -f "$PYBASE/compressor.py" ]; then
+        $PYTHON "$PYBASE/compressor.py" -j "$CORES"
+    else
+        bzip2 -c
+    fi
+}
+
+# Dump a partition in large blocks, dd as fallback
+dump_partition() {
+    if [ -n "$PYTHON" ] && [ -f "$PYBASE/blockcopy.py" ]; then
+        $PYTHON "$PYBASE/blockcopy.py" "$1" "$2" --direct --digests "$TMP_DIR/digests" >/dev/null 2>&1 && return
+    fi
+    dd if="$1" of="$2" bs=1M 2>/dev/null
+}
+
 # ==================== MEDIA VERIFICATION ===================================
 echo -n "$YELLOW"
 echo "$LINE"
@@ -75,6 +117,7 @@ echo "Verifying media: $MEDIA"
     echo -n "$RED"
     echo "ERROR: Media path does not exist!"
     echo -n "$WHITE"
+    write_result NO_TARGET
     exit 1
 }
 
@@ -83,6 +126,7 @@ if ! touch "$MEDIA/bs_testfile" 2>/dev/null; then
     echo -n "$RED"
     echo "ERROR: Write permission denied!"
     echo -n "$WHITE"
+    write_result PERMISSION
     exit 1
 fi
 rm -f "$MEDIA/bs_testfile"
@@ -90,17 +134,24 @@ rm -f "$MEDIA/bs_testfile"
 # ==================== SPACE CHECK ==========================================
 echo -n "$GREEN"
 echo "Checking available space..."
-free_kb=$(df -k "$MEDIA" | tail -1 | awk '{print $4}')
-free_mb=$((free_kb / 1024))
-
-# Minimum required space (300MB)
+# Old backups go first by the retention settings, so the space check below
+# counts the room they leave, see retention.py
+[ -n "$PYTHON" ] && [ -f "$PYBASE/retention.py" ] && $PYTHON "$PYBASE/retention.py" apply "$MEDIA" --make-room --copies 1
+# Required space from the size estimate (see sizeestimate.py), 300MB without python
 min_space_mb=300
+if [ -n "$PYTHON" ] && [ -f "$PYBASE/sizeestimate.py" ]; then
+    set -- $($PYTHON "$PYBASE/sizeestimate.py" estimate --target "$MEDIA" --copies 1 2>/dev/null)
+    [ -n "$4" ] && min_space_mb=$(($3 / 1024)) && free_kb=$4
+fi
+[ -z "$free_kb" ] && free_kb=$(df -k "$MEDIA" | tail -1 | awk '{print $4}')
+free_mb=$((free_kb / 1024))
 if [ "$free_mb" -lt "$min_space_mb" ]; then
     echo -n "$RED"
     echo "ERROR: Insufficient disk space!"
     echo -n "$YELLOW"
     echo "Required: ${min_space_mb}MB, Available: ${free_mb}MB"
     echo -n "$WHITE"
+    write_result NO_SPACE
     exit 1
 fi
 
@@ -117,6 +168,7 @@ TMP_DIR="/tmp/mmc_backup_$$"
 mkdir -p "$TMP_DIR" || {
     echo -n "$RED"
     echo "ERROR: Cannot create temp directory!"
+    write_result FAILED --command mkdir
     exit 1
 }
 
@@ -134,15 +186,15 @@ if [ -z "$KERNEL_PARTITION" ]; then
 fi
 
 if [ -n "$KERNEL_PARTITION" ]; then
-    dd if="/dev/$KERNEL_PARTITION" of="$TMP_DIR/kernel.bin" bs=4k 2>/dev/null
+    dump_partition "/dev/$KERNEL_PARTITION" "$TMP_DIR/kernel.bin"
 else
     echo -n "$YELLOW"
     echo "WARNING: Kernel partition not found, skipping"
 fi
 
-# Backup rootfs
+# Backup rootfs, the tar stream is compressed on the fly
 echo "Phase 3/3: Backing up root filesystem"
-tar -C / -cpf "$TMP_DIR/rootfs.tar" \
+tar -C / -cpf - \
     --exclude='./proc/*' \
     --exclude='./sys/*' \
     --exclude='./dev/*' \
@@ -150,7 +202,7 @@ tar -C / -cpf "$TMP_DIR/rootfs.tar" \
     --exclude='./media/*' \
     --exclude='./run/*' \
     --exclude='./mnt/*' \
-    . 2>/dev/null
+    . 2>/dev/null | compress_stream > "$TMP_DIR/rootfs.tar.bz2"
 
 # Create final zip
 echo -n "$GREEN"
@@ -180,6 +232,9 @@ else
     echo "Backup created: $ZIP_FILE.tar.gz (${ZIP_SIZE})"
 fi
 
+# Only the archive is written to the disk, not every dirty page of the box
+[ -n "$PYTHON" ] && $PYTHON "$PYBASE/governor.py" fsync "$ZIP_FILE" "$ZIP_FILE.tar.gz" > /dev/null 2>&1
+
 # Cleanup
 rm -rf "$TMP_DIR"
 echo -n "$BLUE"
@@ -191,4 +246,5 @@ echo -n "$YELLOW"
 echo "$LINE"
 echo -n "$WHITE"
 
+write_result OK
 exit 0
\ No newline at end of file
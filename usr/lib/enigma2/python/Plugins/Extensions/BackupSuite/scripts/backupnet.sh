@@ -122,7 +122,20 @@ export HARDDISK=0
 
 # Find and validate message script
 MESSAGE_SCRIPT=$(find_message_script)
-export SHOW="$PYTHON $MESSAGE_SCRIPT $LANG"
+# Messages come from the compiled catalog of the language, see message.py
+MSGCATALOG="$MESSAGE_DIR/locale/messages.$LANG.sh"
+if [ ! -s "$MSGCATALOG" -o "$MESSAGE_SCRIPT" -nt "$MSGCATALOG" ] ; then
+    $PYTHON "$MESSAGE_SCRIPT" --compile "$LANG" "$MSGCATALOG" > /dev/null 2>&1 || rm -f "$MSGCATALOG"
+fi
+if [ -s "$MSGCATALOG" ] && . "$MSGCATALOG" ; then
+    SHOW="show_message"
+else
+    SHOW="$PYTHON $MESSAGE_SCRIPT $LANG"
+fi
+
+# CPU and I/O priority of the settings for this script and the backup it
+# starts, see governor.py
+[ -n "$PYTHON" ] && $PYTHON "$MESSAGE_DIR/governor.py" apply $$ > /dev/null 2>&1
 
 # echo -n "$YELLOW"
 # echo "$LINE"
@@ -142,6 +155,7 @@ mkdir -p "$IMAGE_DIR" || {
     echo -n "$RED"
     $SHOW "message42e" 2>&1  # Failed to create backup directories!
     echo -n "$WHITE"
+    [ -n "$PYTHON" ] && $PYTHON "$MESSAGE_DIR/result.py" write NETWORK > /dev/null 2>&1
     exit 1
 }
 
@@ -150,6 +164,7 @@ touch "$BASE_BACKUP_DIR/backupstick" || {
     echo -n "$RED"
     $SHOW "message42f" 2>&1  # Failed to create backup marker!
     echo -n "$WHITE"
+    [ -n "$PYTHON" ] && $PYTHON "$MESSAGE_DIR/result.py" write PERMISSION > /dev/null 2>&1
     exit 1
 }
 
@@ -189,45 +204,64 @@ validate_network_path() {
 # Validate network path
 if ! validate_network_path "$MEDIA"; then
     echo -n "$RED"
-    $SHOW "message42" 2>&1  # Invalid network path!
+    $SHOW "message42b" 2>&1  # Network path not specified!
     echo -n "$WHITE"
+    [ -n "$PYTHON" ] && $PYTHON "$MESSAGE_DIR/result.py" write NETWORK > /dev/null 2>&1
     exit 1
 fi
 echo -n "$YELLOW"
 echo "$LINE"
 echo -n "$WHITE"
 
+# A backup stopped by a share that went away is run again when the share is
+# back, at most RETRIES times. The share is checked after 30, 60, 120 ...
+# seconds, RETRY_WAIT seconds in all. The next run continues the rootfs
+# archive where the last one stopped, see compressor.py
+RETRIES=3
+RETRY_WAIT=900
+# An unmounted share leaves its mount point, a writable folder on the flash
+share_mounted() {
+    mountpoint -q "$MEDIA" 2>/dev/null || grep -q " $MEDIA " /proc/mounts
+}
+wait_for_share() {
+    local delay=30 waited=0
+    while [ $waited -lt $RETRY_WAIT ]; do
+        sleep $delay
+        waited=$((waited + delay))
+        delay=$((delay * 2))
+        if share_mounted && touch "$MEDIA/backup_test_$$.tmp" 2>/dev/null; then
+            rm -f "$MEDIA/backup_test_$$.tmp"
+            return 0
+        fi
+    done
+    return 1
+}
 
 
 # ==================== BACKUP SIZE ESTIMATION (GREEN) =======================
 echo -n "$YELLOW"
 echo "$LINE"
 echo -n "$GREEN"
-# Calculate required space - portable method
+# Size of the backup and free space on $1 in KB: "USED COMPRESSED NEEDED FREE",
+# sizeestimate.py answers from statvfs and its cache without walking the flash
 calculate_space() {
-    # Get used space in /usr
-    if command -v du >/dev/null; then
-        USEDSIZE=$(du -sk /usr 2>/dev/null | awk '{print $1}')
-    else
-        # Fallback to df if du not available
-        USEDSIZE=$(df -k /usr | awk 'NR>1 {print $3}')
-    fi
-
-    # Calculate needed space with 20% buffer
-    NEEDEDSPACE=$((USEDSIZE * 12 / 10))  # in KB
-
-    # Get free space on target
-    if command -v df >/dev/null; then
-        FREESIZE=$(df -P -k "$MEDIA" 2>/dev/null | tail -1 | awk '{print $(NF-2)}')
-    else
-        FREESIZE=0
+    if [ -n "$PYTHON" ] && [ -f "$MESSAGE_DIR/sizeestimate.py" ] && \
+        $PYTHON "$MESSAGE_DIR/sizeestimate.py" estimate --target "$1" 2>/dev/null; then
+        return
     fi
-
-    echo "$USEDSIZE $NEEDEDSPACE $FREESIZE"
+    # No python: the used size of the root, uncompressed, as needed space
+    USEDSIZE=$(df -P -k / 2>/dev/null | tail -1 | awk '{print $3}')
+    FREESIZE=$(df -P -k "$1" 2>/dev/null | tail -1 | awk '{print $4}')
+    echo "${USEDSIZE:-0} ${USEDSIZE:-0} ${USEDSIZE:-0} ${FREESIZE:-0}"
 }
 
+# Old backups go first by the retention settings, so the space check below
+# counts the room they leave, see retention.py
+[ -n "$PYTHON" ] && [ -f "$MESSAGE_DIR/retention.py" ] && $PYTHON "$MESSAGE_DIR/retention.py" apply "$MEDIA" --make-room
 # Check available space
-read USEDSIZE NEEDEDSPACE FREESIZE <<< $(calculate_space)
+read USEDSIZE ESTIMATED NEEDEDSPACE FREESIZE <<EOF
+$(calculate_space "$MEDIA")
+EOF
 # echo -n "$YELLOW"
 # echo "$LINE"
 # echo -n "$WHITE"
@@ -237,10 +271,11 @@ if [ -z "$FREESIZE" ] || [ "$FREESIZE" -lt "$NEEDEDSPACE" ]; then
     echo -n "$RED"
     $SHOW "message42d" 2>&1  # Insufficient free space!
     printf '%5s' "$((FREESIZE / 1024))"
-    $SHOW "message32"  # Available (MB):
+    $SHOW "message32"  # MB available space
     printf '%5s' "$((NEEDEDSPACE / 1024))"
-    $SHOW "message33"  # Needed (MB):
+    $SHOW "message33"  # MB needed space
     echo -n "$WHITE"
+    [ -n "$PYTHON" ] && $PYTHON "$MESSAGE_DIR/result.py" write NO_SPACE > /dev/null 2>&1
     exit 1
 fi
 echo -n "$YELLOW"
@@ -284,22 +319,35 @@ if [ -x "$BACKUP_SCRIPT" ]; then
     # Set executable permission
     chmod 755 "$BACKUP_SCRIPT" >/dev/null 2>&1
 
-    # Run backup
-    "$BACKUP_SCRIPT" "$BASE_BACKUP_DIR"
-    ret=$?
+    # Run backup, again when the share comes back after it went away
+    TRIES=1
+    while :; do
+        "$BACKUP_SCRIPT" "$BASE_BACKUP_DIR"
+        ret=$?
+        [ $ret -eq 0 ] || [ $TRIES -ge $RETRIES ] && break
+        [ "$(sed -n 's/^code=//p' /tmp/BackupSuite.result 2>/dev/null)" = "NETWORK" ] || ! share_mounted || break
+        echo "Network share lost, waiting for it to retry ($TRIES/$RETRIES)"
+        wait_for_share || break
+        TRIES=$((TRIES + 1))
+    done
 
-    # Append backup log to our logfile
+    # Append backup log to our logfile, rotated when it gets large (metrics.py)
     if [ -f "$BASE_BACKUP_DIR/BackupSuite.log" ]; then
+        [ -n "$PYTHON" ] && $PYTHON "$MESSAGE_DIR/metrics.py" rotate "$BASE_BACKUP_DIR/BackupSuite_full.log" > /dev/null 2>&1
         cat "$BASE_BACKUP_DIR/BackupSuite.log" >> "$BASE_BACKUP_DIR/BackupSuite_full.log"
     fi
 else
     echo -n "$RED"
-    $SHOW "message47" 2>&1  # Backup script not found!
+    echo -n "$BACKUP_SCRIPT "
+    $SHOW "message05" 2>&1  # not found, the backup process will be aborted!
     echo -n "$WHITE"
+    [ -n "$PYTHON" ] && $PYTHON "$MESSAGE_DIR/result.py" write NOT_FOUND --command "${BACKUP_SCRIPT##*/}" > /dev/null 2>&1
     ret=1
 fi
 
-sync
+# backupsuite.sh wrote its own files to the disk already, a sync would also
+# flush the dirty pages of a running recording
+[ -n "$PYTHON" ] && $PYTHON "$MESSAGE_DIR/governor.py" fsync "$BASE_BACKUP_DIR/BackupSuite.log" "$BASE_BACKUP_DIR/BackupSuite_full.log" > /dev/null 2>&1
 # # echo -n "$YELLOW"
 # # echo "$LINE"
 # echo -n "$WHITE"
@@ -324,12 +372,6 @@ if [ ${ret:-1} -eq 0 ]; then
     # Show backup location
     $SHOW "message50a" 2>&1  # Backup created in:
     echo " $IMAGE_DIR"
-
-    # Clean up old backups (keep last 3)
-    find "$MEDIA/backup" -maxdepth 1 -type d -name 'backup_*' 2>/dev/null |
-        sort |
-        head -n -3 |
-        xargs rm -rf 2>/dev/null
 else
     echo -n "$RED"
     $SHOW "message15" 2>&1  # Image creation FAILED!
@@ -108,26 +108,53 @@ find_python() {
 PYTHON_BIN=$(find_python)
 PY_EXT=$($PYTHON_BIN -c "import sys; print('pyc' if sys.version_info[0] == 3 else 'pyo')" 2>/dev/null || echo "py")
 
-# Python module name
-PYNAME="message"
-
 # Python file path
 PYBASE="$LIBDIR/enigma2/python/Plugins/Extensions/BackupSuite"
-LANG="$1"
+# The wrapper scripts export the language, $1 is the backup media. It is part
+# of the catalog path below, so nothing with a "/" is taken
+LANG="${LANG:-en}"
+case "$LANG" in
+    */*) LANG=en ;;
+esac
+
+# Run one of the python helpers of the plugin, compiled version first
+pyhelper()
+{
+HELPER="$PYBASE/$1"
+shift
+if [ -f "$HELPER.$PY_EXT" ] ; then
+    $PYTHON_BIN "$HELPER.$PY_EXT" "$@"
+else
+    $PYTHON_BIN "$HELPER.py" "$@"
+fi
+}
 
-# Fallback to .py if .pyc doesn't exist
-if [ -f "$PYBASE/$PYNAME.$PY_EXT" ]; then
-    SHOW="$PYTHON_BIN $PYBASE/$PYNAME.$PY_EXT $LANG"
-elif [ -f "$PYBASE/$PYNAME.py" ]; then
-    SHOW="$PYTHON_BIN $PYBASE/$PYNAME.py $LANG"
+# The messages of the language are compiled once into a shell file, printing
+# one is then a shell function instead of a python start per line
+MSGCATALOG="$PYBASE/locale/messages.$LANG.sh"
+for SOURCE in "$PYBASE/message.py" "$PYBASE/message.$PY_EXT" "$PYBASE/locale/$LANG/LC_MESSAGES/BackupSuite.mo" ; do
+    [ "$SOURCE" -nt "$MSGCATALOG" ] && rm -f "$MSGCATALOG"
+done
+if [ ! -s "$MSGCATALOG" ] ; then
+    pyhelper message --compile "$LANG" "$MSGCATALOG" > /dev/null 2>&1 || {
+        MSGCATALOG="/tmp/backupsuite-messages.$LANG.sh"
+        pyhelper message --compile "$LANG" "$MSGCATALOG" > /dev/null 2>&1
+    }
+fi
+if [ -s "$MSGCATALOG" ] && . "$MSGCATALOG" ; then
+    SHOW="show_message"
+elif [ -f "$PYBASE/message.$PY_EXT" -o -f "$PYBASE/message.py" ] ; then
+    SHOW="pyhelper message $LANG"
 else
     echo -n "$RED"
-    echo "Neither $PYBASE/$PYNAME.$PY_EXT nor .py found!" >&2
+    echo "Neither $PYBASE/message.$PY_EXT nor .py found!" >&2
     echo -n "$WHITE"
     exit 1
 fi
 
-export SHOW
+# Number of cores, more than one means the parallel compressor is used
+CORES=`grep -c ^processor /proc/cpuinfo 2>/dev/null`
+[ -z "$CORES" ] && CORES=1
 # echo -n "$YELLOW"
 # echo "$LINE"
 # echo -n "$WHITE"
@@ -174,6 +201,37 @@ log()
 {
 echo "$*" >> $LOGFILE
 }
+############################ TIMING OF THE PHASES #############################
+# Every phase is timed for speedhistory.py, which makes the next estimate
+# from them, and for the metrics of the backup (metrics.py).
+# phase_start PHASE, phase_done PHASE KB [OUTPUT] [TARGET]: KB went into the
+# phase, the size of OUTPUT (file or folder) came out, time in centiseconds
+phase_start()
+{
+PHASESTART=`tr -d . < /proc/uptime | cut -d " " -f 1`
+echo "$1" > "$PHASEMARK"
+}
+phase_done()
+{
+KBOUT=0
+[ -n "$3" ] && KBOUT=`du -sk "$3" 2> /dev/null | cut -f 1`
+echo "$1 $2 $((`tr -d . < /proc/uptime | cut -d " " -f 1`-$PHASESTART)) ${KBOUT:-0} ${4:-$MEDIA}" >> "$PHASELOG"
+}
+########################### PROGRESS FOR THE SCREEN ###########################
+# progress.py writes bytes done / expected of the running phase to a status
+# file, the console screen of the plugin shows it as a progress bar
+# follow_file PHASE FILE EXPECTEDKB COMMAND...: run COMMAND and follow FILE
+follow_file()
+{
+PHASE="$1"
+FILE="$2"
+EXPECTEDKB="$3"
+shift 3
+"$@" &
+FOLLOWPID=$!
+pyhelper progress watch "$PHASE" "$FILE" "$EXPECTEDKB" --pid $FOLLOWPID
+wait $FOLLOWPID
+}
 ########################## DEFINE CLEAN-UP ROUTINE ############################
 clean_up()
 {
@@ -181,10 +239,76 @@ umount /tmp/bi/root > /dev/null 2>&1
 rmdir /tmp/bi/root > /dev/null 2>&1
 rmdir /tmp/bi > /dev/null 2>&1
 rm -rf "$WORKDIR" > /dev/null 2>&1
+[ -n "$NEWDEST" ] && rm -rf "$NEWDEST"
+[ -z "$KEEPRESUME" ] && rm -rf "$RESUMEDIR"
+[ -n "$ZIPSTREAM" ] && rm -f "$ZIPSTREAM"
+[ -n "$SAMPLERPID" ] && kill $SAMPLERPID > /dev/null 2>&1
+pyhelper progress done
+}
+########################### CANCELLED FROM THE PLUGIN ##########################
+# The job manager of the plugin cancels with SIGTERM, nothing is left behind
+cancelled()
+{
+log "CANCELLED"
+write_result CANCELLED
+clean_up
+exit 143
+}
+trap cancelled INT TERM HUP
+########################## RESULT FOR THE PLUGIN ##############################
+# A stable code instead of log texts, see result.py for the codes
+RESULTFILE=/tmp/BackupSuite.result
+write_result()
+{
+{
+echo "code=$1"
+echo "phase=`cat "$PHASEMARK" 2> /dev/null`"
+echo "command=$2"
+echo "folder=$MAINDEST"
+echo "time=`date +%s`"
+} > "$RESULTFILE.tmp" && mv -f "$RESULTFILE.tmp" "$RESULTFILE"
+}
+# Field $2 of the line in /proc/mounts of the mount $MEDIA is on
+media_mount()
+{
+awk -v m="$MEDIA/" -v f=$1 'index(m, $2 "/") == 1 && length($2) >= l { l = length($2) ; v = $f } END { print v }' /proc/mounts
+}
+# Why a command failed, from the state of the backup media. Asked before the
+# clean up, which frees the space of the work folder again
+failure_code()
+{
+case "`media_mount 3`" in
+    cifs|smb*|nfs*) NETFS=1 ;;
+    *) NETFS=0 ;;
+esac
+if [ -z "$MEDIA" ] || [ ! -d "$MEDIA" ] ; then
+    [ $NETFS = 1 -o "$DEVICE_TYPE" = "NET" ] && echo NETWORK || echo NO_TARGET
+elif [ $NETFS = 0 -a "$DEVICE_TYPE" = "NET" ] ; then
+    # The share is unmounted, its mount point is left on the flash
+    echo NETWORK
+elif ! touch "$MEDIA/.backupsuite-write-test" > /dev/null 2>&1 ; then
+    case ",`media_mount 4`," in
+        *,ro,*) echo READ_ONLY ;;
+        *) [ $NETFS = 1 ] && echo NETWORK || echo PERMISSION ;;
+    esac
+else
+    rm -f "$MEDIA/.backupsuite-write-test"
+    FREEKB=`df -P -k "$MEDIA" 2> /dev/null | awk 'END { print $4 }'`
+    if [ "${FREEKB:-0}" -lt 4096 ] 2> /dev/null ; then
+        echo NO_SPACE
+    else
+        echo FAILED
+    fi
+fi
 }
 ###################### BIG OOPS!, HOLY SH... (SHELL SCRIPT :-))################
+# big_fail [CODE] [COMMAND], without a code failure_code finds it
 big_fail()
 {
+CODE=${1:-`failure_code`}
+write_result "$CODE" "$2"
+# The next backup continues the rootfs archive, unless it is what fills the media
+[ "$CODE" != NO_SPACE ] && KEEPRESUME=1
 if [ -d $WORKDIR ] ; then
     log "FAIL!"
     log "Content so far of the working directory $WORKDIR "
@@ -194,7 +318,7 @@ clean_up
 echo -n "$RED"
 $SHOW "message15" 2>&1 | tee -a $LOGFILE # Image creation FAILED!
 echo -n "$WHITE"
-exit 0
+exit 1
 }
 ############################ DEFINE IMAGE_VERSION #############################
 image_version()
@@ -210,12 +334,32 @@ echo
 echo $LINE
 }
 #################### CLEAN UP AND MAKE DESTINATION FOLDERS ####################
+# The new image is put together in $NEWDEST, the last complete one stays in
+# $MAINDEST until commit_folders swaps them
 make_folders()
 {
-rm -rf "$MAINDEST"
-log "Removed directory  = $MAINDEST"
-mkdir -p "$MAINDEST"
-log "Created directory  = $MAINDEST"
+NEWDEST="$MAINDEST.new"
+rm -rf "$NEWDEST"
+mkdir -p "$NEWDEST"
+log "Created directory  = $NEWDEST"
+}
+commit_folders()
+{
+if [ -d "$MAINDEST" ] ; then
+    mv "$MAINDEST" "$MAINDEST.old"
+fi
+mv "$NEWDEST" "$MAINDEST" && NEWDEST=""
+rm -rf "$MAINDEST.old"
+log "Committed directory = $MAINDEST"
+}
+# A backup that stopped in commit_folders left the last image in $MAINDEST.old
+restore_folders()
+{
+if [ -d "$MAINDEST.old" -a ! -d "$MAINDEST" ] ; then
+    mv "$MAINDEST.old" "$MAINDEST"
+    log "Restored directory = $MAINDEST"
+fi
+rm -rf "$MAINDEST.old" "$MAINDEST.new"
 }
 ################ CHECK FOR THE NEEDED BINARIES IF THEY EXIST ##################
 checkbinary()
@@ -223,13 +367,174 @@ checkbinary()
 if [ ! -f "$1" ] ; then {
     echo -n "$1 " ; $SHOW "message05"
     } 2>&1 | tee -a $LOGFILE
-    big_fail
+    big_fail TOOL_MISSING "$1"
 elif [ ! -x "$1" ] ; then
     {
     echo "Error: $1 " ; $SHOW "message35"
     } 2>&1 | tee -a $LOGFILE
-    big_fail
+    big_fail TOOL_MISSING "$1"
+fi
+}
+###################### ONE RECEIVER FROM THE DATABASE #########################
+# The lookuptables are compiled by receiverdb.py into one checked line per
+# model (fields separated by "|"), all the fields come from a single grep.
+# Without python the line is cut from the lookuptable as before.
+receiver_entry()
+{
+for SOURCE in $TABLES "$PYBASE/receiverdb.py" "$PYBASE/receiverdb.$PY_EXT" ; do
+    [ "$SOURCE" -nt "$RECEIVERDB" ] && rm -f "$RECEIVERDB"
+done
+if [ ! -s "$RECEIVERDB" ] ; then
+    pyhelper receiverdb compile "$RECEIVERDB" $TABLES > /dev/null 2>> $LOGFILE || {
+        RECEIVERDB="/tmp/backupsuite-`basename $RECEIVERDB`"
+        pyhelper receiverdb compile "$RECEIVERDB" $TABLES > /dev/null 2>&1
+    }
+fi
+if [ -s "$RECEIVERDB" ] ; then
+    grep -m1 "^$1|" "$RECEIVERDB" || grep -v "^#" "$RECEIVERDB" | grep -w -m1 "$1"
+else
+    grep -w -m1 "$1" $LOOKUP | awk -F "\t" -v OFS="|" '{print $2, $1, $3, $4, $5, $6, $7, $8, $9, $10, $11}'
+fi
+}
+################ STREAM THE ROOTFS TAR STRAIGHT INTO BZIP2 ####################
+# $1 = source directory, $2 = archive to write, the rest are extra tar options
+# Only the compressed archive ever touches the backup media, no rootfs.tar.
+# On multi-core boxes it grows in $RESUMEDIR with a checkpoint journal, a
+# backup that stopped halfway is continued there by the next one, up to the
+# first part of the tar stream that changed since, see compressor.py.
+# Single-core boxes keep bzip2, which is faster there.
+# The exit status of tar is kept in a file, the pipeline only returns that of
+# the last command and a tar that died halfway still leaves valid bzip2.
+tar_bzip2()
+{
+SRCDIR="$1"
+ARCHIVE="$2"
+shift 2
+if [ "$CORES" -gt 1 ] ; then
+    CHECKPOINT="$RESUMEDIR/${ARCHIVE##*/}"
+    mkdir -p "$RESUMEDIR"
+    OUTPUT=/dev/null
+else
+    OUTPUT="$ARCHIVE"
+fi
+rm -f "$WORKDIR/tar.status"
+if [ -n "$ZIPSTREAM" ] ; then
+    { $MKFS -cf - -C "$SRCDIR" "$@" . ; echo $? > "$WORKDIR/tar.status" ; } | pyhelper progress meter tar $USEDsizekb | archive_stream | pyhelper zipstore tee "$ZIPSTREAM" "${MAINDEST#/}/${ARCHIVE##*/}" "$WORKDIR/digests" "${ARCHIVE##*/}" > "$OUTPUT"
+else
+    { $MKFS -cf - -C "$SRCDIR" "$@" . ; echo $? > "$WORKDIR/tar.status" ; } | pyhelper progress meter tar $USEDsizekb | archive_stream | pyhelper imagemanifest tee "$WORKDIR/digests" "${ARCHIVE##*/}" > "$OUTPUT"
+fi
+TARSTATUS=`cat "$WORKDIR/tar.status" 2> /dev/null`
+# GNU tar returns 1 when a file changed while it was read, the archive is complete
+if [ "$TARSTATUS" = 1 ] && $MKFS --version 2> /dev/null | grep -q GNU ; then
+    log "tar: files changed while they were read"
+elif [ "$TARSTATUS" != 0 ] ; then
+    log "tar failed with status ${TARSTATUS:-unknown}"
+    rm -f "$ARCHIVE"
+    big_fail "" tar
+fi
+if [ "$CORES" -gt 1 ] && tail -n 1 "$CHECKPOINT.journal" 2> /dev/null | grep -q "^end " ; then
+    mv "$CHECKPOINT" "$ARCHIVE"
+    rm -rf "$RESUMEDIR"
+fi
+}
+# Compress stdin to stdout, multi-core boxes with the checkpoint journal
+archive_stream()
+{
+if [ "$CORES" -gt 1 ] ; then
+    pyhelper compressor -j $CORES -o "$CHECKPOINT" -c "$CHECKPOINT.journal" 2>> $LOGFILE
+else
+    $BZIP2 -c
+fi
+}
+###################### COMPRESS STDIN TO BZIP2 ON STDOUT ######################
+# Multi-core boxes use the parallel compressor, it writes independent bzip2
+# streams that bzip2, tar -xjf and ofgwrite read like any other .bz2 file
+compress_stream()
+{
+if [ "$CORES" -gt 1 ] ; then
+    pyhelper compressor -j $CORES
+else
+    $BZIP2 -c
+fi
+}
+####################### DIFFERENTIAL ROOTFS BACK-UP ###########################
+# Only the entries changed since $BASEMANIFEST go in rootfs.diff.tar.bz2, the
+# result lands in the dated folder, the last full backup stays untouched.
+# incremental.py restore <folder> rebuilds the full rootfs tar from the chain.
+differential_backup()
+{
+DIFFDEST="$MEDIA$EXTR1$FOLDER"
+log "Differential backup against $BASEMANIFEST"
+pyhelper incremental diff /tmp/bi/root "$BASEMANIFEST" "$WORKDIR/rootfs.manifest" $EXCLUDE 2>> $LOGFILE | compress_stream > "$WORKDIR/rootfs.diff.tar.bz2"
+if [ ! -s "$WORKDIR/rootfs.manifest" ] ; then
+    log "$WORKDIR/rootfs.manifest NOT FOUND"
+    big_fail "" incremental
+fi
+mkdir -p "$DIFFDEST"
+mv "$WORKDIR/rootfs.diff.tar.bz2" "$WORKDIR/rootfs.manifest" "$DIFFDEST"
+if [ -f "$WORKDIR/$KERNELNAME" ] ; then
+    mv "$WORKDIR/$KERNELNAME" "$DIFFDEST"
+fi
+image_version > "$DIFFDEST/imageversion"
+log "DIFFERENTIAL BACKUP MADE IN: $DIFFDEST"
+cp $LOGFILE "$DIFFDEST"
+write_result OK
+clean_up
+exit 0
+}
+########### THE FILES OF THE IMAGE FOLDER BESIDES KERNEL AND ROOTFS ###########
+# $1 = folder: the update markers, imageversion and the extra partitions
+image_files()
+{
+if [ $ACTION = "noforce" ] ; then
+    echo "rename this file to 'force' to force an update without confirmation" > "$1/noforce";
+elif [ $ACTION = "reboot" ] ; then
+    echo "rename this file to 'force.update' to force an update without confirmation" > "$1/reboot.update"
+elif [ $ACTION = "force" ] ; then
+    echo "rename this file to 'force.update' to be able to flash this backup" > "$1/noforce.update"
+    echo "Rename the file in the folder /vuplus/$SEARCH/noforce.update to /vuplus/$SEARCH/force.update to flash this image"
 fi
+if [ $SEARCH = "zero4k" -o $SEARCH = "uno4k" -o $SEARCH = "uno4kse" -o $SEARCH = "ultimo4k" -o $SEARCH = "solo4k" -o $SEARCH = "duo4k" -o $SEARCH = "duo4kse" ] ; then
+    echo "rename this file to 'mkpart.update' for forces create partition and kernel update." > "$1/nomkpart.update"
+fi
+image_version > "$1/imageversion"
+if [ $SEARCH = "lunix3-4k" -o $SEARCH = "lunix4k" -o $SEARCH = "galaxy4k" -o $SEARCH = "revo4k" ] ; then
+    if [ -f /boot/initrd_run.bin ] ; then
+        dump_partition /boot/initrd_run.bin "$1/initrd_run.bin"
+    fi
+fi
+if [ $SEARCH = "h9" -o $SEARCH = "h9se" -o $SEARCH = "h9combo" -o $SEARCH = "h9combose" -o $SEARCH = "i55plus" -o $SEARCH = "i55se" -o $SEARCH = "h10" -o $SEARCH = "hzero" -o $SEARCH = "h8" -o $SEARCH = "h8.2h" -o $SEARCH = "h9.s" -o $SEARCH = "h9.t" -o $SEARCH = "h9.2h" -o $SEARCH = "h9.2s" -o $SEARCH = "h9twin" -o $SEARCH = "h9twinse" ] ; then
+    log "Zgemma hisilicon found, copying additional files for flashing"
+    dump_partition /dev/mtd0 "$1/fastboot.bin"
+    dump_partition /dev/mtd1 "$1/bootargs.bin"
+    cp -r "$1/fastboot.bin" "$MEDIA/zgemma/fastboot.bin" > /dev/null 2>&1
+    cp -r "$1/bootargs.bin" "$MEDIA/zgemma/bootargs.bin" > /dev/null 2>&1
+    dump_partition /dev/mtd2 "$1/baseparam.bin"
+    dump_partition /dev/mtd3 "$1/pq_param.bin"
+fi
+}
+######################## BACK-UP INTO THE SHARED STORE ########################
+# Only chunks the store does not know yet are written, the image folder is
+# rebuilt on demand with dedupstore.py restore. Falls back to a normal backup.
+store_backup()
+{
+log "Storing the backup in $STORE"
+mkdir -p "$WORKDIR/image"
+image_files "$WORKDIR/image"
+if pyhelper dedupstore backup "$STORE" "`hostname`" /tmp/bi/root "$WORKDIR/$KERNELNAME" "$WORKDIR/image"/* --folder "$FOLDER" --rootname "$ROOTNAME" $EXCLUDE >> $LOGFILE 2>&1 ; then
+    log "BACKUP STORED IN: $STORE"
+    write_result OK
+    clean_up
+    exit 0
+fi
+log "Storing the backup failed, making a normal backup"
+rm -rf "$WORKDIR/image"
+}
+############### DUMP A PARTITION IN LARGE BLOCKS WITH ITS SHA256 ##############
+# $1 = device, $2 = image file, the digest is added to $WORKDIR/digests
+dump_partition()
+{
+pyhelper blockcopy "$1" "$2" --direct --digests "$WORKDIR/digests" >> $LOGFILE 2>&1 || dd if="$1" of="$2" bs=1M > /dev/null 2>&1
 }
 ################### BACK-UP MADE AND REPORTING SIZE ETC. ######################
 backup_made()
@@ -268,23 +573,46 @@ MEDIA="$1"
 MKFS=/usr/sbin/mkfs.ubifs
 MTDPLACE=`cat /proc/mtd | grep -w "kernel" | cut -d ":" -f 1`
 NANDDUMP=/usr/sbin/nanddump
+PHASELOG=/tmp/BackupSuite.phases
+PHASEMARK=/tmp/BackupSuite.phase
+RSSLOG=/tmp/BackupSuite.rss
+rm -f "$PHASELOG" "$RSSLOG"
+echo start > "$PHASEMARK"
+write_result RUNNING
+pyhelper progress done
 START=$(date +%s)
+# CPU and I/O priority of the settings for this script and all it starts,
+# see governor.py
+pyhelper governor apply $$ > /dev/null 2>&1
+# Peak memory of every phase for the metrics, the sampler ends with the script
+pyhelper metrics sample $$ "$PHASEMARK" "$RSSLOG" > /dev/null 2>&1 &
+SAMPLERPID=$!
 if [ -f "/etc/lookuptable.txt" ] ; then
     LOOKUP="/etc/lookuptable.txt"
     $SHOW "message36"
+    RECEIVERDB="$PYBASE/receivers.etc.db"
+    TABLES="$LOOKUP $PYBASE/lookuptable.txt"
 else
     LOOKUP="$LIBDIR/enigma2/python/Plugins/Extensions/BackupSuite/lookuptable.txt"
+    RECEIVERDB="$PYBASE/receivers.db"
+    TABLES="$LOOKUP"
 fi
 TARGET="XX"
 UBINIZE=/usr/sbin/ubinize
-USEDsizebytes=`df -B 1 /usr/ | grep [0-9]% | tr -s " " | cut -d " " -f 3`
-USEDsizekb=`df -k /usr/ | grep [0-9]% | tr -s " " | cut -d " " -f 3`
+# Root filesystem size from statvfs and cached totals, see sizeestimate.py
+USEDsizekb=`pyhelper sizeestimate estimate 2> /dev/null | cut -d " " -f 1`
+if [ -z "$USEDsizekb" ] ; then
+    USEDsizekb=`df -k /usr/ | grep [0-9]% | tr -s " " | cut -d " " -f 3`
+fi
+USEDsizebytes=$(($USEDsizekb*1024))
 if [ -f "/var/lib/opkg/info/enigma2-plugin-extensions-backupsuite.control" ] ; then
     VERSION="Version: "`cat /var/lib/opkg/info/enigma2-plugin-extensions-backupsuite.control | grep "Version: " | cut -d "+" -f 2`
 else
     VERSION=`$SHOW "message37"`
 fi
 WORKDIR="$MEDIA/bi"
+# The rootfs archive of a backup that stopped halfway, kept for the next one
+RESUMEDIR="$MEDIA/bi.resume"
 
 # ====================== DEVICE INFORMATION (PURPLE) =========================
 echo -n "$YELLOW"
@@ -293,6 +621,7 @@ echo -n "$PURPLE"
 # TEST IF RECEIVER IS SUPPORTED AND READ THE VARIABLES FROM THE LOOKUPTABLE #
 if [ -f /etc/modules-load.d/dreambox-dvb-modules-dm*.conf ] || [ -f /etc/modules-load.d/10-dreambox-dvb-modules-dm*.conf ] ; then
     log "It's a dreambox! Not compatible with this script."
+    write_result UNSUPPORTED
     exit 1
 else
     if [ -f /etc/openvision/model ] ; then
@@ -317,32 +646,28 @@ else
         else
             echo -n "$RED"
             $SHOW "message01" 2>&1 | tee -a $LOGFILE # No supported receiver found!
-            big_fail
+            big_fail NO_RECEIVER
         fi
     fi
 fi
-cat $LOOKUP | cut -f 2 | grep -qw "$SEARCH"
-if [ "$?" = "1" ] ; then
+phase_start lookup
+ENTRY=`receiver_entry "$SEARCH"`
+phase_done lookup 0
+if [ -z "$ENTRY" ] ; then
     echo -n "$RED"
     $SHOW "message01" 2>&1 | tee -a $LOGFILE # No supported receiver found!
-    big_fail
+    big_fail NO_RECEIVER
 else
-    MODEL=`cat $LOOKUP | grep -w -m1 "$SEARCH" | cut -f 2`
-    SHOWNAME=`cat $LOOKUP | grep -w -m1 "$SEARCH" | cut -f 3`
-    FOLDER="`cat $LOOKUP | grep -w -m1 "$SEARCH" | cut -f 4`"
-    EXTR1="`cat $LOOKUP | grep -w -m1 "$SEARCH" | cut -f 5`/$DATE"
-    EXTR2="`cat $LOOKUP | grep -w -m1 "$SEARCH" | cut -f 6`"
+    IFS="|" read -r MODEL BRAND SHOWNAME FOLDER EXTR1 EXTR2 MKUBIFS_ARGS UBINIZE_ARGS ROOTNAME KERNELNAME ACTION <<EOF
+$ENTRY
+EOF
+    EXTR1="$EXTR1/$DATE"
     EXTRA="$MEDIA$EXTR1$EXTR2"
     if  [ $HARDDISK = 1 ]; then
         MAINDEST="$MEDIA$EXTR1$FOLDER"
     else
         MAINDEST="$MEDIA$FOLDER"
     fi
-    MKUBIFS_ARGS=`cat $LOOKUP | grep -w -m1 "$SEARCH" | cut -f 7`
-    UBINIZE_ARGS=`cat $LOOKUP | grep -w -m1 "$SEARCH" | cut -f 8`
-    ROOTNAME=`cat $LOOKUP | grep -w -m1 "$SEARCH" | cut -f 9`
-    KERNELNAME=`cat $LOOKUP | grep -w -m1 "$SEARCH" | cut -f 10`
-    ACTION=`cat $LOOKUP | grep -w -m1 "$SEARCH" | cut -f 11`
     if [ $ROOTNAME = "rootfs.tar.bz2" ] ; then
         MKFS=/bin/tar
         checkbinary $MKFS
@@ -356,6 +681,35 @@ else
     fi
 fi
 log "Destination        = $MAINDEST"
+########################## NAME OF THE ZIP ARCHIVE ############################
+# The rootfs is stored in the ZIP while it is being written, the rest of the
+# image is added in the ZIP stage
+ISSUE1=`cat /etc/issue | grep . | tail -n 1 | sed -e 's/[\t ]//g;/^$/d'`
+VER=${ISSUE1%????}
+# Check if MODEL is empty, fallback to hostname short name
+if [ -z "$MODEL" ]; then
+    MODEL=$(hostname -s 2>/dev/null)
+fi
+if [ -z "$MODEL" ]; then
+    MODEL="unknownmodel"
+fi
+mkdir -p $MEDIA/imagebackups
+ZIPFILE="$MEDIA/imagebackups/backup-$VER-$MODEL-$DATE.zip"
+ZIPSTREAM="$ZIPFILE.part"
+rm -f "$ZIPSTREAM"
+# A backupsuite-store folder on the media turns the deduplicating store on
+STORE="$MEDIA/backupsuite-store"
+###################### BASE FOR DIFFERENTIAL BACK-UPS #########################
+# BACKUPSUITE_MODE=diff makes a differential backup, against the backup folder
+# in BACKUPSUITE_BASE or else the newest one holding a manifest. Only with a
+# mode (BACKUPSUITE_MODE=full for a base to start from) or the store a full
+# backup gets the manifest, it reads the whole rootfs once more.
+BACKUPMODE="$BACKUPSUITE_MODE"
+if [ -n "$BACKUPSUITE_BASE" ] ; then
+    BASEMANIFEST="$BACKUPSUITE_BASE/rootfs.manifest"
+else
+    BASEMANIFEST=`ls -t "$MEDIA${EXTR1%/*}"/*"$FOLDER"/rootfs.manifest 2>/dev/null | head -n 1`
+fi
 echo -n "$YELLOW"
 echo "$LINE"
 echo -n "$WHITE"
@@ -391,10 +745,14 @@ echo -n "KERNEL" ; $SHOW "message04" ; printf '%6s' $(($KERNEL/1024)); echo ' KB
 echo -n "ROOTFS" ; $SHOW "message04" ; printf '%6s' $USEDsizekb; echo ' KB'
 echo -n "=TOTAL" ; $SHOW "message04" ; printf '%6s' $KILOBYTES; echo " KB (= $MEGABYTES MB)"
 } 2>&1 | tee -a $LOGFILE
-if [ $ROOTNAME = "rootfs.tar.bz2" ] ; then
-    ESTTIMESEC=$(($KILOBYTES/($ESTSPEED*3)))
-else
-    ESTTIMESEC=$(($KILOBYTES/$ESTSPEED))
+# From the speeds of earlier backups of this model to this target
+ESTTIMESEC=`pyhelper speedhistory eta "$SEARCH" "$MEDIA" $USEDsizekb $(($KERNEL/1024)) --rootname $ROOTNAME 2> /dev/null`
+if [ -z "$ESTTIMESEC" ] ; then
+    if [ $ROOTNAME = "rootfs.tar.bz2" ] ; then
+        ESTTIMESEC=$(($KILOBYTES/($ESTSPEED*3)))
+    else
+        ESTTIMESEC=$(($KILOBYTES/$ESTSPEED))
+    fi
 fi
 ESTMINUTES=$(( $ESTTIMESEC/60 ))
 ESTSECONDS=$(( $ESTTIMESEC-(( 60*$ESTMINUTES ))))
@@ -437,9 +795,9 @@ rm -rf "$WORKDIR"        # GETTING RID OF THE OLD REMAINS IF ANY
 log "Remove directory   = $WORKDIR"
 mkdir -p "$WORKDIR"      # MAKING THE WORKING FOLDER WHERE EVERYTHING HAPPENS
 log "Recreate directory = $WORKDIR"
+restore_folders
 mkdir -p /tmp/bi/root # this is where the complete content will be available
 log "Create directory   = /tmp/bi/root"
-sync
 mount --bind / /tmp/bi/root # the complete root at /tmp/bi/root
 ## TEMPORARY WORKAROUND TO REMOVE
 ##      /var/lib/samba/private/msg.sock
@@ -490,53 +848,53 @@ echo -n $GREEN
 $SHOW "message51" 2>&1 | tee -a $LOGFILE   # Dumping kernel (25%)
 $SHOW "message07" 2>&1 | tee -a $LOGFILE   # Create: kernel dump
 echo -n $WHITE
-if [ $ROOTNAME != "rootfs.tar.bz2" -o $SEARCH = "h9" -o $SEARCH = "i55plus" -o $SEARCH = "i55se" -o $SEARCH = "hzero" -o $SEARCH = "h8" -o $SEARCH = "h8.2h" -o $SEARCH = "h9.s" -o $SEARCH = "h9.t" -o $SEARCH = "h9.2h" -o $SEARCH = "h9.2s" ] ; then
+phase_start kernel
+pyhelper progress phase kernel $(($KERNEL/1024))
+# Where the kernel is, the model table is in boxprofile.py
+KERNELLOCATION=`pyhelper boxprofile --kernel $SEARCH 2> /dev/null`
+KERNELDEVICE=${KERNELLOCATION#* }
+if [ $ROOTNAME != "rootfs.tar.bz2" -o "${KERNELLOCATION%% *}" = "mtd" ] ; then
     log "Kernel resides on $MTDPLACE"                     # Just for testing purposes
-    $NANDDUMP /dev/$MTDPLACE -qf "$WORKDIR/$KERNELNAME"
-    if [ -f "$WORKDIR/$KERNELNAME" ] ; then
+    # The redirect makes the file even when nanddump fails, its status is
+    # carried out of the pipe like that of tar in tar_bzip2
+    rm -f "$WORKDIR/nanddump.status"
+    { $NANDDUMP /dev/$MTDPLACE -q ; echo $? > "$WORKDIR/nanddump.status" ; } | pyhelper imagemanifest tee "$WORKDIR/digests" "$KERNELNAME" > "$WORKDIR/$KERNELNAME"
+    NANDSTATUS=`cat "$WORKDIR/nanddump.status" 2> /dev/null`
+    if [ "$NANDSTATUS" = 0 ] && [ -s "$WORKDIR/$KERNELNAME" ] ; then
         echo -n "Kernel dumped  :"  >> $LOGFILE
         ls $LS_OPTIONS "$WORKDIR/$KERNELNAME" | awk 'END{print $9}' >> $LOGFILE
     else
-        log "$WORKDIR/$KERNELNAME NOT FOUND"
-        big_fail
+        log "nanddump /dev/$MTDPLACE failed with status ${NANDSTATUS:-unknown}, $WORKDIR/$KERNELNAME is empty or incomplete"
+        rm -f "$WORKDIR/$KERNELNAME"
+        big_fail "" nanddump
     fi
     log "--------------------------"
 else
-    if [ $SEARCH = "solo4k" -o $SEARCH = "vusolo4k" -o $SEARCH = "ultimo4k" -o $SEARCH = "vuultimo4k" -o $SEARCH = "uno4k" -o $SEARCH = "vuuno4k" -o $SEARCH = "uno4kse" -o $SEARCH = "vuuno4kse" -o $SEARCH = "lunix3-4k" -o $SEARCH = "lunix4k" -o $SEARCH = "galaxy4k" ] ; then
-        dd if=/dev/mmcblk0p1 of=$WORKDIR/$KERNELNAME
-        log "Kernel resides on /dev/mmcblk0p1"
-    elif [ $SEARCH = "h7" -o $SEARCH = "h17" -o $SEARCH = "hd51" -o $SEARCH = "vs1500" -o $SEARCH = "e4hd" ] ; then
-        dd if=/dev/mmcblk0p2 of=$WORKDIR/$KERNELNAME
-        log "Kernel resides on /dev/mmcblk0p2"
-    elif [ $SEARCH = "osmini4k" -o $SEARCH = "osmio4k" -o $SEARCH = "osmio4kplus" ] ; then
-        dd if=/dev/mmcblk1p2 of=$WORKDIR/$KERNELNAME
-        log "Kernel resides on /dev/mmcblk0p2"
-    elif [ $SEARCH = "sf4008" -o $SEARCH = "et11000" ] ; then
-        dd if=/dev/mmcblk0p3 of=$WORKDIR/$KERNELNAME
-        log "Kernel resides on /dev/mmcblk0p3"
-    elif [ $SEARCH = "zero4k" -o $SEARCH = "vuzero4k" -o $SEARCH = "gbquad4k" -o $SEARCH = "gbue4k" -o $SEARCH = "gbx34k" ] ; then
-        dd if=/dev/mmcblk0p4 of=$WORKDIR/$KERNELNAME
-        log "Kernel resides on /dev/mmcblk0p4"
-    elif [ $SEARCH = "duo4k" -o $SEARCH = "vuduo4k" -o $SEARCH = "duo4kse" -o $SEARCH = "vuduo4kse" ] ; then
-        dd if=/dev/mmcblk0p6 of=$WORKDIR/$KERNELNAME
-        log "Kernel resides on /dev/mmcblk0p6"
-    elif [ $SEARCH = "sf8008" -o $SEARCH = "sf8008m" -o $SEARCH = "ustym4kpro" -o $SEARCH = "ustym4ks2ottx" -o $SEARCH = "gbtrio4k" -o $SEARCH = "gbip4k" -o $SEARCH = "viper4k" -o $SEARCH = "beyonwizv2" ] ; then
-        dd if=/dev/mmcblk0p12 of=$WORKDIR/$KERNELNAME
-        log "Kernel resides on /dev/mmcblk0p12"
-    elif [ $SEARCH = "hd60" -o $SEARCH = "hd61" -o $SEARCH = "hd66se" -o $SEARCH = "h9se" -o $SEARCH = "h9combo" -o $SEARCH = "h9twin" -o $SEARCH = "h9combose" -o $SEARCH = "h9twinse" -o $SEARCH = "h10" -o $SEARCH = "h11" -o $SEARCH = "pulse4k" -o $SEARCH = "pulse4kmini" -o $SEARCH = "multibox" -o $SEARCH = "multiboxse" -o $SEARCH = "dual" -o $SEARCH = "sx88v2" ] ; then
-        $LIBDIR/enigma2/python/Plugins/Extensions/BackupSuite/findkerneldevice.sh
-        KERNEL=`readlink -n /dev/kernel`
-        log "Kernel resides on $KERNEL"
-        dd if=/dev/kernel of=$WORKDIR/$KERNELNAME > /dev/null 2>&1
-    else
-        $PYTHON_BIN $LIBDIR/enigma2/python/Plugins/Extensions/BackupSuite/findkerneldevice.$PY_EXT
-        KERNEL=`cat /sys/firmware/devicetree/base/chosen/kerneldev`
-        KERNELNAME=${KERNEL:11:7}.bin
-        echo "$KERNELNAME = STARTUP_${KERNEL:17:1}"
-        log "$KERNELNAME = STARTUP_${KERNEL:17:1}"
-        dd if=/dev/kernel of=$WORKDIR/$KERNELNAME > /dev/null 2>&1
-    fi
+    case "$KERNELLOCATION" in
+        partition\ *)
+            dump_partition $KERNELDEVICE "$WORKDIR/$KERNELNAME"
+            log "Kernel resides on $KERNELDEVICE"
+            ;;
+        script\ *)
+            $LIBDIR/enigma2/python/Plugins/Extensions/BackupSuite/findkerneldevice.sh
+            KERNEL=`readlink -n /dev/kernel`
+            log "Kernel resides on $KERNEL"
+            dump_partition /dev/kernel "$WORKDIR/$KERNELNAME"
+            ;;
+        *)
+            KERNEL=`cat /sys/firmware/devicetree/base/chosen/kerneldev`
+            KERNELNAME=${KERNEL:11:7}.bin
+            echo "$KERNELNAME = STARTUP_${KERNEL:17:1}"
+            log "$KERNELNAME = STARTUP_${KERNEL:17:1}"
+            # Links /dev/kernel and dumps it
+            pyhelper findkerneldevice "$WORKDIR/$KERNELNAME" "$WORKDIR/digests" >> $LOGFILE 2>&1
+            if [ ! -s "$WORKDIR/$KERNELNAME" ] ; then
+                dump_partition /dev/kernel "$WORKDIR/$KERNELNAME"
+            fi
+            ;;
+    esac
 fi
+phase_done kernel $((`stat -c %s "$WORKDIR/$KERNELNAME" 2> /dev/null || echo 0`/1024)) "$WORKDIR/$KERNELNAME"
 echo -n "$YELLOW"
 echo "$LINE"
 echo -n "$WHITE"
@@ -552,39 +910,64 @@ $SHOW "message06a" 2>&1 | tee -a $LOGFILE   # Create: root.ubifs
 echo -n $WHITE
 log $LINE
 if [ $ROOTNAME != "rootfs.tar.bz2" ] ; then
-    $MKFS -r /tmp/bi/root -o "$WORKDIR/root.ubi" $MKUBIFS_ARGS
+    phase_start mkfs
+    # mkfs.ubifs compresses, root.ubi grows to about the compressed size
+    EXPECTEDKB=`pyhelper sizeestimate estimate --rootname $ROOTNAME | cut -d " " -f 2`
+    follow_file mkfs "$WORKDIR/root.ubi" ${EXPECTEDKB:-$USEDsizekb} $MKFS -r /tmp/bi/root -o "$WORKDIR/root.ubi" $MKUBIFS_ARGS
+    phase_done mkfs $USEDsizekb "$WORKDIR/root.ubi"
     if [ -f "$WORKDIR/root.ubi" ] ; then
         echo -n "ROOT.UBI MADE  :" >> $LOGFILE
         ls $LS_OPTIONS "$WORKDIR/root.ubi" | awk 'END{print $9}' >> $LOGFILE
-        UBISIZE=`cat "$WORKDIR/root.ubi" | wc -c`
-        if [ "$UBISIZE" -eq 0 ] ; then
+        if [ ! -s "$WORKDIR/root.ubi" ] ; then
             $SHOW "message39" 2>&1 | tee -a $LOGFILE
-            big_fail
+            big_fail "" mkfs.ubifs
         fi
     else
         log "$WORKDIR/root.ubi NOT FOUND"
-        big_fail
+        big_fail "" mkfs.ubifs
     fi
     log $LINE
     $SHOW "message53" 2>&1 | tee -a $LOGFILE   # Assembling image (75%)
     echo "Start UBINIZING" >> $LOGFILE
-    $UBINIZE -o "$WORKDIR/$ROOTNAME" $UBINIZE_ARGS "$WORKDIR/ubinize.cfg" >/dev/null
+    phase_start ubinize
+    EXPECTEDKB=$((`stat -c %s "$WORKDIR/root.ubi"`/1024))
+    follow_file ubinize "$WORKDIR/$ROOTNAME" $EXPECTEDKB $UBINIZE -o "$WORKDIR/$ROOTNAME" $UBINIZE_ARGS "$WORKDIR/ubinize.cfg" >/dev/null
+    phase_done ubinize $USEDsizekb "$WORKDIR/$ROOTNAME"
     chmod 644 "$WORKDIR/$ROOTNAME"
     if [ -f "$WORKDIR/$ROOTNAME" ] ; then
         echo -n "$ROOTNAME MADE:" >> $LOGFILE
         ls $LS_OPTIONS "$WORKDIR/$ROOTNAME" | awk 'END{print $9}' >> $LOGFILE
     else
         echo "$WORKDIR/$ROOTNAME NOT FOUND"  >> $LOGFILE
-        big_fail
+        big_fail "" ubinize
     fi
     echo
 else
     if [ $VISIONVERSION == "7" ]; then
-        $MKFS -cf $WORKDIR/rootfs.tar -C /tmp/bi/root --exclude=/var/nmbd/* .
+        EXCLUDE="--exclude=/var/nmbd/*"
+    else
+        EXCLUDE=""
+    fi
+    if [ "$BACKUPMODE" = "diff" -a -f "$BASEMANIFEST" ] ; then
+        differential_backup
+    fi
+    if [ -d "$STORE" ] ; then
+        store_backup
+    fi
+    # Taken before the tar, anything changing during the backup shows up in the next diff
+    if [ -n "$BACKUPMODE" -o -d "$STORE" ] ; then
+        pyhelper incremental manifest /tmp/bi/root "$WORKDIR/rootfs.manifest" --reuse "$BASEMANIFEST" $EXCLUDE >> $LOGFILE 2>&1
+    fi
+    phase_start tar
+    tar_bzip2 /tmp/bi/root "$WORKDIR/$ROOTNAME" $EXCLUDE
+    phase_done tar $USEDsizekb "$WORKDIR/$ROOTNAME"
+    if [ -s "$WORKDIR/$ROOTNAME" ] ; then
+        echo -n "$ROOTNAME MADE:" >> $LOGFILE
+        ls $LS_OPTIONS "$WORKDIR/$ROOTNAME" | awk 'END{print $9}' >> $LOGFILE
     else
-        $MKFS -cf $WORKDIR/rootfs.tar -C /tmp/bi/root .
+        log "$WORKDIR/$ROOTNAME NOT FOUND"
+        big_fail "" tar
     fi
-    $BZIP2 $WORKDIR/rootfs.tar
 fi
 
 echo -n "$YELLOW"
@@ -599,40 +982,24 @@ echo -n "$BLUE"
 echo -n $BLUE
 $SHOW "message47" 2>&1 | tee -a $LOGFILE   # Phase 3/3: Finalizing backup
 echo -n $WHITE
+phase_start finalize
 make_folders
-mv "$WORKDIR/$ROOTNAME" "$MAINDEST/$ROOTNAME"
-mv "$WORKDIR/$KERNELNAME" "$MAINDEST/$KERNELNAME"
-if [ $ACTION = "noforce" ] ; then
-    echo "rename this file to 'force' to force an update without confirmation" > "$MAINDEST/noforce";
-elif [ $ACTION = "reboot" ] ; then
-    echo "rename this file to 'force.update' to force an update without confirmation" > "$MAINDEST/reboot.update"
-elif [ $ACTION = "force" ] ; then
-    echo "rename this file to 'force.update' to be able to flash this backup" > "$MAINDEST/noforce.update"
-    echo "Rename the file in the folder /vuplus/$SEARCH/noforce.update to /vuplus/$SEARCH/force.update to flash this image"
-fi
-if [ $SEARCH = "zero4k" -o $SEARCH = "uno4k" -o $SEARCH = "uno4kse" -o $SEARCH = "ultimo4k" -o $SEARCH = "solo4k" -o $SEARCH = "duo4k" -o $SEARCH = "duo4kse" ] ; then
-    echo "rename this file to 'mkpart.update' for forces create partition and kernel update." > "$MAINDEST/nomkpart.update"
-fi
-image_version > "$MAINDEST/imageversion"
-if [ $SEARCH = "lunix3-4k" -o $SEARCH = "lunix4k" -o $SEARCH = "galaxy4k" -o $SEARCH = "revo4k" ] ; then
-    if [ -f /boot/initrd_run.bin ] ; then
-        cp /boot/initrd_run.bin "$MAINDEST/initrd_run.bin"
-    fi
-fi
-if [ $SEARCH = "h9" -o $SEARCH = "h9se" -o $SEARCH = "h9combo" -o $SEARCH = "h9combose" -o $SEARCH = "i55plus" -o $SEARCH = "i55se" -o $SEARCH = "h10" -o $SEARCH = "hzero" -o $SEARCH = "h8" -o $SEARCH = "h8.2h" -o $SEARCH = "h9.s" -o $SEARCH = "h9.t" -o $SEARCH = "h9.2h" -o $SEARCH = "h9.2s" -o $SEARCH = "h9twin" -o $SEARCH = "h9twinse" ] ; then
-    log "Zgemma hisilicon found, copying additional files for flashing"
-    dd if=/dev/mtd0 of=$MAINDEST/fastboot.bin > /dev/null 2>&1
-    dd if=/dev/mtd1 of=$MAINDEST/bootargs.bin > /dev/null 2>&1
-    cp -r "$MAINDEST/fastboot.bin" "$MEDIA/zgemma/fastboot.bin" > /dev/null 2>&1
-    cp -r "$MAINDEST/bootargs.bin" "$MEDIA/zgemma/bootargs.bin" > /dev/null 2>&1
-    dd if=/dev/mtd2 of=$MAINDEST/baseparam.bin > /dev/null 2>&1
-    dd if=/dev/mtd3 of=$MAINDEST/pq_param.bin > /dev/null 2>&1
+mv "$WORKDIR/$ROOTNAME" "$NEWDEST/$ROOTNAME"
+mv "$WORKDIR/$KERNELNAME" "$NEWDEST/$KERNELNAME"
+if [ -f "$WORKDIR/rootfs.manifest" ] ; then
+    mv "$WORKDIR/rootfs.manifest" "$NEWDEST/rootfs.manifest"
 fi
+image_files "$NEWDEST"
+# Digests taken while the files were made, nothing of the image is read again
+pyhelper imagemanifest write "$WORKDIR/digests" "$NEWDEST" --model "$SEARCH" >> $LOGFILE 2>&1
+commit_folders
 if  [ $HARDDISK != 1 ]; then
     mkdir -p "$EXTRA"
     echo "Created directory  = $EXTRA" >> $LOGFILE
-    cp -r "$MAINDEST" "$EXTRA"     #copy the made back-up to images
+    # link the made back-up into images, a real copy only where links are impossible
+    pyhelper finalize link "$MAINDEST" "$EXTRA/${MAINDEST##*/}" >> $LOGFILE 2>&1 || cp -r "$MAINDEST" "$EXTRA"
 fi
+phase_done finalize 0 "$MAINDEST"
 if [ -f "$MAINDEST/$ROOTNAME" -a -f "$MAINDEST/$KERNELNAME" ] ; then
         backup_made
         $SHOW "message14"             # Instructions on how to restore the image.
@@ -665,28 +1032,23 @@ echo -n "$GREEN"
     # $ZIP -r $MEDIA/imagebackups/backup-$VER-$MODEL-$DATE.zip /$MAINDEST/*
 # fi
 
-if ! [ -d $MEDIA/imagebackups ] ; then
-    mkdir -p $MEDIA/imagebackups
-fi
 if [ -d $MEDIA/imagebackups ] ; then
-    ZIP=/usr/bin/zip
-    if [ ! -f "$ZIP" ] ; then
-        opkg update > /dev/null 2>&1
-        opkg install zip > /dev/null 2>&1
-        checkbinary $ZIP
-    fi
-    ISSUE1=`cat /etc/issue | grep . | tail -n 1 | sed -e 's/[\t ]//g;/^$/d'`
-    VER=${ISSUE1%????}
-    
-    # Check if MODEL is empty, fallback to hostname short name
-    if [ -z "$MODEL" ]; then
-        MODEL=$(hostname -s 2>/dev/null)
-    fi
-    if [ -z "$MODEL" ]; then
-        MODEL="unknownmodel"
+    # Already compressed members are stored, not deflated a second time
+    phase_start zip
+    pyhelper progress phase zip
+    if pyhelper zipstore add "$ZIPSTREAM" "$MAINDEST" "${MAINDEST#/}" >> $LOGFILE 2>&1 ; then
+        mv -f "$ZIPSTREAM" "$ZIPFILE"
+    else
+        rm -f "$ZIPSTREAM"
+        ZIP=/usr/bin/zip
+        if [ ! -f "$ZIP" ] ; then
+            opkg update > /dev/null 2>&1
+            opkg install zip > /dev/null 2>&1
+            checkbinary $ZIP
+        fi
+        $ZIP -r -n .bz2:.xz:.gz:.zip:.ubi:.bin $ZIPFILE /$MAINDEST/*
     fi
-
-    $ZIP -r $MEDIA/imagebackups/backup-$VER-$MODEL-$DATE.zip /$MAINDEST/*
+    phase_done zip $USEDsizekb "$ZIPFILE"
 fi
 
 echo -n "$YELLOW"
@@ -718,7 +1080,11 @@ if  [ $HARDDISK = 1 ]; then                     # looking for a valid usb-stick
         } 2>&1 | tee -a $LOGFILE
         rm -rf "$TARGET$FOLDER"
         mkdir -p "$TARGET$FOLDER"
-        cp -r "$MAINDEST/." "$TARGET$FOLDER"
+        phase_start copy
+        pyhelper progress phase copy
+        pyhelper finalize link "$MAINDEST" "$TARGET$FOLDER" >> $LOGFILE 2>&1 || cp -r "$MAINDEST/." "$TARGET$FOLDER"
+        pyhelper governor fsync "$TARGET$FOLDER" >> $LOGFILE 2>&1 || sync
+        phase_done copy $USEDsizekb "$TARGET$FOLDER" "$TARGET"
         echo $LINE >> $LOGFILE
         echo "MADE AN EXTRA COPY IN: $TARGET" >> $LOGFILE
         df -h "$TARGET"  >> $LOGFILE
@@ -726,7 +1092,6 @@ if  [ $HARDDISK = 1 ]; then                     # looking for a valid usb-stick
     else
         $SHOW "message40" >> $LOGFILE
     fi
-sync
 fi
 echo -n "$YELLOW"
 echo "$LINE"
@@ -739,6 +1104,9 @@ echo -n "$GREEN"
 ################## CLEANING UP AND REPORTING SOME STATISTICS ##################
 echo -n $GREEN
 $SHOW "message55" 2>&1 | tee -a $LOGFILE   # Finalizing (95%)
+# Only the files of this backup are written to the disk, a sync would also
+# flush the dirty pages of a running recording
+pyhelper governor fsync "$MAINDEST" "$EXTRA/${MAINDEST##*/}" "$ZIPFILE" >> $LOGFILE 2>&1 || sync
 clean_up
 $SHOW "message56" 2>&1 | tee -a $LOGFILE   # Backup complete (100%)
 echo -n $WHITE
@@ -758,6 +1126,11 @@ KERNELSIZE=$(stat -c%s "$MAINDEST/$KERNELNAME" 2>/dev/null || du -b "$MAINDEST/$
 TOTALSIZE=$((($ROOTSIZE+$KERNELSIZE)/1024))
 SPEED=$(( $TOTALSIZE/$DIFF ))
 echo $SPEED > $LIBDIR/enigma2/python/Plugins/Extensions/BackupSuite/speed.txt
+pyhelper sizeestimate record "$MAINDEST/$ROOTNAME" >> $LOGFILE 2>&1
+pyhelper speedhistory record "$SEARCH" "$PHASELOG" >> $LOGFILE 2>&1
+# Machine readable record of the run next to the backup, see metrics.py
+pyhelper metrics write "$PHASELOG" "$MAINDEST" --rss "$RSSLOG" --history "$MEDIA/backupsuite-metrics.jsonl" --model "$SEARCH" --rootname "$ROOTNAME" --root-kb $USEDsizekb --wall $DIFF >> $LOGFILE 2>&1
+rm -f "$PHASELOG" "$PHASEMARK" "$RSSLOG"
 echo $LINE >> $LOGFILE
 # "Back up done with $SPEED KB per second"
 {
@@ -798,4 +1171,5 @@ fi
 if [ "$TARGET" != "XX" ] ; then
     cp $LOGFILE "$TARGET$FOLDER"
 fi
+write_result OK
 exit
\ No newline at end of file
@@ -118,7 +118,20 @@ find_message_script() {
 # Parameters
 export LANG="${1:-en}"
 MESSAGE_SCRIPT=$(find_message_script)
-export SHOW="$PYTHON $MESSAGE_SCRIPT $LANG"
+# Messages come from the compiled catalog of the language, see message.py
+MSGCATALOG="$MESSAGE_DIR/locale/messages.$LANG.sh"
+if [ ! -s "$MSGCATALOG" -o "$MESSAGE_SCRIPT" -nt "$MSGCATALOG" ] ; then
+    $PYTHON "$MESSAGE_SCRIPT" --compile "$LANG" "$MSGCATALOG" > /dev/null 2>&1 || rm -f "$MSGCATALOG"
+fi
+if [ -s "$MSGCATALOG" ] && . "$MSGCATALOG" ; then
+    SHOW="show_message"
+else
+    SHOW="$PYTHON $MESSAGE_SCRIPT $LANG"
+fi
+
+# CPU and I/O priority of the settings for this script and the backup it
+# starts, see governor.py
+[ -n "$PYTHON" ] && $PYTHON "$MESSAGE_DIR/governor.py" apply $$ > /dev/null 2>&1
 
 # Device type detection
 case "${2:-USB}" in
@@ -128,25 +141,19 @@ case "${2:-USB}" in
     *)     export HARDDISK=0 ;;
 esac
 
-# Portable disk space calculation
+# Size of the backup and free space on $1 in KB: "USED COMPRESSED NEEDED FREE",
+# sizeestimate.py answers from statvfs and its cache without walking the flash
 calculate_space() {
-    # Get used space in /usr
-    if command -v du >/dev/null; then
-        USEDSIZE=$(du -sk /usr 2>/dev/null | awk '{print $1}')
-    else
-        # Fallback to df if du not available
-        USEDSIZE=$(df -k /usr | awk 'NR>1 {print $3}')
+    if [ -n "$PYTHON" ] && [ -f "$MESSAGE_DIR/sizeestimate.py" ] && \
+        $PYTHON "$MESSAGE_DIR/sizeestimate.py" estimate --target "$1" 2>/dev/null; then
+        return
     fi
-
-    # Calculate needed space with buffer (original formula: 4*size/1024)
-    NEEDEDSPACE=$(((USEDSIZE * 41) / 10))  # in KB (400% + 2.5% buffer)
-
-    echo "$USEDSIZE $NEEDEDSPACE"
+    # No python: the used size of the root, uncompressed, as needed space
+    USEDSIZE=$(df -P -k / 2>/dev/null | tail -1 | awk '{print $3}')
+    FREESIZE=$(df -P -k "$1" 2>/dev/null | tail -1 | awk '{print $4}')
+    echo "${USEDSIZE:-0} ${USEDSIZE:-0} ${USEDSIZE:-0} ${FREESIZE:-0}"
 }
 
-# Get space requirements
-read USEDSIZE NEEDEDSPACE <<< $(calculate_space)
-
 # Find backup media
 find_backup_media() {
     # Try common mount points
@@ -191,6 +198,7 @@ if [ -z "$TARGET" ]; then
     echo -n $RED
     $SHOW "message21" 2>&1  # "No backup media found!"
     echo -n $WHITE
+    [ -n "$PYTHON" ] && $PYTHON "$MESSAGE_DIR/result.py" write NO_TARGET > /dev/null 2>&1
     exit 1
 fi
 
@@ -230,23 +238,27 @@ fi
 
 echo -n $WHITE
 
+# Old backups go first by the retention settings, so the space check below
+# counts the room they leave, see retention.py
+[ -n "$PYTHON" ] && [ -f "$MESSAGE_DIR/retention.py" ] && $PYTHON "$MESSAGE_DIR/retention.py" apply "$TARGET" --make-room
 # Check available space
-if command -v df >/dev/null; then
-    FREE_KB=$(df -k "$TARGET" | awk 'NR>1 {print $4}')
-    if [ -z "$FREE_KB" ] || [ "$FREE_KB" -lt "$NEEDEDSPACE" ]; then
-        echo -n $RED
-        $SHOW "message30"  # "There is not enough space available on"
-        echo -n "$TARGET"
-        $SHOW "message31"  # "Only"
-        printf '%5s' "$((FREE_KB / 1024))"
-        $SHOW "message32"  # "MB available, but"
-        printf '%5s' "$((NEEDEDSPACE / 1024))"
-        $SHOW "message33"  # "MB are needed. Please free some space."
-        echo " "
-        $SHOW "message34"  # "and try again."
-        echo -n $WHITE
-        exit 1
-    fi
+read USEDSIZE ESTIMATED NEEDEDSPACE FREE_KB <<EOF
+$(calculate_space "$TARGET")
+EOF
+if [ -z "$FREE_KB" ] || [ "$FREE_KB" -lt "$NEEDEDSPACE" ]; then
+    echo -n $RED
+    $SHOW "message30"  # Not enough free space on
+    echo -n "$TARGET"
+    $SHOW "message31"  # to make a back-up!
+    printf '%5s' "$((FREE_KB / 1024))"
+    $SHOW "message32"  # MB available space
+    printf '%5s' "$((NEEDEDSPACE / 1024))"
+    $SHOW "message33"  # MB needed space
+    echo " "
+    $SHOW "message34"  # The program will abort...
+    echo -n $WHITE
+    [ -n "$PYTHON" ] && $PYTHON "$MESSAGE_DIR/result.py" write NO_SPACE > /dev/null 2>&1
+    exit 1
 fi
 # Execute backup script
 BACKUP_SCRIPT="$LIBDIR/enigma2/python/Plugins/Extensions/BackupSuite/scripts/backupsuite.sh"
@@ -257,7 +269,6 @@ if [ -x "$BACKUP_SCRIPT" ]; then
     # Run backup
     "$BACKUP_SCRIPT" "$TARGET"
     ret=$?
-    sync
 
     if [ $ret -eq 0 ]; then
         echo -n $GREEN
@@ -269,6 +280,7 @@ if [ -x "$BACKUP_SCRIPT" ]; then
 else
     echo -n $RED
     $SHOW "message05" 2>&1  # Backup script not found!
+    [ -n "$PYTHON" ] && $PYTHON "$MESSAGE_DIR/result.py" write NOT_FOUND --command "${BACKUP_SCRIPT##*/}" > /dev/null 2>&1
     ret=1
 fi
 
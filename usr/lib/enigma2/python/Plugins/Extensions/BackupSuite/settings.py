@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+"""
+Settings of the plugin, shared by the screens and the scripts.
+
+The settings are "key=value" lines in /etc/enigma2/backupsuite.conf, so they
+go with a settings backup and the scripts can read them without enigma2. A
+missing file or key gives the default, an unknown key is kept as it is.
+
+    settings.py get KEY
+        Print the value of KEY.
+
+    settings.py set KEY VALUE
+        Change KEY and write the file.
+
+    settings.py show
+        Print all settings.
+"""
+
+from __future__ import print_function
+import argparse
+import os
+import sys
+
+SETTINGS = "/etc/enigma2/backupsuite.conf"
+
+DEFAULTS = {
+    # off, daily, weekly or upgrade (after opkg installed or removed packages)
+    "schedule": "off",
+    "schedule_time": "03:00",
+    # 0 is monday, like time.localtime
+    "schedule_weekday": "6",
+    # Mount point the scheduled backups go to
+    "schedule_target": "",
+    # No scheduled backup when the image didn't change since the last one
+    "schedule_skip_unchanged": "yes",
+    # CPU and I/O priority of the backups, see governor.py
+    "governor": "normal",
+    # The HTTP API in OpenWebif, and the token it asks for, see webapi.py.
+    # Without a token it is not added to OpenWebif.
+    "webapi": "no",
+    "webapi_token": "",
+    # Old backups removed before a backup, see retention.py. A
+    # backupsuite-retention.conf on the backup media overrides them there.
+    "retention_keep": "0",
+    "retention_daily": "0",
+    "retention_weekly": "0",
+    "retention_max_mb": "0",
+    "retention_make_room": "no",
+}
+
+
+def load(path=SETTINGS, defaults=None):
+    """{key: value} of the settings file over the defaults (DEFAULTS without them)."""
+    values = dict(DEFAULTS if defaults is None else defaults)
+    try:
+        with open(path, "r") as f:
+            lines = f.read().splitlines()
+    except (IOError, OSError):
+        return values
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#") or "=" not in line:
+            continue
+        key, value = line.split("=", 1)
+        values[key.strip()] = value.strip()
+    return values
+
+
+def save(values, path=SETTINGS):
+    """Write the values that differ from the defaults."""
+    lines = ["# BackupSuite settings, see settings.py"]
+    for key in sorted(values):
+        if values[key] != DEFAULTS.get(key):
+            lines.append("{0}={1}".format(key, values[key]))
+    tmp = "{0}.{1}.tmp".format(path, os.getpid())
+    with open(tmp, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.rename(tmp, path)
+
+
+def get(key, path=SETTINGS):
+    return load(path).get(key, "")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="BackupSuite settings")
+    sub = parser.add_subparsers(dest="command")
+    p = sub.add_parser("get")
+    p.add_argument("key")
+    p = sub.add_parser("set")
+    p.add_argument("key")
+    p.add_argument("value")
+    sub.add_parser("show")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "get":
+            print(get(args.key))
+        elif args.command == "set":
+            values = load()
+            values[args.key] = args.value
+            save(values)
+        elif args.command == "show":
+            values = load()
+            for key in sorted(values):
+                print("{0}={1}".format(key, values[key]))
+        else:
+            parser.print_usage(sys.stderr)
+            return 2
+    except (IOError, OSError) as e:
+        print("[BackupSuite] settings: {0}".format(str(e)), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
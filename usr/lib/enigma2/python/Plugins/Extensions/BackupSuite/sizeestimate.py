@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+
+"""
+Size of the backup, estimated without walking the root filesystem.
+
+The scripts used to run "du -sk /usr" before the backup, that reads every
+inode under /usr on the slow flash, and only looks at /usr anyway. The used
+size of the root filesystem comes from statvfs("/") instead, which costs
+nothing. statvfs counts the whole partition though, on a multiboot box that
+can be several images, so once in a while the root filesystem is walked (the
+same way the backup sees it: only files on the root device) and the totals
+per top directory are cached together with the statvfs figure of that
+moment. Later runs take the cached totals and add what statvfs says changed
+since, the root is walked again when that change gets large, the cache is
+old or the root filesystem is another one.
+
+The compressed size is the root size times a ratio: the one recorded for
+the last backup with that root file name (or of the last backup at all when
+no name is given), the default of the format otherwise.
+
+    sizeestimate.py estimate [--target DIR] [--rootname NAME] [--copies N]
+        Print "USEDKB COMPRESSEDKB NEEDEDKB FREEKB": the root filesystem,
+        its expected size compressed, the space the backup needs on the
+        target and the free space there (0 without --target).
+
+    sizeestimate.py check TARGET [--rootname NAME] [--copies N]
+        Same as estimate, exit code 1 when the target has not enough space.
+
+    sizeestimate.py record ROOTFILE [--rootname NAME]
+        Remember the compression ratio of a finished backup.
+
+    sizeestimate.py refresh
+        Walk the root filesystem now and rewrite the cache.
+"""
+
+from __future__ import print_function
+import argparse
+import json
+import os
+import stat
+import sys
+import time
+
+PLUGIN_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE = os.path.join(PLUGIN_DIR, "rootsize.json")
+FALLBACK_CACHE = "/tmp/BackupSuite.rootsize.json"
+ROOT = "/"
+
+# Walk the root again after this long or when it changed by this much
+MAX_AGE = 7 * 24 * 3600
+MAX_DRIFT = 0.10
+
+# Compressed size / root size until a backup of the format is recorded
+DEFAULT_RATIO = 0.75
+DEFAULT_RATIOS = {
+    "rootfs.tar.bz2": 0.45,
+}
+
+# The work folder holds the filesystem image and the ubi volume (or the tar
+# and the zip written next to it), plus room for the kernel and a margin
+COPIES = 2
+KERNEL_KB = 8192
+MARGIN = 1.1
+
+
+def _used_kb(path):
+    st = os.statvfs(path)
+    return (st.f_blocks - st.f_bfree) * st.f_frsize // 1024
+
+
+def free_kb(path):
+    """Free space for a normal user on the file system of path, in KB."""
+    st = os.statvfs(path)
+    return st.f_bavail * st.f_frsize // 1024
+
+
+def _filesystem_id(path):
+    st = os.statvfs(path)
+    return "{0}:{1}:{2}".format(os.stat(path).st_dev, st.f_blocks, st.f_frsize)
+
+
+def walk_totals(root=ROOT):
+    """{top directory: KB} of the files on the device of root, like du -x."""
+    device = os.lstat(root).st_dev
+    totals = {}
+    seen = set()  # hard links are counted once
+    try:
+        names = os.listdir(root)
+    except OSError:
+        names = []
+    for name in names:
+        top = os.path.join(root, name)
+        try:
+            st = os.lstat(top)
+        except OSError:
+            continue
+        if st.st_dev != device:
+            continue
+        size = st.st_blocks * 512
+        if stat.S_ISDIR(st.st_mode):
+            for dirpath, dirnames, filenames in os.walk(top):
+                keep = []
+                for entry in dirnames + filenames:
+                    try:
+                        est = os.lstat(os.path.join(dirpath, entry))
+                    except OSError:
+                        continue
+                    if est.st_dev != device:
+                        continue
+                    if stat.S_ISDIR(est.st_mode):
+                        keep.append(entry)
+                    elif est.st_nlink > 1:
+                        if est.st_ino in seen:
+                            continue
+                        seen.add(est.st_ino)
+                    size += est.st_blocks * 512
+                dirnames[:] = keep
+        totals[name] = size // 1024
+    return totals
+
+
+def read_cache(path=None):
+    for candidate in ([path] if path else [CACHE, FALLBACK_CACHE]):
+        try:
+            with open(candidate, "r") as f:
+                cache = json.load(f)
+            if isinstance(cache, dict):
+                return cache
+        except (IOError, OSError, ValueError):
+            continue
+    return {}
+
+
+def write_cache(cache, path=None):
+    for candidate in ([path] if path else [CACHE, FALLBACK_CACHE]):
+        tmp = "{0}.{1}.tmp".format(candidate, os.getpid())
+        try:
+            with open(tmp, "w") as f:
+                json.dump(cache, f, sort_keys=True)
+            os.rename(tmp, candidate)
+            return candidate
+        except (IOError, OSError):
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+    return None
+
+
+def _stale(cache, used, filesystem, now):
+    if cache.get("filesystem") != filesystem or "totals" not in cache:
+        return True
+    if now - cache.get("time", 0) > MAX_AGE:
+        return True
+    walked = cache.get("used", 0)
+    return abs(used - walked) > max(walked, 1) * MAX_DRIFT
+
+
+def root_size_kb(root=ROOT, cache_path=None, refresh=False, walk=True):
+    """Size of the root filesystem as the backup sees it, in KB.
+
+    With walk=False the root is never walked, when the cache doesn't fit
+    the statvfs figure is returned as it is (for the screens, which must
+    not block).
+    """
+    used = _used_kb(root)
+    filesystem = _filesystem_id(root)
+    cache = read_cache(cache_path)
+    now = time.time()
+    if refresh or _stale(cache, used, filesystem, now):
+        if not walk:
+            return used
+        cache.update(totals=walk_totals(root), used=used, filesystem=filesystem, time=now)
+        write_cache(cache, cache_path)
+    walked = sum(cache["totals"].values())
+    # What changed since the walk, statvfs only sees the partition as a whole
+    return max(walked + used - cache["used"], 0)
+
+
+def ratio(rootname=None, cache_path=None):
+    cache = read_cache(cache_path)
+    recorded = cache.get("ratios", {}).get(rootname) if rootname else cache.get("ratio")
+    if recorded:
+        return recorded
+    return DEFAULT_RATIOS.get(rootname, DEFAULT_RATIO)
+
+
+def estimate(rootname=None, copies=COPIES, target=None, root=ROOT, cache_path=None):
+    """Return (used, compressed, needed, free) in KB, free is 0 without a target."""
+    used = root_size_kb(root, cache_path)
+    compressed = int(used * ratio(rootname, cache_path))
+    needed = int((compressed * copies + KERNEL_KB) * MARGIN)
+    free = free_kb(target) if target else 0
+    return used, compressed, needed, free
+
+
+def record(rootfile, rootname=None, root=ROOT, cache_path=None):
+    """Store the ratio of a finished backup, returns it."""
+    rootname = rootname or os.path.basename(rootfile)
+    used = root_size_kb(root, cache_path)
+    if not used:
+        return None
+    cache = read_cache(cache_path)
+    value = round(float(os.path.getsize(rootfile) // 1024) / used, 3)
+    cache.setdefault("ratios", {})[rootname] = value
+    cache["ratio"] = value
+    write_cache(cache, cache_path)
+    return value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="BackupSuite backup size estimate")
+    sub = parser.add_subparsers(dest="command")
+    for name in ("estimate", "check"):
+        p = sub.add_parser(name)
+        if name == "check":
+            p.add_argument("target")
+        else:
+            p.add_argument("--target")
+        p.add_argument("--rootname")
+        p.add_argument("--copies", type=int, default=COPIES)
+    p = sub.add_parser("record")
+    p.add_argument("rootfile")
+    p.add_argument("--rootname")
+    sub.add_parser("refresh")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command in ("estimate", "check"):
+            used, compressed, needed, free = estimate(args.rootname, args.copies, args.target)
+            print("{0} {1} {2} {3}".format(used, compressed, needed, free))
+            if args.command == "check" and free < needed:
+                return 1
+        elif args.command == "record":
+            value = record(args.rootfile, args.rootname)
+            if value is not None:
+                print("{0}: ratio {1}".format(args.rootname or os.path.basename(args.rootfile), value))
+        elif args.command == "refresh":
+            print(root_size_kb(refresh=True))
+        else:
+            parser.print_usage(sys.stderr)
+            return 2
+    except (IOError, OSError) as e:
+        print("[BackupSuite] sizeestimate: {0}".format(str(e)), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+
+"""
+Throughput of earlier backups, per model, target and phase.
+
+speed.txt held one number for the whole backup, overwritten by every run
+whatever the target was. Here every phase of the backup (kernel dump, tar
+with its compression or mkfs.ubifs, ubinize, the extra copy, the zip) is
+timed on its own and kept per model and per target (mount point and file
+system type), smoothed over the runs so one slow run doesn't throw the
+estimate off. The kernel phase is measured in KB of kernel per second, all
+others in KB of the root filesystem per second, so an estimate only needs
+the size of the root (see sizeestimate.py) and of the kernel.
+
+An unknown combination falls back to the same model on a target of the same
+file system type, then to the model on any target, then to any model on
+that file system type and finally to a default speed of the phase.
+
+    speedhistory.py record MODEL PHASELOG
+        Add the timings of a backup, PHASELOG has a line per phase:
+        "PHASE KB CENTISECONDS KBOUT TARGET" (KBOUT is for metrics.py).
+
+    speedhistory.py eta MODEL TARGET ROOTKB KERNELKB [--rootname NAME] [--no-zip]
+        Print the expected duration of a backup in seconds.
+
+    speedhistory.py show
+        Print the history.
+"""
+
+from __future__ import print_function
+import argparse
+import json
+import os
+import sys
+
+PLUGIN_DIR = os.path.dirname(os.path.abspath(__file__))
+HISTORY = os.path.join(PLUGIN_DIR, "speedhistory.json")
+
+PHASES = ("kernel", "tar", "mkfs", "ubinize", "copy", "zip")
+
+# KB per second before a phase ran once, in line with the old estimate
+DEFAULT_SPEEDS = {
+    "kernel": 8192,
+    "tar": 750,
+    "mkfs": 250,
+    "ubinize": 8192,
+    "copy": 4096,
+    "zip": 8192,
+}
+
+# Weight of the newest run in the smoothed speed
+ALPHA = 0.3
+
+
+def target_filesystem(path, mounts="/proc/mounts"):
+    """(mount point, file system type) of the file system path is on."""
+    path = os.path.abspath(path)
+    best = ("/", "unknown")
+    try:
+        with open(mounts, "r") as f:
+            lines = f.read().splitlines()
+    except (IOError, OSError):
+        return best
+    for line in lines:
+        fields = line.split()
+        if len(fields) < 3:
+            continue
+        mountpoint = fields[1].replace("\\040", " ")
+        if path == mountpoint or path.startswith(mountpoint.rstrip("/") + "/"):
+            if len(mountpoint) >= len(best[0]):
+                best = (mountpoint, fields[2])
+    return best
+
+
+def _key(model, mountpoint, fstype, phase):
+    return "|".join((model, mountpoint, fstype, phase))
+
+
+class SpeedHistory(object):
+    def __init__(self, path=HISTORY):
+        self.path = path
+        self.model = None
+        self.speeds = {}
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+            self.model = data.get("model")
+            self.speeds = data.get("speeds", {})
+        except (IOError, OSError, ValueError, AttributeError):
+            pass
+
+    def save(self):
+        tmp = "{0}.{1}.tmp".format(self.path, os.getpid())
+        with open(tmp, "w") as f:
+            json.dump({"model": self.model, "speeds": self.speeds}, f, sort_keys=True, indent=1)
+        os.rename(tmp, self.path)
+
+    def add(self, model, target, phase, kb, seconds):
+        """Add one timing, target is a path on the target file system."""
+        if seconds <= 0 or kb <= 0:
+            return
+        mountpoint, fstype = target_filesystem(target)
+        key = _key(model, mountpoint, fstype, phase)
+        speed = float(kb) / seconds
+        if key in self.speeds:
+            old, runs = self.speeds[key]
+            speed = old + ALPHA * (speed - old)
+            self.speeds[key] = [round(speed, 1), runs + 1]
+        else:
+            self.speeds[key] = [round(speed, 1), 1]
+        self.model = model
+
+    def _average(self, wanted):
+        found = [speed for key, (speed, runs) in self.speeds.items() if wanted(key.split("|"))]
+        return sum(found) / len(found) if found else None
+
+    def speed(self, model, target, phase):
+        """KB per second of phase to target, from the closest history there is."""
+        mountpoint, fstype = target_filesystem(target)
+        exact = self.speeds.get(_key(model, mountpoint, fstype, phase))
+        if exact:
+            return exact[0]
+        for wanted in (
+                lambda k: k[0] == model and k[2] == fstype and k[3] == phase,
+                lambda k: k[0] == model and k[3] == phase,
+                lambda k: k[2] == fstype and k[3] == phase):
+            speed = self._average(wanted)
+            if speed:
+                return speed
+        return DEFAULT_SPEEDS[phase]
+
+    def estimate(self, target, root_kb, kernel_kb, phases, model=None):
+        """Expected seconds of the phases, model defaults to the last one recorded."""
+        model = model or self.model or ""
+        seconds = 0.0
+        for phase in phases:
+            kb = kernel_kb if phase == "kernel" else root_kb
+            seconds += float(kb) / self.speed(model, target, phase)
+        return int(seconds)
+
+
+def backup_phases(rootname, zip=True):
+    """The phases backupsuite.sh runs for a root file name."""
+    phases = ["kernel"]
+    if rootname == "rootfs.tar.bz2":
+        phases.append("tar")
+    else:
+        phases.extend(("mkfs", "ubinize"))
+    if zip:
+        phases.append("zip")
+    return phases
+
+
+def read_phaselog(path, phases=PHASES):
+    """[(phase, kb, seconds, kb out, target)] of a phase log.
+
+    Only the lines of phases are returned, all of them with phases=None.
+    Bad lines are skipped.
+    """
+    timings = []
+    with open(path, "r") as f:
+        for line in f:
+            fields = line.rstrip("\n").split(" ", 4)
+            if len(fields) != 5 or (phases is not None and fields[0] not in phases):
+                continue
+            try:
+                timings.append((fields[0], int(fields[1]), int(fields[2]) / 100.0, int(fields[3]), fields[4]))
+            except ValueError:
+                continue
+    return timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="BackupSuite throughput history")
+    sub = parser.add_subparsers(dest="command")
+    p = sub.add_parser("record")
+    p.add_argument("model")
+    p.add_argument("phaselog")
+    p = sub.add_parser("eta")
+    p.add_argument("model")
+    p.add_argument("target")
+    p.add_argument("root_kb", type=int)
+    p.add_argument("kernel_kb", type=int)
+    p.add_argument("--rootname", default="rootfs.tar.bz2")
+    p.add_argument("--no-zip", dest="zip", action="store_false")
+    sub.add_parser("show")
+    args = parser.parse_args(argv)
+
+    try:
+        history = SpeedHistory()
+        if args.command == "record":
+            timings = read_phaselog(args.phaselog)
+            for phase, kb, seconds, kb_out, target in timings:
+                history.add(args.model, target, phase, kb, seconds)
+                print("{0}: {1} KB in {2:.2f}s".format(phase, kb, seconds))
+            if timings:
+                history.save()
+        elif args.command == "eta":
+            print(history.estimate(args.target, args.root_kb, args.kernel_kb,
+                                   backup_phases(args.rootname, args.zip), args.model))
+        elif args.command == "show":
+            for key in sorted(history.speeds):
+                speed, runs = history.speeds[key]
+                print("{0}: {1} KB/s ({2} runs)".format(key, speed, runs))
+        else:
+            parser.print_usage(sys.stderr)
+            return 2
+    except (IOError, OSError) as e:
+        print("[BackupSuite] speedhistory: {0}".format(str(e)), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,499 @@
+# -*- coding: utf-8 -*-
+
+"""
+Stream a flashable image to a collector, nothing is written on the box.
+
+backupsuite.sh builds the image in $WORKDIR on the backup media, a box with
+only its internal flash can't be backed up at all. This makes the same image
+(the kernel partition and rootfs.tar.bz2 of the running root, with the
+manifest.json of imagemanifest.py) as a zip or tar archive on stdout, read
+straight from the partitions: the root is tarred from a bind mount and
+compressed block by block (see compressor.py) on its way out.
+
+The archive is the same for the same image, byte for byte: the members come
+in a fixed order with the time of the newest file of the root, and the
+compressed blocks don't depend on the number of cores. An interrupted
+download goes on at an offset by making the archive again and dropping what
+the client has.
+The ETag tells the image: a hash of the kernel and of the name, size and
+time of every entry of the root. The sizes of the members of the last
+export are kept in /tmp/BackupSuite.export.json; a tar header, the length
+of the archive and a range need them, an image not exported yet is made
+once without sending it to measure them. A zip is streamed at once, its
+members have data descriptors.
+
+Only the images with rootfs.tar.bz2 can be streamed. mkfs.ubifs and ubinize
+write files, the UBI boxes and the Dreamboxes need backupsuite.sh.
+
+    streamexport.py write [--format zip|tar] [--offset N] [--model MODEL]
+                          [--root DIR] [--kernel FILE]
+        The archive on stdout, from byte N on, for nc or ssh:
+        streamexport.py write | nc collector 9000
+
+    streamexport.py size [--format zip|tar]
+        Print {"etag", "length"} of the archive.
+
+    streamexport.py http [--format zip|tar] [--range RANGE] [--if-range ETAG]
+        For webapi.py: one JSON line with the status, the ETag and the byte
+        range of the response, then the bytes.
+
+--root and --kernel export a tree and a kernel image other than the running
+ones, --model the model whose folder and file names the image gets.
+"""
+
+from __future__ import print_function
+import argparse
+import hashlib
+import json
+import os
+import re
+import signal
+import struct
+import subprocess
+import sys
+import tarfile
+import time
+import zlib
+
+try:
+    from . import governor
+    from .boxprofile import DREAMBOX_MARKER, detect_box_type, kernel_location
+    from .compressor import compressed_blocks, detect_jobs
+    from .imagemanifest import ALGORITHM, MANIFEST
+    from .incremental import walk
+    from .receiverdb import get_receiver
+except (ImportError, ValueError, SystemError):
+    import governor
+    from boxprofile import DREAMBOX_MARKER, detect_box_type, kernel_location
+    from compressor import compressed_blocks, detect_jobs
+    from imagemanifest import ALGORITHM, MANIFEST
+    from incremental import walk
+    from receiverdb import get_receiver
+
+PLUGIN_DIR = os.path.dirname(os.path.abspath(__file__))
+EXPORT_ROOT = "/tmp/bi/export"
+SIZES = "/tmp/BackupSuite.export.json"
+BUFSIZE = 1024 * 1024
+FORMATS = ("zip", "tar")
+TYPES = {"zip": "application/zip", "tar": "application/x-tar"}
+NANDDUMP = "/usr/sbin/nanddump"
+
+# ZIP records, every member is stored and has zip64 sizes
+ZIP_VERSION = 45
+ZIP_FLAGS = 0x08  # sizes and crc follow the data
+ZIP_LOCAL = struct.Struct("<4s5H3L2H")
+ZIP_LOCAL_EXTRA = struct.Struct("<2H2Q")
+ZIP_DESCRIPTOR = struct.Struct("<4sL2Q")
+ZIP_CENTRAL = struct.Struct("<4s4B4H3L5H2L")
+ZIP_CENTRAL_EXTRA = struct.Struct("<2H3Q")
+ZIP64_END = struct.Struct("<4sQ2H2L4Q")
+ZIP64_LOCATOR = struct.Struct("<4sLQL")
+ZIP_END = struct.Struct("<4s4H2LH")
+ZIP_MAX = 0xFFFFFFFF
+
+
+class ExportError(Exception):
+    def __init__(self, code, message):
+        Exception.__init__(self, message)
+        self.code = code  # one of result.CODES
+
+
+def kernel_source(receiver):
+    """(kind, device, name) of the running kernel, kind is "nanddump" or "file"."""
+    kind, device = kernel_location(receiver.model)
+    if kind == "mtd":
+        try:
+            with open("/proc/mtd", "r") as f:
+                for line in f:
+                    if '"kernel"' in line:
+                        return "nanddump", "/dev/" + line.split(":")[0], receiver.kernelname
+        except (IOError, OSError):
+            pass
+        raise ExportError("NOT_FOUND", "no kernel in /proc/mtd")
+    if kind == "partition":
+        return "file", device, receiver.kernelname
+    if kind == "script":
+        subprocess.call(["/bin/sh", os.path.join(PLUGIN_DIR, "findkerneldevice.sh")])
+        name = receiver.kernelname
+    else:
+        try:
+            with open("/sys/firmware/devicetree/base/chosen/kerneldev", "r") as f:
+                kerneldev = f.read().strip("\0\n")
+        except (IOError, OSError):
+            raise ExportError("NOT_FOUND", "no kernel partition found")
+        # Named after the partition, like backupsuite.sh does
+        name = kerneldev[11:18] + ".bin"
+        if not os.path.exists("/dev/kernel"):
+            subprocess.call([sys.executable, os.path.join(PLUGIN_DIR, "findkerneldevice.py")])
+    if not os.path.exists("/dev/kernel"):
+        raise ExportError("NOT_FOUND", "no kernel partition found")
+    return "file", "/dev/kernel", name
+
+
+def _command_chunks(args):
+    proc = subprocess.Popen(args, stdout=subprocess.PIPE)
+    try:
+        for data in iter(lambda: proc.stdout.read(BUFSIZE), b""):
+            yield data
+    finally:
+        # Still running when the client went away
+        if proc.poll() is None:
+            proc.kill()
+        proc.stdout.close()
+        proc.wait()
+    if proc.returncode != 0:
+        raise ExportError("FAILED", "{0} failed".format(os.path.basename(args[0])))
+
+
+def _file_chunks(path):
+    with open(path, "rb") as f:
+        for data in iter(lambda: f.read(BUFSIZE), b""):
+            yield data
+
+
+def _zip_time(mtime):
+    t = time.localtime(mtime)
+    return ((t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+            (max(t.tm_year, 1980) - 1980) << 9 | (t.tm_mon << 5) | t.tm_mday)
+
+
+def zip_local(name, mtime):
+    dostime, dosdate = _zip_time(mtime)
+    name = name.encode("utf-8")
+    return ZIP_LOCAL.pack(b"PK\x03\x04", ZIP_VERSION, ZIP_FLAGS, 0, dostime, dosdate, 0, ZIP_MAX, ZIP_MAX,
+                          len(name), ZIP_LOCAL_EXTRA.size) + name + ZIP_LOCAL_EXTRA.pack(1, 16, 0, 0)
+
+
+def zip_central(name, mtime, crc, size, offset):
+    dostime, dosdate = _zip_time(mtime)
+    name = name.encode("utf-8")
+    return ZIP_CENTRAL.pack(b"PK\x01\x02", ZIP_VERSION, 3, ZIP_VERSION, 0, ZIP_FLAGS, 0, dostime, dosdate,
+                            crc, ZIP_MAX, ZIP_MAX, len(name), ZIP_CENTRAL_EXTRA.size, 0, 0, 0,
+                            0o100644 << 16, ZIP_MAX) + name + ZIP_CENTRAL_EXTRA.pack(1, 24, size, size, offset)
+
+
+def zip_end(count, size, offset):
+    return (ZIP64_END.pack(b"PK\x06\x06", ZIP64_END.size - 12, ZIP_VERSION, ZIP_VERSION, 0, 0,
+                           count, count, size, offset)
+            + ZIP64_LOCATOR.pack(b"PK\x06\x07", 0, offset + size, 1)
+            + ZIP_END.pack(b"PK\x05\x06", 0, 0, min(count, 0xFFFF), min(count, 0xFFFF), ZIP_MAX, ZIP_MAX, 0))
+
+
+def tar_header(name, size, mtime):
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = int(mtime)
+    info.mode = 0o644
+    info.uname = info.gname = "root"
+    return info.tobuf(tarfile.GNU_FORMAT)
+
+
+def _padding(size):
+    return -size % tarfile.BLOCKSIZE
+
+
+def archive_length(fmt, sizes, mtime=0):
+    """Bytes of the archive of the members [(name, size)]."""
+    if fmt == "tar":
+        return sum(len(tar_header(name, size, mtime)) + size + _padding(size)
+                   for name, size in sizes) + 2 * tarfile.BLOCKSIZE
+    offset = sum(len(zip_local(name, mtime)) + size + ZIP_DESCRIPTOR.size for name, size in sizes)
+    central = sum(len(zip_central(name, mtime, 0, size, 0)) for name, size in sizes)
+    return offset + central + len(zip_end(len(sizes), central, offset))
+
+
+def byte_range(chunks, start, end=None):
+    """The bytes start to end (included) of chunks."""
+    pos = 0
+    for data in chunks:
+        size = len(data)
+        if pos + size > start:
+            piece = data[max(0, start - pos):size if end is None else end + 1 - pos]
+            if piece:
+                yield piece
+        pos += size
+        if end is not None and pos > end:
+            return
+
+
+class ImageExport(object):
+    """The members of the image of root, made while they are read."""
+
+    def __init__(self, receiver, root, kernel, jobs=None):
+        self.receiver = receiver
+        self.root = root
+        self.kernel = kernel  # see kernel_source
+        self.jobs = jobs or detect_jobs()
+        folder = receiver.folder.strip("/")
+        self.names = [folder + "/" + name for name in (kernel[2], receiver.rootname, MANIFEST)]
+        self.files = {}  # name: (size, sha256) of the members read so far
+
+    def kernel_chunks(self):
+        kind, path, name = self.kernel
+        if kind == "nanddump":
+            return _command_chunks([NANDDUMP, path, "-q"])
+        return _file_chunks(path)
+
+    def rootfs_chunks(self):
+        tar = subprocess.Popen(["tar", "-cf", "-", "-C", self.root, "."], stdout=subprocess.PIPE)
+        blocks = compressed_blocks(tar.stdout, self.jobs)
+        try:
+            for data in blocks:
+                yield data
+        finally:
+            if tar.poll() is None:
+                tar.kill()
+            blocks.close()
+            tar.stdout.close()
+            tar.wait()
+        if tar.returncode != 0:
+            raise ExportError("FAILED", "tar failed")
+
+    def manifest(self, files, mtime):
+        manifest = {
+            "version": 1,
+            "model": self.receiver.model,
+            "created": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(mtime)),
+            "files": dict((name.rsplit("/", 1)[1], {"size": size, ALGORITHM: digest})
+                          for name, (size, digest) in files.items()),
+        }
+        # Like imagemanifest.write_manifest writes it
+        return json.dumps(manifest, indent=1, sort_keys=True, separators=(",", ": ")).encode("utf-8")
+
+    def fingerprint(self):
+        """(hash, time of the newest entry) of the image, the same while nothing changes."""
+        digest = hashlib.sha1(" ".join(self.names).encode("utf-8"))
+        for data in self.kernel_chunks():
+            digest.update(data)
+        newest = 0
+        for path, st in walk(self.root):
+            line = "{0} {1} {2} {3}\n".format(path, st.st_mode, st.st_size, int(st.st_mtime))
+            digest.update(line if isinstance(line, bytes) else line.encode("utf-8", "surrogateescape"))
+            newest = max(newest, int(st.st_mtime))
+        return digest.hexdigest(), newest
+
+    def members(self, mtime):
+        yield self.names[0], self.kernel_chunks()
+        yield self.names[1], self.rootfs_chunks()
+        yield self.names[2], iter([self.manifest(self.files, mtime)])
+
+    def _read(self, name, chunks, size):
+        digest = hashlib.sha256()
+        done = 0
+        for data in chunks:
+            digest.update(data)
+            done += len(data)
+            yield data
+        if size is not None and done != size:
+            raise ExportError("FAILED", "{0} changed while it was exported".format(name))
+        self.files[name] = (done, digest.hexdigest())
+
+    def archive(self, fmt, mtime, sizes=None):
+        """Yield the bytes of the archive, sizes {name: size} of the members is needed for tar."""
+        self.files = {}
+        sizes = dict(sizes or {})
+        if fmt == "tar":
+            for name, chunks in self.members(mtime):
+                if name == self.names[2]:
+                    # Only complete now, its size comes from the bytes
+                    data = self.manifest(self.files, mtime)
+                    chunks = iter([data])
+                    sizes[name] = len(data)
+                yield tar_header(name, sizes[name], mtime)
+                for data in self._read(name, chunks, sizes[name]):
+                    yield data
+                yield b"\0" * _padding(sizes[name])
+            yield b"\0" * (2 * tarfile.BLOCKSIZE)
+            return
+        offset = 0
+        central = []
+        for name, chunks in self.members(mtime):
+            header = zip_local(name, mtime)
+            yield header
+            crc = 0
+            for data in self._read(name, chunks, sizes.get(name)):
+                crc = zlib.crc32(data, crc)
+                yield data
+            crc &= 0xFFFFFFFF
+            size = self.files[name][0]
+            yield ZIP_DESCRIPTOR.pack(b"PK\x07\x08", crc, size, size)
+            central.append(zip_central(name, mtime, crc, size, offset))
+            offset += len(header) + size + ZIP_DESCRIPTOR.size
+        central = b"".join(central)
+        yield central
+        yield zip_end(len(self.names), len(central), offset)
+
+
+def read_sizes(image, path=SIZES):
+    """{name: size} of the members of the last export when it was of image, None otherwise."""
+    try:
+        with open(path, "r") as f:
+            record = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    if not isinstance(record, dict) or record.get("image") != image:
+        return None
+    return record.get("sizes")
+
+
+def write_sizes(image, files, path=SIZES):
+    record = {"image": image, "sizes": dict((name, size) for name, (size, _) in files.items())}
+    tmp = "{0}.{1}.tmp".format(path, os.getpid())
+    with open(tmp, "w") as f:
+        json.dump(record, f, sort_keys=True)
+    os.rename(tmp, path)
+
+
+class Export(object):
+    """The archive of one image in one format, with its ETag and the sizes known so far."""
+
+    def __init__(self, image, fmt):
+        self.image = image
+        self.fmt = fmt
+        self.fingerprint, self.mtime = image.fingerprint()
+        self.etag = '"{0}-{1}"'.format(self.fingerprint, fmt)
+        self.sizes = read_sizes(self.fingerprint)
+
+    def measure(self):
+        """Make the archive once without sending it, for the sizes."""
+        for data in self.image.archive("zip", self.mtime):
+            pass
+        self._keep()
+
+    def length(self):
+        if self.sizes is None:
+            self.measure()
+        return archive_length(self.fmt, [(name, self.sizes[name]) for name in self.image.names], self.mtime)
+
+    def chunks(self, start=0, end=None):
+        if self.fmt == "tar" and self.sizes is None:
+            self.measure()
+        for data in byte_range(self.image.archive(self.fmt, self.mtime, self.sizes), start, end):
+            yield data
+        if start == 0 and end is None:
+            self._keep()
+
+    def _keep(self):
+        self.sizes = dict((name, size) for name, (size, _) in self.image.files.items())
+        write_sizes(self.fingerprint, self.image.files)
+
+
+def parse_range(value, length):
+    """(start, end) of a "bytes=" range header, None when it isn't one range."""
+    match = re.match(r"bytes=(\d*)-(\d*)$", (value or "").strip())
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+    if match.group(1) == "":
+        return max(0, length - int(match.group(2))), length - 1
+    end = int(match.group(2)) if match.group(2) else length - 1
+    return int(match.group(1)), min(end, length - 1)
+
+
+class _Mount(object):
+    """The root file system bind mounted at EXPORT_ROOT, without what is mounted on it."""
+
+    def __enter__(self):
+        if os.path.ismount(EXPORT_ROOT):
+            raise ExportError("BUSY", "another export is running")
+        if not os.path.isdir(EXPORT_ROOT):
+            os.makedirs(EXPORT_ROOT)
+        if subprocess.call(["mount", "--bind", "/", EXPORT_ROOT]) != 0:
+            raise ExportError("PERMISSION", "mount --bind / {0} failed".format(EXPORT_ROOT))
+        return EXPORT_ROOT
+
+    def __exit__(self, *exc):
+        subprocess.call(["umount", EXPORT_ROOT])
+
+
+def open_image(model=None, root=None, kernel=None):
+    model = model or detect_box_type()
+    receiver = get_receiver(model)
+    if receiver is None:
+        raise ExportError("NO_RECEIVER", "{0} is not in the receiver database".format(model))
+    if receiver.rootname != "rootfs.tar.bz2" or os.path.exists(root + DREAMBOX_MARKER):
+        raise ExportError("UNSUPPORTED", "only images with rootfs.tar.bz2 can be streamed")
+    source = ("file", kernel, receiver.kernelname) if kernel else kernel_source(receiver)
+    return ImageExport(receiver, root, source)
+
+
+def _terminated(signum, frame):
+    # The finally clauses unmount and stop tar
+    raise SystemExit(1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="BackupSuite streaming export")
+    sub = parser.add_subparsers(dest="command")
+    for name in ("write", "size", "http"):
+        p = sub.add_parser(name)
+        p.add_argument("--format", choices=FORMATS, default="zip")
+        p.add_argument("--model")
+        p.add_argument("--root")
+        p.add_argument("--kernel")
+        if name == "write":
+            p.add_argument("--offset", type=int, default=0)
+        elif name == "http":
+            p.add_argument("--range", default="")
+            p.add_argument("--if-range", default="")
+        p.set_defaults(sent=False)
+    args = parser.parse_args(argv)
+
+    if args.command not in ("write", "size", "http"):
+        parser.print_usage(sys.stderr)
+        return 2
+    signal.signal(signal.SIGTERM, _terminated)
+    out = getattr(sys.stdout, "buffer", sys.stdout)
+    head = None
+    try:
+        governor.apply(os.getpid())
+        if args.root:
+            return _run(args, out, open_image(args.model, args.root, args.kernel))
+        with _Mount() as root:
+            return _run(args, out, open_image(args.model, root, args.kernel))
+    except ExportError as e:
+        head = {"status": 409 if e.code == "BUSY" else 503, "code": e.code, "message": str(e)}
+        print("[BackupSuite] streamexport: {0}".format(str(e)), file=sys.stderr)
+    except (IOError, OSError) as e:
+        head = {"status": 500, "code": "FAILED", "message": str(e)}
+        print("[BackupSuite] streamexport: {0}".format(str(e)), file=sys.stderr)
+    if args.command == "http" and not args.sent:
+        _head(out, head)
+    return 1
+
+
+def _head(out, head):
+    out.write(json.dumps(head, sort_keys=True).encode("utf-8") + b"\n")
+    out.flush()
+
+
+def _run(args, out, image):
+    export = Export(image, args.format)
+    start, end = 0, None
+    if args.command == "size":
+        print(json.dumps({"etag": export.etag, "length": export.length()}, sort_keys=True))
+        return 0
+    elif args.command == "write":
+        start = args.offset
+    else:
+        wanted = args.range if not args.if_range or args.if_range == export.etag else ""
+        head = {"status": 200, "etag": export.etag, "type": TYPES[args.format],
+                "name": "backupsuite-{0}.{1}".format(image.receiver.model, args.format)}
+        if wanted or args.format == "tar" or export.sizes is not None:
+            length = head["length"] = export.length()
+            span = parse_range(wanted, length) if wanted else None
+            if span is not None:
+                start, end = span
+                if start >= length or start > end:
+                    _head(out, dict(head, status=416))
+                    return 0
+                head.update(status=206, start=start, end=end)
+        _head(out, head)
+        args.sent = True
+    for data in export.chunks(start, end):
+        out.write(data)
+    out.flush()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
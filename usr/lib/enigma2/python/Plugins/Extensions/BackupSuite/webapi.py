@@ -0,0 +1,472 @@
+# -*- coding: utf-8 -*-
+
+"""
+Starting and following backups over HTTP, for many receivers at once.
+
+BackupAPI is a twisted resource. It answers with JSON, a backup goes
+through a job manager (see jobmanager.py) like one started on the screens:
+
+    GET  /targets               the backup targets (see devices.py)
+    GET  /jobs                  all jobs
+    POST /jobs?path=PATH        back up to the target mounted at PATH, the
+                                job waits when another backup runs; lang=
+                                sets the language of the script output,
+                                a code like "de"
+    GET  /jobs/ID               one job, an ended one with the code of
+                                result.py and the metrics of the backup
+    POST /jobs/ID/cancel        cancel a waiting or running job
+    GET  /events                server-sent events: "jobs" when the stream
+                                opens, "job" when a job changes, "progress"
+                                while a backup runs and "result" when it
+                                has ended
+    GET  /export                the image of the box as a zip, made while it
+                                is sent (see streamexport.py); format=tar
+                                for a tar, Range and If-Range to resume
+
+Everything runs in the reactor, a client waiting for events is an open
+request and nothing more. The progress file is read once a second for all
+of them together, and only while a backup runs and someone listens.
+
+In enigma2 the resource is added to OpenWebif as /backupsuite when the
+"webapi" setting is "yes", with the job manager of the screens. Without
+enigma2 it runs on its own with a job manager of its own:
+
+    webapi.py serve [--port PORT] [--interface ADDRESS]
+
+When the "webapi_token" setting is not empty every request needs it, as
+"Authorization: Bearer TOKEN" or token=TOKEN. /export sends the whole rootfs,
+passwords and keys included: serve listens on 127.0.0.1 unless an interface
+is given, and on any other one only with a token. OpenWebif is reachable
+from the network, the API is not added there without a token.
+"""
+
+from __future__ import print_function
+import argparse
+import hmac
+import json
+import os
+import re
+import sys
+import time
+
+PLUGIN_DIR = os.path.dirname(os.path.abspath(__file__))
+# Run as a file the plugin folder comes first on sys.path, its incremental.py
+# would hide the module of that name twisted imports
+if __name__ == "__main__":
+    sys.path = [path for path in sys.path if os.path.abspath(path or ".") != PLUGIN_DIR]
+
+from twisted.internet import reactor, task
+from twisted.internet.error import CannotListenError
+from twisted.internet.protocol import ProcessProtocol
+from twisted.web import resource, server
+
+if __name__ == "__main__":
+    sys.path.insert(0, PLUGIN_DIR)
+
+try:
+    from . import devices, settings
+    from .jobmanager import BackupJob, JobManager
+    from .metrics import read_metrics
+    from .progress import percent, read_status
+    from .result import job_result
+except (ImportError, ValueError, SystemError):
+    import devices
+    import settings
+    from jobmanager import BackupJob, JobManager
+    from metrics import read_metrics
+    from progress import percent, read_status
+    from result import job_result
+
+PORT = 8778
+LOCALHOST = "127.0.0.1"
+PYTHON = "python3" if sys.version_info[0] >= 3 else "python"
+# Seconds between two reads of the progress file and two keep-alive comments
+PROGRESS_INTERVAL = 1.0
+HEARTBEAT_INTERVAL = 15.0
+# lang= goes into the shell command of the backup
+LANGUAGE = re.compile(r"^[a-z]{2}$")
+
+
+def _text(value):
+    return value.decode("utf-8", "replace") if isinstance(value, bytes) else value
+
+
+class _JobProtocol(ProcessProtocol):
+    def __init__(self, manager):
+        self.manager = manager
+
+    def outReceived(self, data):
+        self.manager.dataAvail(data)
+
+    errReceived = outReceived
+
+    def processEnded(self, reason):
+        self.manager.process = None
+        code = getattr(reason.value, "exitCode", None)
+        self.manager.runFinished(-1 if code is None else code)
+
+
+class _ExportProtocol(ProcessProtocol):
+    """Passes the archive of streamexport.py on, as fast as the client takes it."""
+
+    def __init__(self, api, request):
+        self.api = api
+        self.request = request
+        self.head = b""
+        self.sent = False  # the headers
+        self.done = False
+
+    def connectionMade(self):
+        self.request.notifyFinish().addBoth(self._closed)
+
+    def outReceived(self, data):
+        if not self.sent:
+            self.head += data
+            if b"\n" not in self.head:
+                return
+            line, data = self.head.split(b"\n", 1)
+            self.sent = True
+            try:
+                info = json.loads(_text(line))
+            except ValueError:
+                info = {"status": 500, "code": "FAILED"}
+            if not self.api.exportHeaders(self.request, info):
+                self._finish()
+                self._kill()
+                return
+            # The process stops when the client is slow, see pauseProducing
+            self.request.registerProducer(self, True)
+        if data and not self.done:
+            self.request.write(data)
+
+    def errReceived(self, data):
+        sys.stderr.write(_text(data))
+
+    def processEnded(self, reason):
+        self.api.exporter = None
+        code = getattr(reason.value, "exitCode", None)
+        if self.done:
+            return
+        if not self.sent:
+            self.sent = True
+            self.request.setResponseCode(500)
+            self.request.write(self.api._json(self.request, {"code": "FAILED"}))
+        elif code:
+            # Broken off, the client must not take it for the whole archive
+            self.done = True
+            self.request.unregisterProducer()
+            self.request.loseConnection()
+            return
+        self._finish()
+
+    def _finish(self):
+        if not self.done:
+            self.done = True
+            if self.request.producer is not None:
+                self.request.unregisterProducer()
+            self.request.finish()
+
+    def _closed(self, reason):
+        # The client went away before the end
+        if not self.done:
+            self.done = True
+            self._kill()
+
+    def _kill(self):
+        try:
+            self.transport.signalProcess("TERM")
+        except Exception:
+            pass  # ended already
+        # Paused it can hang on a full pipe, closed it gets EPIPE
+        self.transport.loseConnection()
+
+    def pauseProducing(self):
+        self.transport.pauseProducing()
+
+    def resumeProducing(self):
+        self.transport.resumeProducing()
+
+    def stopProducing(self):
+        self._kill()
+
+
+class ProcessJobManager(JobManager):
+    """The job manager without enigma2, the scripts run as processes of the reactor."""
+
+    def __init__(self):
+        self.jobs = []
+        self.current = None
+        self.onChange = []
+        self.onFinished = []
+        self.process = None
+
+    def _execute(self, cmd):
+        try:
+            self.process = reactor.spawnProcess(
+                _JobProtocol(self), "/bin/sh", ["/bin/sh", "-c", cmd], env=dict(os.environ))
+        except OSError as e:
+            print("[BackupSuite] webapi: {0}".format(str(e)), file=sys.stderr)
+            return True
+        return False
+
+    def _pid(self):
+        return self.process.pid
+
+
+def default_command(target, lang):
+    return devices.backup_command(target, lang or "en")
+
+
+class BackupAPI(resource.Resource):
+    isLeaf = True
+
+    def __init__(self, manager, command=default_command, token=None):
+        resource.Resource.__init__(self)
+        self.manager = manager
+        # command(target, lang) is the shell command of a backup to target
+        self.command = command
+        self.token = settings.get("webapi_token") if token is None else token
+        self.listeners = []  # the open event streams
+        self.started = {}  # job: time it started
+        self.results = {}  # job: result record with metrics
+        self.lastStatus = None
+        self.exporter = None  # the running streamexport.py
+        self.progressTimer = task.LoopingCall(self.sendProgress)
+        self.heartbeatTimer = task.LoopingCall(self.sendHeartbeat)
+        manager.onChange.append(self.jobChanged)
+        manager.onFinished.append(self.jobFinished)
+
+    # ---- requests
+
+    def render(self, request):
+        request.setHeader(b"Cache-Control", b"no-cache")
+        if not self.authorized(request):
+            return self._error(request, 401, "UNAUTHORIZED")
+        return resource.Resource.render(self, request)
+
+    def authorized(self, request):
+        if not self.token:
+            return True
+        token = _text(self.token).encode("utf-8")
+        header = _text(request.getHeader(b"authorization") or "")
+        given = [self._arg(request, "token") or "", header[7:] if header.startswith("Bearer ") else ""]
+        # In constant time, the time taken tells nothing about the token
+        return any(hmac.compare_digest(value.encode("utf-8"), token) for value in given if value)
+
+    def render_GET(self, request):
+        path = self._path(request)
+        if path == ["targets"]:
+            return self._json(request, {"targets": devices.targets()})
+        elif path == ["jobs"]:
+            return self._json(request, {"jobs": [self.jobInfo(job) for job in self.manager.jobs]})
+        elif len(path) == 2 and path[0] == "jobs":
+            job = self._job(path[1])
+            if job is None:
+                return self._error(request, 404, "NO_JOB")
+            return self._json(request, self.jobInfo(job))
+        elif path == ["events"]:
+            return self.openStream(request)
+        elif path == ["export"]:
+            return self.startExport(request)
+        return self._error(request, 404, "NOT_FOUND")
+
+    def render_POST(self, request):
+        path = self._path(request)
+        if path == ["jobs"]:
+            return self.startJob(request)
+        elif len(path) == 3 and path[0] == "jobs" and path[2] == "cancel":
+            job = self._job(path[1])
+            if job is None:
+                return self._error(request, 404, "NO_JOB")
+            self.manager.cancel(job)
+            return self._json(request, self.jobInfo(job))
+        return self._error(request, 404, "NOT_FOUND")
+
+    def startJob(self, request):
+        target = devices.find_target(self._arg(request, "path") or "")
+        if target is None:
+            return self._error(request, 404, "NO_TARGET")
+        if not target["script"]:
+            return self._error(request, 404, "NOT_FOUND")
+        try:
+            if not os.path.isdir(target["media"]):
+                os.makedirs(target["media"])
+        except OSError:
+            return self._error(request, 409, "PERMISSION")
+        lang = self._arg(request, "lang")
+        if lang and not LANGUAGE.match(lang):
+            return self._error(request, 400, "LANGUAGE")
+        cmd = self.command(target, lang)
+        job = self.manager.add(BackupJob("{0} Backup".format(target["type"]), cmd, target["media"]))
+        request.setResponseCode(202)
+        return self._json(request, self.jobInfo(job))
+
+    def startExport(self, request):
+        fmt = self._arg(request, "format") or "zip"
+        if fmt not in ("zip", "tar"):
+            return self._error(request, 400, "FORMAT")
+        if self.exporter is not None:
+            return self._error(request, 409, "BUSY")
+        args = [PYTHON, os.path.join(PLUGIN_DIR, "streamexport.py"), "http", "--format", fmt,
+                "--range", _text(request.getHeader(b"range") or ""),
+                "--if-range", _text(request.getHeader(b"if-range") or "")]
+        try:
+            self.exporter = reactor.spawnProcess(
+                _ExportProtocol(self, request), args[0], args, env=dict(os.environ))
+        except OSError as e:
+            print("[BackupSuite] webapi: {0}".format(str(e)), file=sys.stderr)
+            return self._error(request, 500, "FAILED")
+        return server.NOT_DONE_YET
+
+    def exportHeaders(self, request, info):
+        """Set the status and headers streamexport.py asked for, True when the archive follows."""
+        status = info.get("status", 500)
+        request.setResponseCode(status)
+        if "etag" in info:
+            request.setHeader(b"ETag", info["etag"].encode("utf-8"))
+            request.setHeader(b"Accept-Ranges", b"bytes")
+        if status == 416:
+            request.setHeader(b"Content-Range", "bytes */{0}".format(info["length"]).encode("utf-8"))
+        if status not in (200, 206):
+            if "code" in info:
+                request.write(self._json(request, {"code": info["code"], "message": info.get("message", "")}))
+            return False
+        request.setHeader(b"Content-Type", info["type"].encode("utf-8"))
+        request.setHeader(b"Content-Disposition", 'attachment; filename="{0}"'.format(info["name"]).encode("utf-8"))
+        if status == 206:
+            request.setHeader(b"Content-Range", "bytes {0}-{1}/{2}".format(
+                info["start"], info["end"], info["length"]).encode("utf-8"))
+            request.setHeader(b"Content-Length", str(info["end"] - info["start"] + 1).encode("utf-8"))
+        elif "length" in info:
+            request.setHeader(b"Content-Length", str(info["length"]).encode("utf-8"))
+        return request.method != b"HEAD"
+
+    def _path(self, request):
+        return [_text(part) for part in request.postpath if part]
+
+    def _arg(self, request, name):
+        values = request.args.get(name.encode("utf-8")) or request.args.get(name)
+        return _text(values[0]) if values else None
+
+    def _job(self, number):
+        try:
+            return self.manager.jobs[int(number)]
+        except (ValueError, IndexError):
+            return None
+
+    def _json(self, request, data):
+        request.setHeader(b"Content-Type", b"application/json")
+        return json.dumps(data, sort_keys=True).encode("utf-8")
+
+    def _error(self, request, status, code):
+        request.setResponseCode(status)
+        return self._json(request, {"code": code})
+
+    def jobInfo(self, job):
+        info = {
+            "id": self.manager.jobs.index(job),
+            "name": job.name,
+            "status": job.status,
+            "media": job.media,
+            "retval": job.retval,
+        }
+        if job in self.results:
+            info["result"] = self.results[job]
+        return info
+
+    # ---- jobs
+
+    def jobChanged(self, job):
+        if job.status == BackupJob.RUNNING:
+            self.started[job] = time.time()
+        self.broadcast("job", self.jobInfo(job))
+        self._updateTimers()
+
+    def jobFinished(self, job):
+        if job in self.started:
+            if job.status == BackupJob.CANCELLED:
+                record = {"code": "CANCELLED", "phase": "", "command": "", "folder": ""}
+            else:
+                record = job_result(job.retval, self.started[job])
+            record["metrics"] = read_metrics(record["folder"]) if record["folder"] else {}
+            self.results[job] = record
+        self.broadcast("result", self.jobInfo(job))
+
+    # ---- event streams
+
+    def openStream(self, request):
+        request.setHeader(b"Content-Type", b"text/event-stream")
+        request.write(self._event("jobs", {"jobs": [self.jobInfo(job) for job in self.manager.jobs]}))
+        self.listeners.append(request)
+        request.notifyFinish().addBoth(self._streamClosed, request)
+        self._updateTimers()
+        return server.NOT_DONE_YET
+
+    def _streamClosed(self, reason, request):
+        if request in self.listeners:
+            self.listeners.remove(request)
+        self._updateTimers()
+
+    def _event(self, name, data):
+        return "event: {0}\ndata: {1}\n\n".format(name, json.dumps(data, sort_keys=True)).encode("utf-8")
+
+    def broadcast(self, name, data):
+        if not self.listeners:
+            return
+        message = self._event(name, data)
+        for request in self.listeners[:]:
+            request.write(message)
+
+    def sendProgress(self):
+        status = read_status()
+        if status and status != self.lastStatus and self.manager.current is not None:
+            self.lastStatus = status
+            data = dict(status, percent=percent(status), id=self.manager.jobs.index(self.manager.current))
+            self.broadcast("progress", data)
+
+    def sendHeartbeat(self):
+        # A comment, keeps proxies and idle timeouts from closing the stream
+        for request in self.listeners[:]:
+            request.write(b": \n\n")
+
+    def _updateTimers(self):
+        for timer, interval, wanted in (
+                (self.progressTimer, PROGRESS_INTERVAL, self.manager.current is not None),
+                (self.heartbeatTimer, HEARTBEAT_INTERVAL, True)):
+            wanted = wanted and bool(self.listeners)
+            if wanted and not timer.running:
+                timer.start(interval, now=False)
+            elif not wanted and timer.running:
+                timer.stop()
+
+
+def serve(port=PORT, interface=LOCALHOST):
+    api = BackupAPI(ProcessJobManager())
+    if interface not in (LOCALHOST, "::1", "localhost") and not api.token:
+        raise IOError("set webapi_token to listen on {0}".format(interface or "all interfaces"))
+    reactor.listenTCP(port, server.Site(api), interface=interface)
+    print("[BackupSuite] webapi: listening on {0}:{1}".format(interface or "*", port))
+    reactor.run()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="BackupSuite HTTP API")
+    sub = parser.add_subparsers(dest="command")
+    p = sub.add_parser("serve")
+    p.add_argument("--port", type=int, default=PORT)
+    p.add_argument("--interface", default=LOCALHOST)
+    args = parser.parse_args(argv)
+
+    if args.command != "serve":
+        parser.print_usage(sys.stderr)
+        return 2
+    try:
+        serve(args.port, args.interface)
+    except (IOError, OSError, CannotListenError) as e:
+        print("[BackupSuite] webapi: {0}".format(str(e)), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+
+"""
+Build the imagebackups ZIP without a second compression pass.
+
+The members of a backup are already compressed (rootfs.tar.bz2, the kernel,
+UBIFS images), deflating them again costs minutes of CPU for nothing. They
+are stored as they are, only the small text files are deflated.
+
+    zipstore.py tee ZIP ARCNAME [DIGESTS NAME]
+        Copy stdin to stdout and store the same bytes as ARCNAME in ZIP while
+        the archive is being produced. If the ZIP can't be written the member
+        is dropped and the copy to stdout carries on, the add step below then
+        picks the file up from disk. With DIGESTS the sha256 of the data is
+        appended to it as NAME, see imagemanifest.py.
+
+    zipstore.py add ZIP SRCDIR ARCPREFIX
+        Add every file of SRCDIR as ARCPREFIX/<relative path>, files already
+        in ZIP (streamed by tee) are skipped.
+"""
+
+from __future__ import print_function
+import hashlib
+import os
+import sys
+import time
+import zipfile
+import zlib
+
+BUFSIZE = 1024 * 1024
+# Never worth deflating
+STORED_EXTENSIONS = (
+    ".bz2", ".xz", ".gz", ".tgz", ".lzma", ".lzo", ".zst", ".zip",
+    ".ubi", ".ubifs", ".nfi", ".jffs2", ".squashfs",
+)
+# Files smaller than this are deflated without looking at them
+SAMPLE_MIN = 64 * 1024
+SAMPLE_SIZE = 256 * 1024
+# Store when deflate saves less than 10% on the sample
+STORE_RATIO = 0.9
+
+
+def choose_compression(path):
+    """ZIP_STORED for data that is already compressed, ZIP_DEFLATED otherwise."""
+    if path.lower().endswith(STORED_EXTENSIONS):
+        return zipfile.ZIP_STORED
+    size = os.path.getsize(path)
+    if size < SAMPLE_MIN:
+        return zipfile.ZIP_DEFLATED
+    with open(path, "rb") as f:
+        sample = f.read(SAMPLE_SIZE)
+    if len(zlib.compress(sample, 1)) > len(sample) * STORE_RATIO:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def can_stream():
+    """ZipFile.open() for writing arrived with python 3.6"""
+    return sys.version_info >= (3, 6)
+
+
+def tee(zippath, arcname, infile, outfile, digest=None):
+    """Copy infile to outfile, storing the bytes as arcname in zippath on the way.
+
+    digest (a hashlib object) is fed with the data as well.
+    Returns True when the member made it into the ZIP.
+    """
+    archive = member = None
+    if can_stream():
+        try:
+            archive = zipfile.ZipFile(zippath, "a", zipfile.ZIP_STORED)
+            info = zipfile.ZipInfo(arcname, time.localtime()[:6])
+            info.compress_type = zipfile.ZIP_STORED
+            info.external_attr = 0o644 << 16
+            member = archive.open(info, "w")
+        except Exception as e:
+            print("[BackupSuite] zipstore: {0}".format(str(e)), file=sys.stderr)
+            archive = member = None
+    while True:
+        data = infile.read(BUFSIZE)
+        if not data:
+            break
+        outfile.write(data)
+        if digest is not None:
+            digest.update(data)
+        if member is not None:
+            try:
+                member.write(data)
+            except Exception as e:
+                # Typically the 2GB limit of a non zip64 entry
+                print("[BackupSuite] zipstore: {0}, member dropped".format(str(e)), file=sys.stderr)
+                member = None
+                archive = None
+                remove(zippath)
+    outfile.flush()
+    if member is None:
+        return False
+    try:
+        member.close()
+        archive.close()
+    except Exception as e:
+        print("[BackupSuite] zipstore: {0}, member dropped".format(str(e)), file=sys.stderr)
+        remove(zippath)
+        return False
+    return True
+
+
+def add_tree(zippath, srcdir, prefix):
+    """Add the files of srcdir under prefix, returns the number of members added."""
+    added = 0
+    prefix = prefix.strip("/")
+    archive = zipfile.ZipFile(zippath, "a", zipfile.ZIP_DEFLATED, allowZip64=True)
+    try:
+        present = set(archive.namelist())
+        for root, dirs, files in os.walk(srcdir):
+            dirs.sort()
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                arcname = os.path.relpath(path, srcdir).replace(os.sep, "/")
+                if prefix:
+                    arcname = prefix + "/" + arcname
+                if arcname in present:
+                    continue
+                archive.write(path, arcname, choose_compression(path))
+                added += 1
+    finally:
+        archive.close()
+    return added
+
+
+def remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) in (3, 5) and argv[0] == "tee":
+        stdin = getattr(sys.stdin, "buffer", sys.stdin)
+        stdout = getattr(sys.stdout, "buffer", sys.stdout)
+        digest = hashlib.sha256() if len(argv) == 5 else None
+        try:
+            tee(argv[1], argv[2], stdin, stdout, digest)
+            if digest is not None:
+                with open(argv[3], "a") as f:
+                    f.write("{0}  {1}\n".format(digest.hexdigest(), argv[4]))
+        except (IOError, OSError) as e:
+            print("[BackupSuite] zipstore: {0}".format(str(e)), file=sys.stderr)
+            return 1
+        return 0
+    if len(argv) == 4 and argv[0] == "add":
+        try:
+            added = add_tree(argv[1], argv[2], argv[3])
+        except (IOError, OSError, zipfile.BadZipfile) as e:
+            print("[BackupSuite] zipstore: {0}".format(str(e)), file=sys.stderr)
+            return 1
+        print("{0}: {1} files added".format(argv[1], added))
+        return 0
+    print("Usage: zipstore.py tee ZIP ARCNAME [DIGESTS NAME] | add ZIP SRCDIR ARCPREFIX", file=sys.stderr)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())